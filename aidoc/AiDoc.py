@@ -4,19 +4,26 @@ import json
 import time
 import os
 import base64
+import gzip
+import hashlib
+import importlib.util
+import re
+import shutil
+import tempfile
+import queue
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache, partial
 from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from urllib.parse import urlsplit
 import traceback
-import requests
-import psutil
-from axe_selenium_python import Axe
 import html
 
+# Selenium, axe, requests, psutil, numpy, asyncio and the process pool are
+# imported inside the functions that use them, so `--help`, report queries and
+# runs without a feature flag don't pay for loading them
+
 # ANSI Color codes
 class Colors:
     HEADER = '\033[95m'
@@ -49,56 +56,911 @@ class ErrorCategory:
     DOM = 'DOM'
     OTHER = 'Other'
 
-    @staticmethod
-    def categorize(error_message):
+    # Ordered rule table: the first category with a matching term wins
+    DEFAULT_RULES = [
+        (AUTHENTICATION, ['login', 'auth', 'credential', 'permission']),
+        (NETWORK, ['net::', 'failed to load', 'network', 'fetch']),
+        (JAVASCRIPT, ['undefined', 'null', 'cannot read property', 'is not a function']),
+        (RESOURCE, ['404', 'resource', 'not found', 'failed to load resource']),
+        (DOM, ['querySelector', 'element', 'node', 'document']),
+    ]
+
+    # Distinct messages remembered before the cache is reset
+    CACHE_SIZE = 16384
+
+    _rules = list(DEFAULT_RULES)
+    _terms = None
+    _cache = {}
+
+    @classmethod
+    def compile(cls):
+        """Flatten the rule table into lowercased (term, category) pairs in priority order"""
+        cls._terms = tuple((term.lower(), category) for category, terms in cls._rules for term in terms)
+        cls._cache = {}
+        return cls._terms
+
+    @classmethod
+    def configure(cls, rules, replace=False):
+        """Install extra rules, checked before the defaults unless replace is set
+
+        rules is a mapping or list of (category, terms) pairs, in priority order.
+        """
+        rules = list(rules.items()) if isinstance(rules, dict) else [tuple(rule) for rule in rules]
+        cls._rules = rules if replace else rules + list(cls.DEFAULT_RULES)
+        cls.compile()
+
+    @classmethod
+    def load_rules(cls, path):
+        """Load rules from a JSON file: {"replace": false, "rules": {"Category": ["term", ...]}}"""
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        if 'rules' not in config:
+            config = {'rules': config}
+        cls.configure(config['rules'], replace=config.get('replace', False))
+
+    @classmethod
+    def reset(cls):
+        """Restore the built-in rule table"""
+        cls._rules = list(cls.DEFAULT_RULES)
+        cls.compile()
+
+    @classmethod
+    def categorize(cls, error_message):
+        category = cls._cache.get(error_message)
+        if category is not None:
+            return category
+
+        terms = cls._terms or cls.compile()
         message = error_message.lower()
-        if any(term in message for term in ['login', 'auth', 'credential', 'permission']):
-            return ErrorCategory.AUTHENTICATION
-        elif any(term in message for term in ['net::', 'failed to load', 'network', 'fetch']):
-            return ErrorCategory.NETWORK
-        elif any(term in message for term in ['undefined', 'null', 'cannot read property', 'is not a function']):
-            return ErrorCategory.JAVASCRIPT
-        elif any(term in message for term in ['404', 'resource', 'not found', 'failed to load resource']):
-            return ErrorCategory.RESOURCE
-        elif any(term in message for term in ['querySelector', 'element', 'node', 'document']):
-            return ErrorCategory.DOM
-        return ErrorCategory.OTHER
+        category = cls.OTHER
+        # Plain substring scans beat a combined alternation regex in CPython's re
+        for term, term_category in terms:
+            if term in message:
+                category = term_category
+                break
+
+        if len(cls._cache) >= cls.CACHE_SIZE:
+            cls._cache = {}
+        cls._cache[error_message] = category
+        return category
+
+# Patterns that vary between occurrences of the same underlying error
+# Keeps host and path so different scripts stay distinct, drops query strings and fragments
+URL_PATTERN = re.compile(r'\b(?:https?|wss?|file)://([^\s\'"()<>?#]*)[^\s\'"()<>]*')
+UUID_PATTERN = re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b', re.IGNORECASE)
+HEX_ID_PATTERN = re.compile(r'\b(?=[0-9a-f]*\d)[0-9a-f]{8,}\b', re.IGNORECASE)
+LINE_COL_PATTERN = re.compile(r'(?<![\w.])\d+:\d+\b')
+# Short numbers such as HTTP status codes are kept; ids, counters and timestamps are not
+NUMBER_PATTERN = re.compile(r'\d+\.\d+|\d{4,}')
+
+def normalize_message(message):
+    """Strip the volatile parts of a console message: URLs' queries, line/col, ids and numbers"""
+    normalized = URL_PATTERN.sub(r'\1', message)
+    normalized = UUID_PATTERN.sub('<uuid>', normalized)
+    normalized = HEX_ID_PATTERN.sub('<id>', normalized)
+    normalized = LINE_COL_PATTERN.sub('<line>:<col>', normalized)
+    return NUMBER_PATTERN.sub('<n>', normalized)
+
+@lru_cache(maxsize=ErrorCategory.CACHE_SIZE)
+def fingerprint_message(message):
+    """Return (fingerprint, normalized message) for grouping repeated errors"""
+    normalized = normalize_message(message)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12], normalized
 
 class ConsoleLogHandler:
-    def __init__(self):
-        self.logs = []
+    # Ring buffer size used in streaming mode when no explicit cap is given
+    DEFAULT_BUFFER_SIZE = 1000
+
+    def __init__(self, max_entries=None, sink=None, page_url=None, dedupe=False):
+        """Collect console entries, optionally streaming them to an NDJSON sink
+
+        With max_entries or sink set, only the most recent entries are kept in
+        memory; summary counters always cover every entry seen. With dedupe set,
+        errors are fingerprinted and the formatted report shows one block per
+        fingerprint.
+        """
+        self.streaming = bool(max_entries or sink)
+        self.logs = deque(maxlen=max_entries or self.DEFAULT_BUFFER_SIZE) if self.streaming else []
+        self.sink_path = sink
+        self.page_url = page_url
+        self.dedupe = dedupe
+        self.error_groups = {}
         self.error_categories = {}
+        self.level_counts = {}
+        self.total_count = 0
+        self._sink = None
         
     def add_log(self, log_entry):
-        self.logs.append(log_entry)
-        if log_entry.get('level') in ['SEVERE', 'ERROR', 'WARNING']:
+        self.total_count += 1
+        level = log_entry.get('level')
+        self.level_counts[level] = self.level_counts.get(level, 0) + 1
+        if level in ['SEVERE', 'ERROR', 'WARNING']:
             category = ErrorCategory.categorize(log_entry.get('message', ''))
+            log_entry['category'] = category
             self.error_categories[category] = self.error_categories.get(category, 0) + 1
-        
-    def get_formatted_logs(self):
-        formatted = []
-        for log in self.logs:
+            if self.dedupe:
+                self._group(log_entry, category)
+        self.logs.append(log_entry)
+        if self.sink_path:
+            self._write_sink(log_entry)
+
+    def _group(self, log_entry, category):
+        fingerprint, normalized = fingerprint_message(log_entry.get('message', ''))
+        log_entry['fingerprint'] = fingerprint
+        timestamp = log_entry.get('timestamp')
+        group = self.error_groups.get(fingerprint)
+        if group is None:
+            self.error_groups[fingerprint] = {
+                'fingerprint': fingerprint,
+                'normalized': normalized,
+                'category': category,
+                'level': log_entry.get('level'),
+                'count': 1,
+                'first_seen': timestamp,
+                'last_seen': timestamp,
+                'sample': dict(log_entry)
+            }
+            return
+        group['count'] += 1
+        group['last_seen'] = timestamp
+        if log_entry.get('level') in ['SEVERE', 'ERROR']:
+            group['level'] = log_entry.get('level')
+
+    def _write_sink(self, log_entry):
+        if self._sink is None:
+            sink_dir = os.path.dirname(self.sink_path)
+            if sink_dir:
+                os.makedirs(sink_dir, exist_ok=True)
+            # Unbuffered appends keep each line a single write, so concurrent pages never interleave
+            self._sink = open(self.sink_path, 'ab', buffering=0)
+        if self.page_url:
+            log_entry = dict(log_entry, page_url=self.page_url)
+        self._sink.write((json.dumps(log_entry, default=str) + '\n').encode('utf-8'))
+
+    @property
+    def dropped_count(self):
+        """Entries no longer held in memory because the ring buffer wrapped"""
+        return self.total_count - len(self.logs)
+
+    def close(self):
+        """Close the NDJSON sink, if one was opened"""
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+
+    def iter_formatted_logs(self):
+        """Yield the formatted report line by line instead of building one string"""
+        produced = False
+        if self.dropped_count and not self.dedupe:
+            produced = True
+            destination = f" (full log in {self.sink_path})" if self.sink_path else ""
+            yield f"{Colors.YELLOW}{self.dropped_count} older entries not shown{destination}{Colors.ENDC}"
+
+        if self.dedupe:
+            for line in self._iter_formatted_groups():
+                produced = True
+                yield line
+
+        for log in ([] if self.dedupe else self.logs):
             level = log.get('level', 'INFO')
             message = log.get('message', '')
             source = log.get('source', '')
             timestamp = log.get('timestamp', '')
             
             if level in ['SEVERE', 'ERROR', 'WARNING']:
-                category = ErrorCategory.categorize(message)
-                formatted.append(f"\n{Colors.YELLOW}{'='*80}{Colors.ENDC}")
-                formatted.append(f"{Colors.BOLD}LEVEL:{Colors.ENDC} {Colors.RED if level in ['SEVERE', 'ERROR'] else Colors.YELLOW}{level}{Colors.ENDC}")
-                formatted.append(f"{Colors.BOLD}CATEGORY:{Colors.ENDC} {Colors.CYAN}{category}{Colors.ENDC}")
-                formatted.append(f"{Colors.BOLD}SOURCE:{Colors.ENDC} {Colors.BLUE}{source}{Colors.ENDC}")
-                formatted.append(f"{Colors.BOLD}TIMESTAMP:{Colors.ENDC} {datetime.fromtimestamp(timestamp/1000).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}")
-                formatted.append(f"{Colors.BOLD}MESSAGE:{Colors.ENDC} {message}")
-                formatted.append(f"{Colors.YELLOW}{'='*80}{Colors.ENDC}")
+                produced = True
+                category = log.get('category') or ErrorCategory.categorize(message)
+                yield f"\n{Colors.YELLOW}{'='*80}{Colors.ENDC}"
+                yield f"{Colors.BOLD}LEVEL:{Colors.ENDC} {Colors.RED if level in ['SEVERE', 'ERROR'] else Colors.YELLOW}{level}{Colors.ENDC}"
+                yield f"{Colors.BOLD}CATEGORY:{Colors.ENDC} {Colors.CYAN}{category}{Colors.ENDC}"
+                yield f"{Colors.BOLD}SOURCE:{Colors.ENDC} {Colors.BLUE}{source}{Colors.ENDC}"
+                yield f"{Colors.BOLD}TIMESTAMP:{Colors.ENDC} {datetime.fromtimestamp(timestamp/1000).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}"
+                yield f"{Colors.BOLD}MESSAGE:{Colors.ENDC} {message}"
+                yield f"{Colors.YELLOW}{'='*80}{Colors.ENDC}"
         
         if self.error_categories:
-            formatted.append(f"\n{Colors.BOLD}Error Summary by Category:{Colors.ENDC}")
+            produced = True
+            yield f"\n{Colors.BOLD}Error Summary by Category:{Colors.ENDC}"
             for category, count in self.error_categories.items():
-                formatted.append(f"{Colors.CYAN}{category}:{Colors.ENDC} {count} error(s)")
+                yield f"{Colors.CYAN}{category}:{Colors.ENDC} {count} error(s)"
+
+        if not produced:
+            yield f"{Colors.GREEN}No significant console logs found.{Colors.ENDC}"
         
-        return '\n'.join(formatted) if formatted else f"{Colors.GREEN}No significant console logs found.{Colors.ENDC}"
+    def _iter_formatted_groups(self):
+        """Yield one block per distinct error, most frequent first"""
+        groups = sorted(self.error_groups.values(), key=lambda g: g['count'], reverse=True)
+        for group in groups:
+            level = group['level']
+            sample = group['sample']
+            yield f"\n{Colors.YELLOW}{'='*80}{Colors.ENDC}"
+            yield f"{Colors.BOLD}LEVEL:{Colors.ENDC} {Colors.RED if level in ['SEVERE', 'ERROR'] else Colors.YELLOW}{level}{Colors.ENDC}"
+            yield f"{Colors.BOLD}CATEGORY:{Colors.ENDC} {Colors.CYAN}{group['category']}{Colors.ENDC}"
+            yield f"{Colors.BOLD}OCCURRENCES:{Colors.ENDC} {group['count']}"
+            yield f"{Colors.BOLD}SOURCE:{Colors.ENDC} {Colors.BLUE}{sample.get('source', '')}{Colors.ENDC}"
+            if isinstance(group['first_seen'], (int, float)):
+                yield f"{Colors.BOLD}FIRST SEEN:{Colors.ENDC} {datetime.fromtimestamp(group['first_seen']/1000).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}"
+                yield f"{Colors.BOLD}LAST SEEN:{Colors.ENDC} {datetime.fromtimestamp(group['last_seen']/1000).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}"
+            yield f"{Colors.BOLD}MESSAGE:{Colors.ENDC} {sample.get('message', '')}"
+            yield f"{Colors.YELLOW}{'='*80}{Colors.ENDC}"
+
+    def get_formatted_logs(self):
+        return '\n'.join(self.iter_formatted_logs())
+
+SECURITY_HEADERS = [
+    'Strict-Transport-Security',
+    'Content-Security-Policy',
+    'X-Frame-Options',
+    'X-Content-Type-Options',
+    'X-XSS-Protection'
+]
+
+def select_security_headers(headers):
+    """Pick the security headers out of a response header mapping, case-insensitively"""
+    headers = {name.lower(): value for name, value in (headers or {}).items()}
+    return {name: headers.get(name.lower(), 'Not Set') for name in SECURITY_HEADERS}
+
+def extract_document_headers(performance_log, url=None):
+    """Find the main document's response headers in a Chrome performance log
+
+    Returns the headers of the document response matching url, or of the
+    first document response when none matches, or None.
+    """
+    first = None
+    for entry in performance_log or []:
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, TypeError, ValueError):
+            continue
+        if message.get('method') != 'Network.responseReceived':
+            continue
+        params = message.get('params', {})
+        if params.get('type') != 'Document':
+            continue
+        response = params.get('response', {})
+        if url and response.get('url') == url:
+            return response.get('headers', {})
+        if first is None:
+            first = response.get('headers', {})
+    return first
+
+class SecurityHeaderFetcher:
+    """Fallback header lookups over pooled sessions, cached per origin"""
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        self.cache = {}
+        self._local = threading.local()
+
+    def _session(self):
+        # requests.Session is not guaranteed thread-safe, so each thread keeps its own
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        return session
+
+    def fetch(self, url, cookies=None):
+        """Return response headers for url, trying HEAD before GET"""
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        headers = self.cache.get(origin)
+        if headers is not None:
+            return headers
+
+        session = self._session()
+        response = session.head(url, timeout=self.timeout, allow_redirects=True, cookies=cookies)
+        if response.status_code in (403, 405, 501):
+            # Some servers reject HEAD; fetch headers only and skip the body
+            response = session.get(url, timeout=self.timeout, cookies=cookies, stream=True)
+            response.close()
+        headers = response.headers
+        self.cache[origin] = headers
+        return headers
+
+default_header_fetcher = SecurityHeaderFetcher()
+
+# Hashes the accessibility-relevant shape of the DOM: tags, nesting, roles,
+# ARIA state and which elements carry text, but not the text itself, so pages
+# rendered from the same template share a hash
+# Styling attributes and inline styles are part of the hash, as color contrast results depend on them
+DOM_STRUCTURE_SCRIPT = """
+    const valued = /^(role|aria-|type|lang|scope|tabindex|class|style)/;
+    const named = /^(alt|title|for|href|headers|name|label|id)$/;
+    let h1 = 0x811c9dc5, h2 = 0x01000193, count = 0;
+    function feed(text) {
+        for (let i = 0; i < text.length; i++) {
+            const c = text.charCodeAt(i);
+            h1 = Math.imul(h1 ^ c, 0x01000193);
+            h2 = Math.imul(h2 ^ c, 0x5bd1e995);
+        }
+    }
+    function walk(element, depth) {
+        count += 1;
+        let signature = depth + element.tagName;
+        for (const attr of element.attributes) {
+            if (valued.test(attr.name)) { signature += ' ' + attr.name + '=' + attr.value; }
+            else if (named.test(attr.name)) { signature += ' ' + attr.name; }
+        }
+        if (element.tagName === 'LINK') { signature += ' href=' + element.getAttribute('href'); }
+        for (const child of element.childNodes) {
+            if (child.nodeType === 3 && child.nodeValue.trim()) { signature += '#t'; break; }
+        }
+        feed(signature + '|');
+        if (element.tagName === 'STYLE') { feed(element.textContent); }
+        for (const child of element.children) { walk(child, depth + 1); }
+    }
+    if (document.documentElement) { walk(document.documentElement, 0); }
+    return {
+        hash: (h1 >>> 0).toString(16) + (h2 >>> 0).toString(16),
+        elements: count,
+        origin: location.origin
+    };
+"""
+
+# axe runs in the top frame only, so it must not wait for frames it was never injected into
+AXE_RUN_SCRIPT = """
+    const callback = arguments[arguments.length - 1];
+    window.__aidocAxe.run(arguments[0] || document, Object.assign({iframes: false}, arguments[1] || {}))
+        .then(results => callback(results))
+        .catch(error => callback({error: String(error)}));
+"""
+
+# Loads axe under a private global. The bundle assigns the global axe and
+# registers with AMD/CommonJS loaders, so those names are shadowed and the
+# page's own window.axe is put back.
+AXE_INJECT_TEMPLATE = """
+if (window.__aidocAxe) { return; }
+const hadAxe = Object.prototype.hasOwnProperty.call(window, 'axe');
+const pageAxe = window.axe;
+window.__aidocAxe = (function() {
+    var axe, define, module;
+    __AXE_SOURCE__
+    return window.axe;
+})();
+if (hadAxe) { window.axe = pageAxe; } else { delete window.axe; }
+"""
+
+_axe_source = None
+_axe_inject_script = None
+
+def load_axe_source():
+    """Read the bundled axe-core script once per process"""
+    global _axe_source
+    if _axe_source is None:
+        from axe_selenium_python import Axe
+        with open(Axe(None).script_url, 'r', encoding='utf-8') as f:
+            _axe_source = f.read()
+    return _axe_source
+
+def axe_inject_script():
+    """The axe source wrapped to load under window.__aidocAxe, built once per process"""
+    global _axe_inject_script
+    if _axe_inject_script is None:
+        _axe_inject_script = AXE_INJECT_TEMPLATE.replace('__AXE_SOURCE__', load_axe_source())
+    return _axe_inject_script
+
+def axe_version():
+    """Short digest of the bundled axe source, so cached results follow axe upgrades"""
+    return hashlib.sha1(load_axe_source().encode('utf-8')).hexdigest()[:12]
+
+class AccessibilityCache:
+    """LRU cache of axe results keyed by origin, DOM structure hash and scan scope"""
+
+    def __init__(self, max_entries=1024, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._new = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            results = self._entries.get(key)
+            if results is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return results
+
+    def put(self, key, results):
+        with self._lock:
+            self._entries[key] = results
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self._new is not None:
+                self._new.append((key, results))
+
+    def record_new(self):
+        """Remember entries added from now on, for drain_new"""
+        with self._lock:
+            self._new = []
+
+    def drain_new(self):
+        """Return and forget the entries added since the last drain"""
+        with self._lock:
+            entries = self._new or []
+            if self._new is not None:
+                self._new = []
+        return entries
+
+    def load(self, path=None):
+        """Load cached results from a JSON file, if it exists"""
+        self.path = path or self.path
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        with self._lock:
+            self._entries = OrderedDict(entries)
+
+    def save(self, path=None):
+        """Persist cached results so later runs can reuse them"""
+        path = path or self.path
+        if not path:
+            return
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._lock:
+            entries = list(self._entries.items())
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+
+default_accessibility_cache = AccessibilityCache()
+
+class AccessibilityScanner:
+    """Runs axe-core once per distinct page template, optionally scoped to parts of the page"""
+
+    def __init__(self, driver, cache=None, include=None, exclude=None, rules=None, tags=None):
+        self.driver = driver
+        self.cache = cache
+        self.context = None
+        if include or exclude:
+            self.context = {
+                'include': [[selector] for selector in include] if include else [['html']],
+                'exclude': [[selector] for selector in exclude or []]
+            }
+        self.options = {}
+        if rules:
+            self.options['runOnly'] = {'type': 'rule', 'values': list(rules)}
+        elif tags:
+            self.options['runOnly'] = {'type': 'tag', 'values': list(tags)}
+
+    def cache_key(self, structure):
+        scope = json.dumps({'context': self.context, 'options': self.options}, sort_keys=True)
+        return f"{structure['origin']}|{structure['hash']}|{axe_version()}|{scope}"
+
+    def run(self):
+        """Return axe results for the current page, reusing cached results for known templates
+
+        axe is injected into the top frame only when a page actually needs a
+        scan, after the load metrics were taken, so it never adds to them.
+        """
+        structure = self.driver.execute_script(DOM_STRUCTURE_SCRIPT)
+        if not isinstance(structure, dict):
+            structure = {'hash': None, 'origin': None}
+
+        key = self.cache_key(structure) if self.cache is not None and structure['hash'] else None
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return dict(cached, url=self.driver.current_url, cached=True)
+
+        self.driver.execute_script(axe_inject_script())
+        results = self.driver.execute_async_script(AXE_RUN_SCRIPT, self.context, self.options)
+        if not isinstance(results, dict) or 'error' in results:
+            raise RuntimeError(f"axe-core failed: {(results or {}).get('error')}")
+        results['structure_hash'] = structure['hash']
+        if key:
+            self.cache.put(key, results)
+        return results
+
+SCREENSHOT_EXTENSIONS = {'png': 'png', 'jpeg': 'jpg', 'webp': 'webp'}
+
+def encode_screenshot(png_bytes, image_format='png', quality=80, max_width=None):
+    """Downscale and re-encode PNG screenshot bytes with Pillow"""
+    from PIL import Image
+    import io
+
+    image = Image.open(io.BytesIO(png_bytes))
+    if max_width and image.width > max_width:
+        height = max(1, round(image.height * max_width / image.width))
+        image = image.resize((max_width, height), Image.LANCZOS)
+    if image_format == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, format=image_format.upper(), quality=quality, optimize=True)
+    return output.getvalue()
+
+class ScreenshotWriter:
+    """Decodes, compresses and writes screenshots on background threads
+
+    Files are named after a hash of the image content, so identical screenshots
+    are stored once and concurrent captures never collide.
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._executor = None
+        self._futures = []
+        self._submitted = set()
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def submit(self, png_base64, directory, image_format='png', quality=80, max_width=None):
+        """Queue a base64 PNG for writing and return the file name it will have"""
+        if image_format not in SCREENSHOT_EXTENSIONS:
+            raise ValueError(f"Unsupported screenshot format: {image_format}")
+        if (image_format != 'png' or max_width) and importlib.util.find_spec('PIL') is None:
+            if not self._warned:
+                print(f"{Colors.YELLOW}Pillow is not installed; saving screenshots as full-size PNG{Colors.ENDC}")
+                self._warned = True
+            image_format, max_width = 'png', None
+
+        digest = hashlib.sha256(png_base64.encode('ascii')).hexdigest()[:24]
+        variant = f"_w{max_width}" if max_width else ""
+        if image_format != 'png':
+            variant += f"_q{quality}"
+        filename = f"{directory}/{digest}{variant}.{SCREENSHOT_EXTENSIONS[image_format]}"
+
+        with self._lock:
+            if filename in self._submitted:
+                return filename
+            self._submitted.add(filename)
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='aidoc-screenshots')
+            self._futures.append(self._executor.submit(
+                self._write, png_base64, filename, image_format, quality, max_width))
+        return filename
+
+    def _write(self, png_base64, filename, image_format, quality, max_width):
+        if os.path.exists(filename):
+            return filename
+        data = base64.b64decode(png_base64)
+        if image_format != 'png' or max_width:
+            data = encode_screenshot(data, image_format, quality, max_width)
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        # Write under a temporary name so readers never see a partial file
+        temp_name = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_name, 'wb') as f:
+            f.write(data)
+        os.replace(temp_name, filename)
+        return filename
+
+    def wait(self):
+        """Block until every queued screenshot is on disk"""
+        with self._lock:
+            futures, self._futures = self._futures, []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"{Colors.RED}Failed to write screenshot: {str(e)}{Colors.ENDC}")
+
+default_screenshot_writer = ScreenshotWriter()
+
+def _load_visual_modules():
+    """Import numpy and Pillow, which visual regression needs"""
+    try:
+        import numpy
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError("Visual regression needs numpy and Pillow (pip install aidoc[visual])")
+    return numpy, Image
+
+def perceptual_hash(image, hash_size=8):
+    """Return a 64-bit DCT perceptual hash of a Pillow image as a hex string"""
+    np, Image = _load_visual_modules()
+    size = hash_size * 4
+    # reducing_gap shrinks large screenshots cheaply before the final resample
+    pixels = np.asarray(image.convert('L').resize((size, size), Image.BILINEAR, reducing_gap=2.0),
+                        dtype=np.float64)
+    k = np.arange(size)
+    dct = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * size))
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    bits = (low > np.median(low)).flatten()
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):0{hash_size * hash_size // 4}x}"
+
+def hash_distance(first, second):
+    """Number of differing bits between two perceptual hashes"""
+    return bin(int(first, 16) ^ int(second, 16)).count('1')
+
+def diff_images(baseline, current, pixel_threshold=16, tile_size=32, strip_height=512):
+    """Compare two Pillow images strip by strip and return change statistics and a mask
+
+    Only one strip of each image is converted to a numpy array at a time, and
+    the mask has one pixel per tile, so the diff adds little to the decoded
+    images themselves; capture_full_page_png bounds those. Pixels outside the
+    common area of differently sized images count as changed.
+    """
+    np, Image = _load_visual_modules()
+    width, height = max(baseline.width, current.width), max(baseline.height, current.height)
+    common_width = min(baseline.width, current.width)
+    common_height = min(baseline.height, current.height)
+    strip_height = max(tile_size, strip_height // tile_size * tile_size)
+
+    tiles = np.zeros((-(-height // tile_size), -(-width // tile_size)), dtype=bool)
+    changed = width * height - common_width * common_height
+    if common_width < width:
+        tiles[:, common_width // tile_size:] = True
+    if common_height < height:
+        tiles[common_height // tile_size:, :] = True
+
+    padded_width = tiles.shape[1] * tile_size
+    for top in range(0, common_height, strip_height):
+        box = (0, top, common_width, min(top + strip_height, common_height))
+        before = np.asarray(baseline.crop(box).convert('RGB'), dtype=np.int16)
+        after = np.asarray(current.crop(box).convert('RGB'), dtype=np.int16)
+        strip = np.abs(before - after).max(axis=2) > pixel_threshold
+        count = int(strip.sum())
+        if not count:
+            continue
+        changed += count
+        padded = np.zeros((strip.shape[0], padded_width), dtype=bool)
+        padded[:, :common_width] = strip
+        row_tiles = padded.reshape(strip.shape[0], -1, tile_size).any(axis=2)
+        rows = np.arange(top, top + strip.shape[0]) // tile_size
+        np.logical_or.at(tiles, rows, row_tiles)
+
+    return {
+        'width': width,
+        'height': height,
+        'changed_pixels': changed,
+        'changed_percent': round(changed * 100 / (width * height), 3),
+        'changed_tiles': int(tiles.sum()),
+        'total_tiles': int(tiles.size),
+        'tile_size': tile_size,
+        'mask': Image.fromarray(tiles.astype(np.uint8) * 255) if changed else None
+    }
+
+# Taller pages are captured at a reduced scale, so each decoded screenshot
+# holds at most this many pixels
+MAX_CAPTURE_PIXELS = 8 * 1024 * 1024
+
+def capture_full_page_png(driver, max_pixels=MAX_CAPTURE_PIXELS):
+    """Capture the whole page, not just the viewport, as PNG bytes
+
+    captureBeyondViewport alone still captures the viewport only, so the clip
+    is sized to the content from Page.getLayoutMetrics.
+    """
+    metrics = driver.execute_cdp_cmd('Page.getLayoutMetrics', {})
+    content = metrics.get('cssContentSize') or metrics['contentSize']
+    width, height = max(1, int(-(-content['width'] // 1))), max(1, int(-(-content['height'] // 1)))
+    scale = min(1.0, (max_pixels / (width * height)) ** 0.5)
+    result = driver.execute_cdp_cmd('Page.captureScreenshot', {
+        'format': 'png', 'captureBeyondViewport': True,
+        'clip': {'x': 0, 'y': 0, 'width': width, 'height': height, 'scale': scale}})
+    return base64.b64decode(result['data'])
+
+class VisualBaselineStore:
+    """Keeps one baseline screenshot per URL and compares new screenshots against it
+
+    Each URL's baseline is a PNG plus a small JSON sidecar holding its
+    perceptual hash, so unchanged pages are recognised without decoding the
+    baseline. Sidecars are per URL, so parallel workers never share a file.
+    """
+
+    def __init__(self, directory="reports/baselines", diff_directory="reports/diffs",
+                 pixel_threshold=16, hash_threshold=0, update=False):
+        self.directory = directory
+        self.diff_directory = diff_directory
+        self.pixel_threshold = pixel_threshold
+        self.hash_threshold = hash_threshold
+        self.update = update
+
+    def paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+        return f"{self.directory}/{key}.png", f"{self.directory}/{key}.json"
+
+    def load(self, url):
+        """Return the stored baseline metadata for a URL, or None"""
+        image_path, meta_path = self.paths(url)
+        if not (os.path.exists(image_path) and os.path.exists(meta_path)):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, url, png_bytes, phash, size):
+        """Store png_bytes as the baseline for a URL"""
+        image_path, meta_path = self.paths(url)
+        os.makedirs(self.directory, exist_ok=True)
+        meta = {'url': url, 'phash': phash, 'width': size[0], 'height': size[1],
+                'updated': datetime.now().isoformat()}
+        for path, data in ((image_path, png_bytes), (meta_path, json.dumps(meta).encode('utf-8'))):
+            temp_name = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_name, 'wb') as f:
+                f.write(data)
+            os.replace(temp_name, path)
+        return meta
+
+    def check(self, url, png_bytes):
+        """Compare a PNG screenshot with the URL's baseline and return the outcome"""
+        np, Image = _load_visual_modules()
+        import io
+
+        with Image.open(io.BytesIO(png_bytes)) as current:
+            phash = perceptual_hash(current)
+            meta = self.load(url)
+            if meta is None or self.update:
+                self.save(url, png_bytes, phash, current.size)
+                return {'status': 'baseline_updated' if meta else 'baseline_created',
+                        'baseline': self.paths(url)[0], 'changed_percent': 0.0}
+
+            distance = hash_distance(meta['phash'], phash)
+            result = {'status': 'unchanged', 'baseline': self.paths(url)[0],
+                      'hash_distance': distance, 'changed_percent': 0.0}
+            # Matching hashes and sizes skip the pixel diff entirely
+            if distance <= self.hash_threshold and (meta['width'], meta['height']) == current.size:
+                return result
+
+            with Image.open(self.paths(url)[0]) as baseline:
+                stats = diff_images(baseline, current, pixel_threshold=self.pixel_threshold)
+
+        mask = stats.pop('mask')
+        result.update(stats)
+        if mask is not None:
+            result['status'] = 'changed'
+            os.makedirs(self.diff_directory, exist_ok=True)
+            key = os.path.basename(self.paths(url)[0])[:-4]
+            result['diff_mask'] = f"{self.diff_directory}/{key}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
+            mask.save(result['diff_mask'], optimize=True)
+        return result
+
+EXPORT_EXTENSIONS = {'json': 'json', 'ndjson': 'ndjson', 'html': 'html'}
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+_orjson = None
+
+def dumps_json(obj):
+    """Serialize obj to compact JSON bytes, with orjson when it is installed"""
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson
+            _orjson = orjson
+        except ImportError:
+            _orjson = False
+    if _orjson:
+        try:
+            return _orjson.dumps(obj, default=str, option=_orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # e.g. integers beyond 64 bits; the stdlib encoder handles those
+            pass
+    return json.dumps(obj, default=str, separators=(',', ':')).encode('utf-8')
+
+def open_report_file(path, mode='wb', compression=None):
+    """Open a binary report stream, compressed with gzip or zstd if requested
+
+    Appending adds a new gzip member or zstd frame, which readers decompress
+    as one continuous stream.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if compression == 'gzip':
+        return gzip.open(path, mode, compresslevel=6)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd compression needs the zstandard package (pip install aidoc[zstd])")
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, mode), closefd=True)
+    if compression:
+        raise ValueError(f"Unsupported compression: {compression}")
+    return open(path, mode)
+
+def compression_for_path(path):
+    """Infer the compression of a report file from its suffix"""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+def iter_page_records(page_info, console_logs, advanced_results, error_groups=None):
+    """Yield one page's results as flat, typed records for NDJSON export"""
+    url = page_info.get('url')
+    details = {'network_requests': 'network_request', 'js_errors': 'js_error'}
+    yield {'type': 'page', 'url': url, 'exported_at': datetime.now().isoformat(),
+           'page_info': {k: v for k, v in page_info.items() if k not in details}}
+    for key, record_type in details.items():
+        for item in page_info.get(key) or []:
+            yield dict(item, type=record_type, page_url=url)
+    for entry in console_logs or []:
+        yield dict(entry, type='console', page_url=url)
+    for group in error_groups or []:
+        yield dict(group, type='error_group', page_url=url)
+    for feature, data in (advanced_results or {}).items():
+        yield {'type': 'advanced', 'page_url': url, 'feature': feature, 'data': data}
+
+def write_json_page(stream, page_info, console_logs, advanced_results, error_groups=None):
+    """Write one page as a JSON object, streaming the console entries one at a time"""
+    stream.write(b'{"page_info":' + dumps_json(page_info) + b',"console_logs":[')
+    for index, entry in enumerate(console_logs or []):
+        stream.write((b',' if index else b'') + dumps_json(entry))
+    stream.write(b']')
+    if error_groups:
+        stream.write(b',"error_groups":' + dumps_json(list(error_groups)))
+    stream.write(b',"advanced_features":' + dumps_json(advanced_results or {}) + b'}')
+
+class ReportWriter:
+    """Writes the pages of a run to one growing NDJSON or JSON report file
+
+    NDJSON files are opened for appending, so successive runs add to the same
+    file. JSON files hold an array of page objects that is closed by close().
+    """
+
+    def __init__(self, path, export_format='ndjson', compression=None, append=True):
+        if export_format not in ('json', 'ndjson'):
+            raise ValueError(f"Unsupported report format: {export_format}")
+        self.path = path
+        self.export_format = export_format
+        self.compression = compression or compression_for_path(path)
+        self.append = append and export_format == 'ndjson'
+        self.pages = 0
+        self._stream = None
+        self._lock = threading.Lock()
+
+    def write_page(self, page_info, console_logs, advanced_results, error_groups=None):
+        with self._lock:
+            if self._stream is None:
+                self._stream = open_report_file(self.path, 'ab' if self.append else 'wb', self.compression)
+                if self.export_format == 'json':
+                    self._stream.write(b'[\n')
+            if self.export_format == 'ndjson':
+                for record in iter_page_records(page_info, console_logs, advanced_results, error_groups):
+                    self._stream.write(dumps_json(record) + b'\n')
+            else:
+                if self.pages:
+                    self._stream.write(b',\n')
+                write_json_page(self._stream, page_info, console_logs, advanced_results, error_groups)
+            self.pages += 1
+
+    def close(self):
+        with self._lock:
+            if self._stream is None:
+                return
+            if self.export_format == 'json':
+                self._stream.write(b'\n]\n')
+            self._stream.close()
+            self._stream = None
+
+def export_report(page_info, console_logs, advanced_results, export_format, writer=None,
+                  error_groups=None, reports_dir="reports", compression=None):
+    """Export one page's structured results and return the file written to
+
+    With a writer the page is added to its shared report; otherwise each page
+    gets its own timestamped file.
+    """
+    if writer is not None:
+        writer.write_page(page_info, console_logs, advanced_results, error_groups)
+        return writer.path
+
+    export_format = export_format.lower()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # The URL hash keeps pages exported within the same second apart
+    digest = hashlib.sha1(str(page_info.get('url')).encode('utf-8')).hexdigest()[:8]
+    directory = f"{reports_dir}/{'html' if export_format == 'html' else 'json'}"
+    filename = f"{directory}/report_{timestamp}_{digest}.{EXPORT_EXTENSIONS[export_format]}"
+
+    if export_format == 'html':
+        os.makedirs(directory, exist_ok=True)
+        with open(filename, 'wb') as f:
+            write_html_page(f, page_info, console_logs, advanced_results, error_groups)
+        return filename
+
+    filename += COMPRESSION_SUFFIXES.get(compression, '')
+    with open_report_file(filename, 'wb', compression) as stream:
+        if export_format == 'json':
+            write_json_page(stream, page_info, console_logs, advanced_results, error_groups)
+        else:
+            for record in iter_page_records(page_info, console_logs, advanced_results, error_groups):
+                stream.write(dumps_json(record) + b'\n')
+    return filename
 
 class AdvancedFeatures:
     def __init__(self, driver, **kwargs):
@@ -108,8 +970,32 @@ class AdvancedFeatures:
         self.enable_accessibility = kwargs.get('enable_accessibility', False)
         self.enable_security = kwargs.get('enable_security', False)
         self.enable_storage = kwargs.get('enable_storage', False)
+        self.enable_visual_regression = kwargs.get('enable_visual_regression', False)
         self.export_format = kwargs.get('export_format')
+        self.export_compression = kwargs.get('export_compression')
         self.results = {}
+        # Probe results gathered in the batched page state call
+        self.prefetched = {}
+        self.header_fetcher = kwargs.get('header_fetcher') or default_header_fetcher
+        self.screenshot_writer = kwargs.get('screenshot_writer') or default_screenshot_writer
+        self.screenshot_format = kwargs.get('screenshot_format') or 'png'
+        self.screenshot_quality = kwargs.get('screenshot_quality') or 80
+        self.screenshot_max_width = kwargs.get('screenshot_max_width')
+        self.accessibility_cache = kwargs.get('accessibility_cache') or default_accessibility_cache
+        self.memory_profiler = kwargs.get('memory_profiler')
+        # Per-stage durations, filled in by tracer spans
+        self.timings = {}
+        self.visual_store = kwargs.get('visual_store') or VisualBaselineStore(
+            directory=kwargs.get('baseline_dir') or "reports/baselines",
+            pixel_threshold=kwargs.get('diff_threshold') or 16,
+            hash_threshold=kwargs.get('hash_threshold') or 0,
+            update=kwargs.get('update_baselines', False))
+        self.a11y_scope = {
+            'include': kwargs.get('a11y_include'),
+            'exclude': kwargs.get('a11y_exclude'),
+            'rules': kwargs.get('a11y_rules'),
+            'tags': kwargs.get('a11y_tags')
+        }
 
     def capture_screenshot(self, error_count):
         """Capture screenshot when errors occur"""
@@ -117,29 +1003,47 @@ class AdvancedFeatures:
             return None
             
         try:
-            screenshot_dir = "reports/screenshots"
-            os.makedirs(screenshot_dir, exist_ok=True)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{screenshot_dir}/error_{error_count}_{timestamp}.png"
-            self.driver.save_screenshot(filename)
-            print(f"{Colors.GREEN}Screenshot saved: {filename}{Colors.ENDC}")
+            # Encoding and the disk write happen on the writer's threads
+            filename = self.screenshot_writer.submit(
+                self.driver.get_screenshot_as_base64(),
+                "reports/screenshots",
+                image_format=self.screenshot_format,
+                quality=self.screenshot_quality,
+                max_width=self.screenshot_max_width
+            )
+            print(f"{Colors.GREEN}Screenshot captured: {filename}{Colors.ENDC}")
             return filename
         except Exception as e:
             print(f"{Colors.RED}Failed to capture screenshot: {str(e)}{Colors.ENDC}")
             return None
 
     def get_memory_usage(self):
-        """Monitor memory usage"""
+        """Monitor memory usage of the browser under test"""
         if not self.enable_memory:
             return None
             
         try:
-            process = psutil.Process(os.getpid())
-            memory_info = {
-                'rss': process.memory_info().rss / 1024 / 1024,  # MB
-                'vms': process.memory_info().vms / 1024 / 1024,  # MB
-                'percent': process.memory_percent()
-            }
+            import psutil
+            profiler = self.memory_profiler
+            if profiler is None:
+                # Nothing was sampled during the page load; take a single sample now
+                profiler = BrowserMemoryProfiler(self.driver)
+                profiler.mark_loaded()
+                profiler.sample()
+            memory_info = profiler.summary()
+            latest = memory_info['samples'][-1]
+            rss = latest['browser_rss']
+            heap = latest['js_heap_used']
+            memory_info.update({
+                'rss': rss / 1024 / 1024 if rss is not None else None,  # MB
+                'js_heap_used': heap / 1024 / 1024 if heap is not None else None,  # MB
+                'percent': rss * 100 / psutil.virtual_memory().total if rss is not None else None
+            })
+
+            leak = memory_info['leak']
+            if leak['suspected']:
+                print(f"{Colors.YELLOW}Possible memory leak: {leak['metric']} grows "
+                      f"{leak['slope_mb_per_min']} MB/min after load{Colors.ENDC}")
             return memory_info
         except Exception as e:
             print(f"{Colors.RED}Failed to get memory usage: {str(e)}{Colors.ENDC}")
@@ -151,9 +1055,8 @@ class AdvancedFeatures:
             return None
             
         try:
-            axe = Axe(self.driver)
-            axe.inject()
-            results = axe.run()
+            scanner = AccessibilityScanner(self.driver, cache=self.accessibility_cache, **self.a11y_scope)
+            results = scanner.run()
             
             violations = results['violations']
             if violations:
@@ -169,24 +1072,25 @@ class AdvancedFeatures:
             return None
 
     def analyze_security_headers(self):
-        """Analyze security headers of the page"""
+        """Analyze security headers of the page
+
+        Returns the headers and whether they came from the rendered response
+        ('browser') or a separate request ('request').
+        """
         if not self.enable_security:
             return None
             
         try:
-            url = self.driver.current_url
-            response = requests.get(url)
-            headers = response.headers
+            # Prefer the headers of the response the browser actually rendered
+            headers = self.prefetched.get('document_headers')
+            source = 'browser'
+            if headers is None:
+                url = self.driver.current_url
+                cookies = {c['name']: c['value'] for c in self.driver.get_cookies()}
+                headers = self.header_fetcher.fetch(url, cookies=cookies)
+                source = 'request'
             
-            security_headers = {
-                'Strict-Transport-Security': headers.get('Strict-Transport-Security', 'Not Set'),
-                'Content-Security-Policy': headers.get('Content-Security-Policy', 'Not Set'),
-                'X-Frame-Options': headers.get('X-Frame-Options', 'Not Set'),
-                'X-Content-Type-Options': headers.get('X-Content-Type-Options', 'Not Set'),
-                'X-XSS-Protection': headers.get('X-XSS-Protection', 'Not Set')
-            }
-            
-            return security_headers
+            return {'headers': select_security_headers(headers), 'source': source}
         except Exception as e:
             print(f"{Colors.RED}Failed to analyze security headers: {str(e)}{Colors.ENDC}")
             return None
@@ -198,14 +1102,10 @@ class AdvancedFeatures:
             
         try:
             cookies = self.driver.get_cookies()
-            local_storage = self.driver.execute_script("""
-                let items = {};
-                for (let i = 0; i < localStorage.length; i++) {
-                    const key = localStorage.key(i);
-                    items[key] = localStorage.getItem(key);
-                }
-                return items;
-            """)
+            # Reuse localStorage collected with the page state when available
+            local_storage = self.prefetched.get('localStorage')
+            if local_storage is None:
+                local_storage = self.driver.execute_script(LOCAL_STORAGE_SCRIPT)
             
             return {
                 'cookies': cookies,
@@ -215,259 +1115,3401 @@ class AdvancedFeatures:
             print(f"{Colors.RED}Failed to inspect storage: {str(e)}{Colors.ENDC}")
             return None
 
+    def check_visual_regression(self):
+        """Compare a full-page screenshot against the stored baseline for this URL"""
+        if not self.enable_visual_regression:
+            return None
+
+        try:
+            try:
+                png_bytes = capture_full_page_png(self.driver)
+            except Exception:
+                # No DevTools access: fall back to the visible viewport
+                png_bytes = base64.b64decode(self.driver.get_screenshot_as_base64())
+            result = self.visual_store.check(self.driver.current_url, png_bytes)
+
+            if result['status'] == 'changed':
+                print(f"{Colors.YELLOW}Visual change: {result['changed_percent']}% of pixels differ "
+                      f"(mask: {result['diff_mask']}){Colors.ENDC}")
+            elif result['status'].startswith('baseline'):
+                print(f"{Colors.GREEN}Visual baseline saved: {result['baseline']}{Colors.ENDC}")
+            return result
+        except Exception as e:
+            print(f"{Colors.RED}Failed to check visual regression: {str(e)}{Colors.ENDC}")
+            return None
+
     def analyze(self, error_categories):
         """Run all enabled analysis features"""
+        span = partial(tracer.span, timings=self.timings)
         if self.enable_screenshots and error_categories:
-            self.results['screenshots'] = self.capture_screenshot(len(error_categories))
+            with span('advanced.screenshot'):
+                self.results['screenshots'] = self.capture_screenshot(len(error_categories))
             
         if self.enable_memory:
-            self.results['memory'] = self.get_memory_usage()
+            with span('advanced.memory'):
+                self.results['memory'] = self.get_memory_usage()
             
         if self.enable_accessibility:
-            self.results['accessibility'] = self.check_accessibility()
+            with span('advanced.accessibility'):
+                self.results['accessibility'] = self.check_accessibility()
             
         if self.enable_security:
-            self.results['security'] = self.analyze_security_headers()
+            with span('advanced.security'):
+                self.results['security'] = self.analyze_security_headers()
             
         if self.enable_storage:
-            self.results['storage'] = self.inspect_storage()
+            with span('advanced.storage'):
+                self.results['storage'] = self.inspect_storage()
+
+        if self.enable_visual_regression:
+            with span('advanced.visual_regression'):
+                self.results['visual_regression'] = self.check_visual_regression()
 
-    def export_results(self, console_logs, page_info):
-        """Export results in specified format"""
+    def export_results(self, console_logs, page_info, writer=None, error_groups=None):
+        """Export structured console entries, page info and feature results"""
         if not self.export_format:
             return
             
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            reports_dir = "reports"
-            os.makedirs(reports_dir, exist_ok=True)
-            
-            if self.export_format.lower() == 'json':
-                json_dir = f"{reports_dir}/json"
-                os.makedirs(json_dir, exist_ok=True)
-                filename = f"{json_dir}/report_{timestamp}.json"
-                with open(filename, 'w') as f:
-                    json.dump({
-                        'page_info': page_info,
-                        'console_logs': console_logs,
-                        'advanced_features': self.results
-                    }, f, indent=2)
-                    
-            elif self.export_format.lower() == 'html':
-                html_dir = f"{reports_dir}/html"
-                os.makedirs(html_dir, exist_ok=True)
-                filename = f"{html_dir}/report_{timestamp}.html"
-                with open(filename, 'w') as f:
-                    html_content = f"""
-                    <!DOCTYPE html>
-                    <html>
-                    <head>
-                        <title>AgenTest.ai Report</title>
-                        <style>
-                            body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                            .error {{ color: red; }}
-                            .warning {{ color: orange; }}
-                            .success {{ color: green; }}
-                            .section {{ margin: 20px 0; padding: 10px; border: 1px solid #ccc; }}
-                        </style>
-                    </head>
-                    <body>
-                        <h1>AgenTest.ai Analysis Report</h1>
-                        <div class="section">
-                            <h2>Page Information</h2>
-                            <pre>{html.escape(json.dumps(page_info, indent=2))}</pre>
-                        </div>
-                        <div class="section">
-                            <h2>Console Logs</h2>
-                            <pre>{html.escape(json.dumps(console_logs, indent=2))}</pre>
-                        </div>
-                        <div class="section">
-                            <h2>Advanced Analysis</h2>
-                            <pre>{html.escape(json.dumps(self.results, indent=2))}</pre>
-                        </div>
-                    </body>
-                    </html>
-                    """
-                    f.write(html_content)
-                    
-            print(f"{Colors.GREEN}Report exported to: {filename}{Colors.ENDC}")
+            filename = export_report(page_info, console_logs, self.results, self.export_format,
+                                     writer=writer, error_groups=error_groups,
+                                     compression=self.export_compression)
+            if writer is None:
+                print(f"{Colors.GREEN}Report exported to: {filename}{Colors.ENDC}")
+            return filename
             
         except Exception as e:
             print(f"{Colors.RED}Failed to export results: {str(e)}{Colors.ENDC}")
 
-def capture_page_state(driver, url):
-    """Capture detailed information about the current page state"""
-    state = {
-        "url": driver.current_url,
-        "title": driver.title,
-        "page_source_excerpt": driver.page_source[:1000] + "..." if len(driver.page_source) > 1000 else driver.page_source
+HTML_REPORT_STYLE = """
+body { font-family: Arial, sans-serif; margin: 20px; color: #222; }
+h1 { margin-bottom: 4px; }
+.summary { display: flex; flex-wrap: wrap; gap: 12px; margin: 16px 0; }
+.card { border: 1px solid #ccc; border-radius: 4px; padding: 8px 12px; min-width: 120px; }
+.card b { display: block; font-size: 12px; color: #666; }
+details.section { margin: 12px 0; border: 1px solid #ccc; border-radius: 4px; }
+details.section > summary { cursor: pointer; padding: 8px 12px; font-weight: bold; background: #f5f5f5; }
+.count { color: #666; font-weight: normal; }
+.toolbar { padding: 6px 12px; }
+.toolbar input { width: 320px; padding: 4px; }
+.grid { font-size: 13px; }
+.head, .row { display: grid; grid-auto-flow: column; grid-template-columns: var(--columns); }
+.head div { font-weight: bold; cursor: pointer; padding: 4px 6px; border-bottom: 2px solid #ccc; user-select: none; }
+.viewport { overflow-y: auto; position: relative; max-height: 480px; }
+.row { position: absolute; left: 0; right: 0; height: 24px; }
+.row:nth-child(odd) { background: #fafafa; }
+.row div { padding: 4px 6px; white-space: nowrap; overflow: hidden; text-overflow: ellipsis; }
+.SEVERE, .ERROR, .critical, .serious { color: red; }
+.WARNING, .moderate { color: orange; }
+pre { margin: 0; padding: 8px 12px; overflow: auto; max-height: 480px; }
+"""
+
+# Renders the embedded data; tables only materialize the rows in view
+HTML_REPORT_SCRIPT = """
+(function() {
+    const ROW_HEIGHT = 24;
+    const HIGHLIGHT = new Set(['SEVERE', 'ERROR', 'WARNING', 'critical', 'serious', 'moderate']);
+    const data = JSON.parse(document.getElementById('aidoc-data').textContent);
+
+    function el(tag, className, text) {
+        const node = document.createElement(tag);
+        if (className) node.className = className;
+        if (text !== undefined && text !== null) node.textContent = text;
+        return node;
     }
-    
-    # Capture network state using JavaScript
-    network_state = driver.execute_script("""
-        const performance = window.performance || window.mozPerformance || window.msPerformance || window.webkitPerformance || {};
-        const network = performance.getEntriesByType ? performance.getEntriesByType("resource") : [];
-        return network.map(entry => ({
-            name: entry.name,
-            duration: entry.duration,
-            startTime: entry.startTime,
-            responseEnd: entry.responseEnd,
-            initiatorType: entry.initiatorType
-        }));
-    """)
-    
-    state["network_requests"] = network_state
-    
-    # Capture JavaScript errors
-    js_errors = driver.execute_script("""
-        return window.jsErrors || [];
-    """)
-    
-    state["js_errors"] = js_errors
-    
-    return state
 
-def inject_error_listeners(driver):
-    """Inject JavaScript to capture errors and unhandled rejections"""
-    driver.execute_script("""
-        window.jsErrors = [];
-        window.addEventListener('error', function(event) {
-            window.jsErrors.push({
-                type: 'error',
-                message: event.message,
-                filename: event.filename,
-                lineno: event.lineno,
-                colno: event.colno,
-                error: event.error ? event.error.stack : null,
-                timestamp: new Date().toISOString()
+    function cell(value) {
+        if (value && typeof value === 'object') {
+            const node = el('div');
+            const link = el('a', null, value.text);
+            link.href = value.href;
+            node.appendChild(link);
+            return node;
+        }
+        const node = el('div', HIGHLIGHT.has(value) ? value : null, value);
+        node.title = value === null || value === undefined ? '' : String(value);
+        return node;
+    }
+
+    function text(value) {
+        return value && typeof value === 'object' ? value.text : String(value === null ? '' : value);
+    }
+
+    function table(section, container) {
+        const rows = section.rows;
+        let view = rows.map((_, i) => i);
+        let haystack = null;
+        let sort = {column: -1, direction: 1};
+
+        const toolbar = el('div', 'toolbar');
+        const filter = el('input');
+        filter.placeholder = 'Filter ' + rows.length + ' rows';
+        toolbar.appendChild(filter);
+        const grid = el('div', 'grid');
+        grid.style.setProperty('--columns', section.widths || 'repeat(' + section.columns.length + ', minmax(80px, 1fr))');
+        const head = el('div', 'head');
+        const viewport = el('div', 'viewport');
+        const spacer = el('div');
+        viewport.appendChild(spacer);
+        grid.appendChild(head);
+        grid.appendChild(viewport);
+        container.appendChild(toolbar);
+        container.appendChild(grid);
+
+        function draw() {
+            spacer.style.height = (view.length * ROW_HEIGHT) + 'px';
+            viewport.style.height = Math.min(480, Math.max(view.length, 1) * ROW_HEIGHT) + 'px';
+            const first = Math.floor(viewport.scrollTop / ROW_HEIGHT);
+            const last = Math.min(view.length, first + Math.ceil(480 / ROW_HEIGHT) + 10);
+            while (viewport.lastChild !== spacer) viewport.removeChild(viewport.lastChild);
+            for (let i = first; i < last; i++) {
+                const row = el('div', 'row');
+                row.style.top = (i * ROW_HEIGHT) + 'px';
+                rows[view[i]].forEach(value => row.appendChild(cell(value)));
+                viewport.appendChild(row);
+            }
+        }
+
+        section.columns.forEach((name, column) => {
+            const header = el('div', null, name);
+            header.addEventListener('click', () => {
+                sort = {column: column, direction: sort.column === column ? -sort.direction : 1};
+                view.sort((a, b) => {
+                    const x = rows[a][column], y = rows[b][column];
+                    if (typeof x === 'number' && typeof y === 'number') return (x - y) * sort.direction;
+                    return text(x).localeCompare(text(y)) * sort.direction;
+                });
+                draw();
             });
+            head.appendChild(header);
         });
-        window.addEventListener('unhandledrejection', function(event) {
-            window.jsErrors.push({
-                type: 'unhandledrejection',
-                message: event.reason,
-                timestamp: new Date().toISOString()
-            });
+
+        let pending = null;
+        filter.addEventListener('input', () => {
+            clearTimeout(pending);
+            pending = setTimeout(() => {
+                const needle = filter.value.toLowerCase();
+                if (haystack === null) haystack = rows.map(row => row.map(text).join(' ').toLowerCase());
+                view = rows.map((_, i) => i).filter(i => !needle || haystack[i].includes(needle));
+                sort = {column: -1, direction: 1};
+                viewport.scrollTop = 0;
+                draw();
+            }, 150);
         });
-    """)
+        viewport.addEventListener('scroll', () => requestAnimationFrame(draw));
+        draw();
+    }
 
-def print_report(page_info, console_handler, total_time):
-    print(f"\n{Colors.CYAN}{'='*80}{Colors.ENDC}")
-    print(f"{Colors.BOLD}{Colors.CYAN}DETAILED ANALYSIS REPORT{Colors.ENDC}")
-    print(f"{Colors.CYAN}{'='*80}{Colors.ENDC}")
-    
-    print(f"\n{Colors.BOLD}1. Timing Information:{Colors.ENDC}")
-    print(f"{Colors.BOLD}Page Load Time:{Colors.ENDC} {page_info['load_time']:.2f}s")
-    print(f"{Colors.BOLD}Total Analysis Time:{Colors.ENDC} {total_time:.2f}s")
-    
-    print(f"\n{Colors.BOLD}2. Page Information:{Colors.ENDC}")
-    print(f"{Colors.BOLD}URL:{Colors.ENDC} {page_info['url']}")
-    print(f"{Colors.BOLD}Page Title:{Colors.ENDC} {page_info['title']}")
-    
-    print(f"\n{Colors.BOLD}3. Console Errors and Warnings:{Colors.ENDC}")
-    print(console_handler.get_formatted_logs())
+    const root = document.getElementById('report');
+    const summary = el('div', 'summary');
+    data.cards.forEach(card => {
+        const node = el('div', 'card', card[1] === null ? '-' : card[1]);
+        node.prepend(el('b', null, card[0]));
+        summary.appendChild(node);
+    });
+    root.appendChild(summary);
 
-def main():
-    parser = argparse.ArgumentParser(
-        description='AgenTest aiDoc - Advanced Web Console Analysis Tool',
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog=AGENTEST_BANNER)
-    
-    parser.add_argument('url', help='URL to analyze')
-    parser.add_argument('--interactive', action='store_true', help='Launch browser in interactive mode for manual login')
-    parser.add_argument('--wait-after-login', type=int, default=10, help='Seconds to wait after login before analysis (default: 10)')
-    parser.add_argument('--screenshots', action='store_true', help='Enable screenshot capture')
-    parser.add_argument('--memory', action='store_true', help='Enable memory monitoring')
-    parser.add_argument('--accessibility', action='store_true', help='Enable accessibility checks')
-    parser.add_argument('--security', action='store_true', help='Enable security analysis')
-    parser.add_argument('--storage', action='store_true', help='Enable storage inspection')
-    parser.add_argument('--export', choices=['html', 'json'], help='Export format')
-    
-    args = parser.parse_args()
-    
-    return main_impl(args.url,
-                    interactive=args.interactive,
-                    wait_after_login=args.wait_after_login,
-                    enable_screenshots=args.screenshots,
-                    enable_memory=args.memory,
-                    enable_accessibility=args.accessibility,
-                    enable_security=args.security,
-                    enable_storage=args.storage,
-                    export_format=args.export)
+    data.sections.forEach((section, index) => {
+        const details = el('details', 'section');
+        const title = el('summary', null, section.title + ' ');
+        title.appendChild(el('span', 'count', section.rows ? '(' + section.rows.length + ')' : ''));
+        details.appendChild(title);
+        details.open = index === 0 && !section.collapsed;
+        let rendered = false;
+        function render() {
+            if (rendered || !details.open) return;
+            rendered = true;
+            if (section.rows) table(section, details);
+            else details.appendChild(el('pre', null, JSON.stringify(section.data, null, 2)));
+        }
+        details.addEventListener('toggle', render);
+        root.appendChild(details);
+        render();
+    });
+})();
+"""
 
-def main_impl(url, **kwargs):
-    """Implementation of the main functionality"""
-    start_time = time.time()
-    print(AGENTEST_BANNER)
-    
-    # Initialize Chrome options
-    chrome_options = Options()
-    if not kwargs.get('interactive', False):
-        chrome_options.add_argument('--headless')  # Run in headless mode only if not interactive
-    chrome_options.add_argument('--no-sandbox')
-    chrome_options.add_argument('--disable-dev-shm-usage')
-    
-    # Create reports directory if it doesn't exist
-    os.makedirs('reports/screenshots', exist_ok=True)
-    os.makedirs('reports/html', exist_ok=True)
-    os.makedirs('reports/json', exist_ok=True)
-    
-    driver = None
+def _report_time(timestamp):
+    if isinstance(timestamp, (int, float)):
+        return datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    return timestamp
+
+def _round(value, digits=1):
+    return round(value, digits) if isinstance(value, (int, float)) else value
+
+def iter_report_sections(page_info, console_logs, advanced_results, error_groups=None):
+    """Yield (title, columns, rows) tables for one page; rows may be lazy iterables
+
+    Feature results without a tabular form are yielded with rows set to None
+    and the raw data in place of the columns.
+    """
+    if error_groups:
+        yield ('Distinct Errors', ['Count', 'Level', 'Category', 'First Seen', 'Message'],
+               ([g['count'], g['level'], g['category'], _report_time(g['first_seen']),
+                 g['sample'].get('message')] for g in error_groups))
+    yield ('Console Logs', ['Level', 'Category', 'Source', 'Time', 'Message'],
+           ([e.get('level'), e.get('category'), e.get('source'), _report_time(e.get('timestamp')),
+             e.get('message')] for e in console_logs or []))
+    if page_info.get('js_errors'):
+        yield ('JavaScript Errors', ['Time', 'Type', 'Message', 'File', 'Line'],
+               ([e.get('timestamp'), e.get('type'), e.get('message'), e.get('filename'), e.get('lineno')]
+                for e in page_info['js_errors']))
+    if page_info.get('network_requests'):
+        yield ('Network Requests', ['URL', 'Type', 'Status', 'Start (ms)', 'Duration (ms)', 'Size (B)'],
+               ([r.get('name'), r.get('initiatorType'), resource_status(r), _round(r.get('startTime')),
+                 _round(r.get('duration')), r.get('transferSize', r.get('encodedDataLength'))]
+                for r in page_info['network_requests']))
+
+    blocked = page_info.get('blocked_requests')
+    if blocked and blocked['count']:
+        yield ('Blocked Requests', ['URL', 'Type', 'Domain', 'Reason'],
+               ([r['url'], r['type'], r['domain'], r['reason']] for r in blocked['requests']))
+
+    waterfall = (page_info.get('performance') or {}).get('waterfall')
+    if waterfall:
+        yield ('Critical Path', ['URL', 'Type', 'Start (ms)', 'End (ms)', 'Duration (ms)'],
+               ([r['name'], r['initiator'], r['start'], r['end'], r['duration']] for r in waterfall['critical_path']))
+        yield ('Flagged Resources', ['URL', 'Reasons', 'Type', 'Duration (ms)', 'Size (B)'],
+               ([r['name'], ', '.join(r['reasons']), r['initiator'], r['duration'], r['transfer_size']]
+                for r in waterfall['flagged']))
+        yield ('Domains', ['Domain', 'Requests', 'Size (B)', 'Time (ms)', 'Third Party'],
+               ([domain, d['count'], d['transfer_size'], d['total_duration'],
+                 domain in waterfall['third_party']['domains']] for domain, d in waterfall['by_domain'].items()))
+
+    results = dict(advanced_results or {})
+    accessibility = results.pop('accessibility', None)
+    if accessibility:
+        yield ('Accessibility Violations', ['Rule', 'Impact', 'Nodes', 'Description'],
+               ([v.get('id'), v.get('impact'), len(v.get('nodes') or []), v.get('description')]
+                for v in accessibility.get('violations') or []))
+    security = results.pop('security', None)
+    if security:
+        yield (f"Security Headers (from {security['source']})", ['Header', 'Value'],
+               ([k, v] for k, v in security['headers'].items()))
+    storage = results.pop('storage', None)
+    if storage:
+        yield ('Cookies', ['Name', 'Domain', 'Path', 'Secure', 'HttpOnly'],
+               ([c.get('name'), c.get('domain'), c.get('path'), c.get('secure'), c.get('httpOnly')]
+                for c in storage.get('cookies') or []))
+        yield ('Local Storage', ['Key', 'Value'],
+               ([k, str(v)[:500]] for k, v in (storage.get('localStorage') or {}).items()))
+    if page_info.get('performance'):
+        yield ('Performance', None, page_info['performance'])
+    for feature, data in results.items():
+        if data is not None:
+            yield (feature.replace('_', ' ').title(), None, data)
+
+def write_html_report(stream, title, cards, sections):
+    """Stream an HTML report whose data is embedded once as compact JSON
+
+    sections is an iterable of (title, columns, rows) as produced by
+    iter_report_sections; rows are serialized one at a time.
+    """
+    stream.write(f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{html.escape(title)}</title>
+<style>{HTML_REPORT_STYLE}</style>
+</head>
+<body>
+<h1>AgenTest.ai Analysis Report</h1>
+<div>{html.escape(title)}</div>
+<div id="report"></div>
+<script type="application/json" id="aidoc-data">""".encode('utf-8'))
+
+    def write(data):
+        # "</script", "<!--" and "<script" in page text could change how the script element
+        # is parsed; these characters only occur inside JSON strings, so escaping them is safe
+        stream.write(data.replace(b'<', b'\\u003c').replace(b'>', b'\\u003e').replace(b'&', b'\\u0026'))
+
+    write(b'{"cards":' + dumps_json(cards) + b',"sections":[')
+    for index, (section_title, columns, rows) in enumerate(sections):
+        write(b',' if index else b'')
+        if columns is None:
+            write(b'{"title":' + dumps_json(section_title) + b',"data":' + dumps_json(rows) + b'}')
+            continue
+        write(b'{"title":' + dumps_json(section_title) + b',"columns":' + dumps_json(columns) + b',"rows":[')
+        for row_index, row in enumerate(rows):
+            write((b',' if row_index else b'') + dumps_json(row))
+        write(b']}')
+    write(b']}')
+    stream.write(f"""</script>
+<script>{HTML_REPORT_SCRIPT}</script>
+</body>
+</html>
+""".encode('utf-8'))
+
+def page_report_cards(page_info, error_count=None):
+    vitals = (page_info.get('performance') or {}).get('vitals') or {}
+    return [
+        ['Title', page_info.get('title')],
+        ['Load Time', f"{page_info['load_time']:.2f}s" if page_info.get('load_time') is not None else None],
+        ['Errors', error_count],
+        ['LCP', _format_ms(vitals.get('lcp'))],
+        ['CLS', vitals.get('cls')],
+        ['INP', _format_ms(vitals.get('inp'))]
+    ]
+
+def write_html_page(stream, page_info, console_logs, advanced_results, error_groups=None, error_count=None):
+    """Write one page's report"""
+    write_html_report(stream, str(page_info.get('url')), page_report_cards(page_info, error_count),
+                      iter_report_sections(page_info, console_logs, advanced_results, error_groups))
+
+def write_html_index(stream, pages, title="Batch Report"):
+    """Write an index report for a batch run from an iterable of page rows
+
+    Each page is a dict with url, title, load_time, error_count,
+    distinct_errors, vitals, error and an optional report_file link.
+    """
+    columns = ['URL', 'Title', 'Load (s)', 'Errors', 'Distinct', 'LCP (ms)', 'CLS', 'Status']
+
+    def rows():
+        for page in pages:
+            vitals = page.get('vitals') or {}
+            url = page['url']
+            yield [{'text': url, 'href': page['report_file']} if page.get('report_file') else url,
+                   page.get('title'), _round(page.get('load_time'), 2), page.get('error_count'),
+                   page.get('distinct_errors'), _round(vitals.get('lcp'), 0), vitals.get('cls'),
+                   page.get('error') or 'OK']
+
+    write_html_report(stream, title, [['Generated', datetime.now().strftime('%Y-%m-%d %H:%M')]],
+                      [('Pages', columns, rows())])
+
+def register_early_script(driver, name, source):
+    """Run source in every new document before page scripts, registering it once per driver"""
+    scripts = getattr(driver, '_aidoc_early_scripts', None)
+    if scripts is None:
+        scripts = driver._aidoc_early_scripts = {}
+    if name in scripts:
+        return True
     try:
-        # Initialize WebDriver
-        driver = webdriver.Chrome(options=chrome_options)
-        wait = WebDriverWait(driver, 10)
-        
-        # Initialize console log handler
-        console_handler = ConsoleLogHandler()
-        
-        # Initialize advanced features
-        advanced = AdvancedFeatures(
-            driver,
-            enable_screenshots=kwargs.get('enable_screenshots', False),
-            enable_memory=kwargs.get('enable_memory', False),
-            enable_accessibility=kwargs.get('enable_accessibility', False),
-            enable_security=kwargs.get('enable_security', False),
-            enable_storage=kwargs.get('enable_storage', False),
-            export_format=kwargs.get('export_format')
-        )
-        
-        # Visit the URL
-        print(f"\nVisiting {url}...")
-        load_start = time.time()
-        driver.get(url)
-        load_time = time.time() - load_start
-        
+        result = driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': source})
+    except Exception:
+        return False
+    scripts[name] = result.get('identifier')
+    return True
+
+# Error listeners kept in a fixed-size in-page ring buffer; __aidoc.drain(cursor)
+# returns only entries newer than the cursor so polling stays cheap
+ERROR_LISTENER_SCRIPT = """
+(function() {
+    if (window.__aidoc) { return; }
+    const capacity = __CAPACITY__;
+    const buffer = new Array(capacity);
+    const state = window.__aidoc = {
+        id: Date.now().toString(36) + Math.random().toString(36).slice(2),
+        total: 0,
+        capacity: capacity,
+        drain: function(cursor) {
+            const first = Math.max(cursor, state.total - capacity);
+            const entries = [];
+            for (let seq = first + 1; seq <= state.total; seq++) {
+                entries.push(buffer[(seq - 1) % capacity]);
+            }
+            return {id: state.id, total: state.total, dropped: first - cursor, entries: entries};
+        }
+    };
+    function push(entry) {
+        state.total += 1;
+        entry.seq = state.total;
+        buffer[(state.total - 1) % capacity] = entry;
+    }
+    window.addEventListener('error', function(event) {
+        push({
+            type: 'error',
+            message: event.message,
+            filename: event.filename,
+            lineno: event.lineno,
+            colno: event.colno,
+            error: event.error ? event.error.stack : null,
+            url: location.href,
+            timestamp: new Date().toISOString()
+        });
+    });
+    window.addEventListener('unhandledrejection', function(event) {
+        push({
+            type: 'unhandledrejection',
+            message: String(event.reason && event.reason.stack || event.reason),
+            url: location.href,
+            timestamp: new Date().toISOString()
+        });
+    });
+})();
+"""
+
+# Drains from the cursor, or from zero when a navigation replaced the document
+JS_ERROR_DRAIN_SCRIPT = """
+    const state = window.__aidoc;
+    if (!state) { return null; }
+    return state.drain(state.id === arguments[1] ? arguments[0] : 0);
+"""
+
+class JSErrorCollector:
+    """Registers error listeners before page scripts run and drains them incrementally"""
+
+    def __init__(self, driver, capacity=1000):
+        self.driver = driver
+        self.capacity = capacity
+        self.script = ERROR_LISTENER_SCRIPT.replace('__CAPACITY__', str(int(capacity)))
+        self.errors = deque(maxlen=capacity)
+        self.dropped = 0
+        self.early = False
+        self._document_id = None
+        self._cursor = 0
+
+    def install(self):
+        """Register the listeners for every new document via CDP, once per driver"""
+        # Without CDP (non-Chromium or a grid without it) listeners go in after load
+        self.early = register_early_script(self.driver, 'errors', self.script)
+        return self.early
+
+    def inject(self):
+        """Install the listeners into the current document if they are missing"""
+        self.driver.execute_script(self.script)
+
+    def drain_args(self):
+        """Arguments for JS_ERROR_DRAIN_SCRIPT: cursor and the document it belongs to"""
+        return [self._cursor, self._document_id]
+
+    def drain(self):
+        """Pull errors newer than the cursor and return them"""
+        return self.consume(self.driver.execute_script(JS_ERROR_DRAIN_SCRIPT, *self.drain_args()))
+
+    def consume(self, result):
+        """Advance the cursor past a drain result and keep its entries"""
+        if not isinstance(result, dict):
+            return []
+        # After a navigation the script drained the new document from the start
+        self._document_id = result.get('id')
+        self._cursor = result.get('total', 0)
+        self.dropped += result.get('dropped', 0)
+        entries = result.get('entries', [])
+        self.errors.extend(entries)
+        return entries
+
+# PerformanceObservers for Web Vitals and long tasks; registered before page
+# scripts so entries that are never buffered (long tasks) are not missed
+PERFORMANCE_OBSERVER_SCRIPT = """
+(function() {
+    if (window.__aidocMetrics || !window.PerformanceObserver) { return; }
+    // The default buffer keeps only 250 resource entries
+    if (performance.setResourceTimingBufferSize) { performance.setResourceTimingBufferSize(10000); }
+    const metrics = window.__aidocMetrics = {
+        lcp: null, cls: 0, inp: null, interactions: 0,
+        longTasks: {count: 0, total: 0, max: 0}
+    };
+    function observe(type, callback, options) {
+        try {
+            new PerformanceObserver(list => list.getEntries().forEach(callback))
+                .observe(Object.assign({type: type, buffered: true}, options || {}));
+        } catch (e) {}
+    }
+    observe('largest-contentful-paint', e => { metrics.lcp = e.renderTime || e.loadTime || e.startTime; });
+    observe('layout-shift', e => { if (!e.hadRecentInput) { metrics.cls += e.value; } });
+    observe('event', e => {
+        if (e.interactionId) {
+            metrics.interactions += 1;
+            metrics.inp = Math.max(metrics.inp || 0, e.duration);
+        }
+    }, {durationThreshold: 16});
+    observe('longtask', e => {
+        metrics.longTasks.count += 1;
+        metrics.longTasks.total += e.duration;
+        metrics.longTasks.max = Math.max(metrics.longTasks.max, e.duration);
+    });
+})();
+"""
+
+# Function body returning navigation phases, paints and observed vitals in one call
+PERFORMANCE_METRICS_SCRIPT = """
+    const perf = window.performance;
+    if (!perf || !perf.getEntriesByType) { return null; }
+    const nav = perf.getEntriesByType('navigation')[0];
+    const paints = {};
+    perf.getEntriesByType('paint').forEach(p => { paints[p.name] = p.startTime; });
+    let vitals = window.__aidocMetrics || null;
+    if (!vitals && window.PerformanceObserver) {
+        // Late fallback: buffered LCP and layout shifts are still available
+        vitals = {lcp: null, cls: 0, inp: null, interactions: 0, longTasks: null};
+        try {
+            const lcp = new PerformanceObserver(() => {});
+            lcp.observe({type: 'largest-contentful-paint', buffered: true});
+            lcp.takeRecords().forEach(e => { vitals.lcp = e.renderTime || e.loadTime || e.startTime; });
+            lcp.disconnect();
+            const cls = new PerformanceObserver(() => {});
+            cls.observe({type: 'layout-shift', buffered: true});
+            cls.takeRecords().forEach(e => { if (!e.hadRecentInput) { vitals.cls += e.value; } });
+            cls.disconnect();
+        } catch (e) {}
+    }
+    return {
+        navigation: nav ? {
+            type: nav.type,
+            redirect: nav.redirectEnd - nav.redirectStart,
+            dns: nav.domainLookupEnd - nav.domainLookupStart,
+            tcp: nav.connectEnd - nav.connectStart,
+            tls: nav.secureConnectionStart > 0 ? nav.connectEnd - nav.secureConnectionStart : 0,
+            request: nav.responseStart - nav.requestStart,
+            ttfb: nav.responseStart - nav.startTime,
+            download: nav.responseEnd - nav.responseStart,
+            dom_interactive: nav.domInteractive,
+            dom_content_loaded: nav.domContentLoadedEventEnd,
+            load: nav.loadEventEnd,
+            transfer_size: nav.transferSize,
+            encoded_body_size: nav.encodedBodySize,
+            decoded_body_size: nav.decodedBodySize,
+            protocol: nav.nextHopProtocol
+        } : null,
+        paint: {
+            first_paint: paints['first-paint'] || null,
+            first_contentful_paint: paints['first-contentful-paint'] || null
+        },
+        vitals: vitals ? {lcp: vitals.lcp, cls: vitals.cls, inp: vitals.inp, interactions: vitals.interactions} : null,
+        long_tasks: vitals ? vitals.longTasks : null
+    };
+"""
+
+def resource_status(entry):
+    """HTTP status of a network entry: 'status' from CDP, 'responseStatus' from resource timing"""
+    return entry.get('status', entry.get('responseStatus'))
+
+def summarize_resources(network_requests):
+    """Aggregate resource timing entries per initiator type"""
+    by_initiator = {}
+    totals = {'count': 0, 'transfer_size': 0, 'encoded_body_size': 0, 'decoded_body_size': 0}
+    for entry in network_requests or []:
+        initiator = entry.get('initiatorType') or 'other'
+        bucket = by_initiator.setdefault(initiator, {
+            'count': 0, 'transfer_size': 0, 'encoded_body_size': 0, 'decoded_body_size': 0,
+            'total_duration': 0, 'max_duration': 0
+        })
+        duration = entry.get('duration') or 0
+        bucket['count'] += 1
+        bucket['total_duration'] += duration
+        bucket['max_duration'] = max(bucket['max_duration'], duration)
+        for field, key in (('transfer_size', 'transferSize'), ('encoded_body_size', 'encodedBodySize'),
+                           ('decoded_body_size', 'decodedBodySize')):
+            size = entry.get(key) or 0
+            bucket[field] += size
+            totals[field] += size
+        totals['count'] += 1
+    return {'totals': totals, 'by_initiator': by_initiator}
+
+# Host part of an absolute URL; much cheaper than urlsplit on thousands of entries
+URL_HOST_PATTERN = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*://(?:[^@/?#]*@)?(\[[^\]]*\]|[^:/?#]*)')
+
+def url_host(url):
+    match = URL_HOST_PATTERN.match(url)
+    return match.group(1).lower() if match else ''
+
+# Second-level labels that country codes use as public suffixes (co.uk, com.au, ac.jp)
+SECOND_LEVEL_SUFFIXES = frozenset({'co', 'com', 'net', 'org', 'gov', 'gob', 'edu', 'ac', 'mil',
+                                   'ne', 'or', 'go', 'gv', 'ltd', 'plc', 'nic'})
+
+def registrable_domain(host):
+    """Approximate the registrable domain of a host, e.g. cdn.example.co.uk -> example.co.uk"""
+    if not host or host.replace('.', '').isdigit() or ':' in host:
+        return host
+    labels = host.split('.')
+    # Only known suffixes keep three labels, so short names like bmw.de stay two
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_SUFFIXES:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+def _aggregate(codes, labels, count, transfer, duration, limit):
+    """Per-label count, bytes and time, largest transfer first"""
+    import numpy as np
+    counts = np.bincount(codes, minlength=count)
+    sizes = np.bincount(codes, weights=transfer, minlength=count)
+    times = np.bincount(codes, weights=duration, minlength=count)
+    order = np.argsort(-sizes, kind='stable')[:limit]
+    return {labels[i]: {'count': int(counts[i]), 'transfer_size': int(sizes[i]),
+                        'total_duration': round(float(times[i]), 1)} for i in order}
+
+def analyze_waterfall(entries, page_url=None, first_paint=None, slow_ms=1000, large_bytes=500 * 1024, limit=20):
+    """Analyze resource timing entries as a waterfall
+
+    Computes the critical path, peak concurrency, per-domain and per-initiator
+    aggregates and third-party cost, and flags slow, large, render-blocking and
+    duplicate resources. Everything apart from URL parsing runs as numpy array
+    operations, so thousands of entries take milliseconds.
+    """
+    entries = [e for e in entries or [] if isinstance(e, dict) and e.get('name')]
+    if not entries:
+        return None
+    import numpy as np
+    n = len(entries)
+    # One pass over the dicts, then column arrays
+    columns = np.array([(e.get('startTime') or 0, e.get('duration') or 0, e.get('responseEnd') or 0,
+                         e.get('transferSize', e.get('encodedDataLength')) or 0, e.get('decodedBodySize') or 0)
+                        for e in entries], dtype=float)
+    start, duration, end, transfer, decoded = columns.T
+    end = np.where(end > 0, end, start + duration)
+    size = np.maximum(transfer, decoded)
+
+    # Integer codes per distinct URL, host and initiator; URLs are parsed once each
+    url_codes, host_codes, initiator_codes = {}, {}, {}
+    url_index = np.fromiter((url_codes.setdefault(e['name'], len(url_codes)) for e in entries), np.intp, n)
+    hosts = [url_host(url) for url in url_codes]
+    host_index = np.fromiter((host_codes.setdefault(h, len(host_codes)) for h in hosts), np.intp, len(hosts))[url_index]
+    initiator_index = np.fromiter((initiator_codes.setdefault(e.get('initiatorType') or 'other', len(initiator_codes))
+                                   for e in entries), np.intp, n)
+    host_labels, initiator_labels, urls = list(host_codes), list(initiator_codes), list(url_codes)
+
+    page_domain = registrable_domain(url_host(page_url)) if page_url else None
+    third_party_hosts = np.array([bool(page_domain) and registrable_domain(h) != page_domain for h in host_labels])
+    third_party = third_party_hosts[host_index]
+
+    statuses = [e.get('renderBlockingStatus') for e in entries]
+    if any(statuses):
+        blocking = np.array([status == 'blocking' for status in statuses])
+    elif first_paint:
+        # Browsers without renderBlockingStatus: stylesheets and scripts finished before first paint
+        blocking_initiators = np.array([label in ('link', 'css', 'script') for label in initiator_labels])
+        blocking = blocking_initiators[initiator_index] & (end <= first_paint)
+    else:
+        blocking = np.zeros(n, dtype=bool)
+
+    fetches = np.bincount(url_index, minlength=len(urls))
+    duplicate = fetches[url_index] > 1
+    slow = duration >= slow_ms
+    large = size >= large_bytes
+    reasons = (('slow', slow), ('large', large), ('blocking', blocking), ('duplicate', duplicate))
+
+    flagged = np.flatnonzero(slow | large | blocking | duplicate)
+    flagged = flagged[np.argsort(-duration[flagged], kind='stable')][:limit]
+
+    duplicate_urls = np.flatnonzero(fetches > 1)
+    wasted = np.bincount(url_index, weights=transfer, minlength=len(urls)) * (fetches - 1) / np.maximum(fetches, 1)
+    duplicate_urls = duplicate_urls[np.argsort(-fetches[duplicate_urls], kind='stable')][:limit]
+
+    # Peak concurrency: sweep start (+1) and end (-1) events, ends first on ties
+    events = np.concatenate([start, end])
+    deltas = np.concatenate([np.ones(n, dtype=np.intp), -np.ones(n, dtype=np.intp)])
+    peak = int(np.cumsum(deltas[np.lexsort((deltas, events))]).max())
+
+    # Critical path: from the last resource to finish, repeatedly step back to the
+    # resource that finished last strictly before it started. Zero-duration and
+    # unfinished entries end where they start, so they never lead back to themselves
+    by_end = np.argsort(end, kind='stable')
+    sorted_end = end[by_end]
+    path = [int(np.argmax(end))]
+    on_path = set(path)
+    while len(path) < 50:
+        previous = np.searchsorted(sorted_end, start[path[-1]], side='left') - 1
+        while previous >= 0 and int(by_end[previous]) in on_path:
+            previous -= 1
+        if previous < 0:
+            break
+        path.append(int(by_end[previous]))
+        on_path.add(path[-1])
+    path.reverse()
+
+    def describe(i):
+        return {'name': entries[i]['name'], 'initiator': initiator_labels[initiator_index[i]],
+                'start': round(float(start[i]), 1), 'end': round(float(end[i]), 1),
+                'duration': round(float(duration[i]), 1), 'transfer_size': int(transfer[i])}
+
+    return {
+        'count': n,
+        'span': round(float(end.max() - start.min()), 1),
+        'peak_concurrency': peak,
+        'critical_path': [describe(i) for i in path],
+        'critical_path_duration': round(float(end[path[-1]] - start[path[0]]), 1),
+        'flags': {name: int(mask.sum()) for name, mask in reasons},
+        'flagged': [dict(describe(i), reasons=[name for name, mask in reasons if mask[i]]) for i in flagged],
+        'duplicates': [{'name': urls[i], 'count': int(fetches[i]), 'wasted_bytes': int(wasted[i])}
+                       for i in duplicate_urls],
+        'by_domain': _aggregate(host_index, host_labels, len(host_labels), transfer, duration, limit),
+        'by_initiator': _aggregate(initiator_index, initiator_labels, len(initiator_labels), transfer, duration, limit),
+        'third_party': {
+            'count': int(third_party.sum()),
+            'transfer_size': int(transfer[third_party].sum()),
+            'total_duration': round(float(duration[third_party].sum()), 1),
+            'blocking': int((third_party & blocking).sum()),
+            'byte_share': round(float(transfer[third_party].sum() / transfer.sum()), 3) if transfer.sum() else 0.0,
+            'domains': sorted(h for h, third in zip(host_labels, third_party_hosts) if third)[:limit]
+        }
+    }
+
+def collect_performance_metrics(driver, network_requests=None):
+    """Collect Navigation Timing phases, paints, Web Vitals, long tasks and resource aggregates"""
+    try:
+        metrics = driver.execute_script(PERFORMANCE_METRICS_SCRIPT)
+    except Exception as e:
+        print(f"{Colors.RED}Failed to collect performance metrics: {str(e)}{Colors.ENDC}")
+        metrics = None
+    if not isinstance(metrics, dict):
+        metrics = {'navigation': None, 'paint': None, 'vitals': None, 'long_tasks': None}
+    metrics['resources'] = summarize_resources(network_requests)
+    return metrics
+
+# Serializes the DOM in the browser and returns only its length and a prefix
+PAGE_EXCERPT_SCRIPT = """
+    const root = document.documentElement;
+    const doctype = document.doctype ? new XMLSerializer().serializeToString(document.doctype) : '';
+    const html = doctype + (root ? root.outerHTML : '');
+    if (arguments[1]) { window.__aidocSnapshot = html; }
+    // Lengths count UTF-16 code units; never end on the first half of a surrogate pair
+    let end = arguments[0];
+    const last = html.charCodeAt(end - 1);
+    if (end < html.length && last >= 0xD800 && last <= 0xDBFF) { end -= 1; }
+    return {length: html.length, excerpt: html.slice(0, end)};
+"""
+
+# Returns the next snapshot chunk and where it ended, moved back off a split surrogate pair
+DOM_SNAPSHOT_CHUNK_SCRIPT = """
+    const html = window.__aidocSnapshot || '';
+    const start = arguments[0];
+    let end = Math.min(arguments[1], html.length);
+    const last = html.charCodeAt(end - 1);
+    if (end < html.length && end - 1 > start && last >= 0xD800 && last <= 0xDBFF) { end -= 1; }
+    return {text: html.slice(start, end), end: end};
+"""
+
+def capture_page_excerpt(driver, excerpt_length=1000, snapshot_path=None, chunk_size=1024 * 1024):
+    """Fetch a DOM excerpt without pulling the whole page source over WebDriver
+
+    With snapshot_path, the full DOM is also streamed to a gzip file in chunks.
+    Returns (excerpt, length).
+    """
+    result = driver.execute_script(PAGE_EXCERPT_SCRIPT, excerpt_length, bool(snapshot_path))
+    return excerpt_from_result(driver, result, excerpt_length, snapshot_path, chunk_size)
+
+def excerpt_from_result(driver, result, excerpt_length=1000, snapshot_path=None, chunk_size=1024 * 1024):
+    """Turn a PAGE_EXCERPT_SCRIPT result into (excerpt, length), falling back to page_source"""
+    if isinstance(result, dict) and 'length' in result:
+        length = result['length']
+        excerpt = result['excerpt'] + "..." if length > excerpt_length else result['excerpt']
+        if snapshot_path:
+            write_dom_snapshot(driver, snapshot_path, length, chunk_size)
+        return excerpt, length
+
+    # Script execution unavailable: fall back to a single page_source transfer
+    page_source = driver.page_source
+    if snapshot_path:
+        os.makedirs(os.path.dirname(snapshot_path) or '.', exist_ok=True)
+        with gzip.open(snapshot_path, 'wt', encoding='utf-8') as f:
+            f.write(page_source)
+    excerpt = page_source[:excerpt_length] + "..." if len(page_source) > excerpt_length else page_source
+    return excerpt, len(page_source)
+
+def write_dom_snapshot(driver, snapshot_path, length, chunk_size=1024 * 1024):
+    """Stream the DOM serialized by PAGE_EXCERPT_SCRIPT to a gzip file chunk by chunk"""
+    os.makedirs(os.path.dirname(snapshot_path) or '.', exist_ok=True)
+    try:
+        with gzip.open(snapshot_path, 'wt', encoding='utf-8') as f:
+            start = 0
+            while start < length:
+                chunk = driver.execute_script(DOM_SNAPSHOT_CHUNK_SCRIPT, start, start + chunk_size)
+                f.write(chunk['text'])
+                if chunk['end'] <= start:
+                    break
+                start = chunk['end']
+    finally:
+        driver.execute_script("delete window.__aidocSnapshot;")
+    return snapshot_path
+
+def dom_snapshot_path(url, snapshot_dir="reports/dom"):
+    """Build a collision-free snapshot filename for a URL"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    url_hash = hashlib.sha1(url.encode('utf-8')).hexdigest()[:10]
+    return f"{snapshot_dir}/dom_{url_hash}_{timestamp}.html.gz"
+
+LOCATION_SCRIPT = """
+    return {url: location.href, title: document.title};
+"""
+
+RESOURCE_TIMING_SCRIPT = """
+    const performance = window.performance || window.mozPerformance || window.msPerformance || window.webkitPerformance || {};
+    const network = performance.getEntriesByType ? performance.getEntriesByType("resource") : [];
+    return network.map(entry => ({
+        name: entry.name,
+        duration: entry.duration,
+        startTime: entry.startTime,
+        responseEnd: entry.responseEnd,
+        initiatorType: entry.initiatorType,
+        transferSize: entry.transferSize,
+        encodedBodySize: entry.encodedBodySize,
+        decodedBodySize: entry.decodedBodySize,
+        renderBlockingStatus: entry.renderBlockingStatus,
+        responseStatus: entry.responseStatus
+    }));
+"""
+
+LOCAL_STORAGE_SCRIPT = """
+    let items = {};
+    for (let i = 0; i < localStorage.length; i++) {
+        const key = localStorage.key(i);
+        items[key] = localStorage.getItem(key);
+    }
+    return items;
+"""
+
+# Probes that can be combined into one execute_script round trip. Each entry
+# is (version, function body); bump the version when a probe's output changes
+# shape so consumers can tell old and new payloads apart.
+PROBE_SCHEMA_VERSION = 1
+PAGE_PROBES = {
+    'location': (1, LOCATION_SCRIPT),
+    'excerpt': (1, PAGE_EXCERPT_SCRIPT),
+    'network': (2, RESOURCE_TIMING_SCRIPT),
+    'js_errors': (2, JS_ERROR_DRAIN_SCRIPT),
+    'performance': (1, PERFORMANCE_METRICS_SCRIPT),
+    'local_storage': (1, LOCAL_STORAGE_SCRIPT),
+}
+
+_probe_scripts = {}
+
+def build_probe_script(names):
+    """Combine the named probes into one script taking a list of per-probe arguments"""
+    names = tuple(names)
+    script = _probe_scripts.get(names)
+    if script is None:
+        calls = []
+        for index, name in enumerate(names):
+            version, body = PAGE_PROBES[name]
+            calls.append(f"run({json.dumps(name)}, {version}, function() {{{body}}}, args[{index}]);")
+        script = (
+            "const args = arguments[0];\n"
+            f"const result = {{schema: {PROBE_SCHEMA_VERSION}, probes: {{}}}};\n"
+            "function run(name, version, probe, probeArgs) {\n"
+            "    try { result.probes[name] = {version: version, value: probe.apply(null, probeArgs || [])}; }\n"
+            "    catch (e) { result.probes[name] = {version: version, error: String(e)}; }\n"
+            "}\n"
+            + "\n".join(calls) +
+            "\nreturn result;"
+        )
+        _probe_scripts[names] = script
+    return script
+
+def collect_page_probes(driver, probes):
+    """Run several probes in a single round trip
+
+    probes maps probe names to their argument lists. Returns {name: value} for
+    the probes that ran; failed or unrecognized probes are left out so callers
+    can fall back to individual calls.
+    """
+    names = list(probes)
+    result = driver.execute_script(build_probe_script(names), [probes[name] for name in names])
+    if not isinstance(result, dict) or result.get('schema') != PROBE_SCHEMA_VERSION:
+        return {}
+    values = {}
+    for name, probe in (result.get('probes') or {}).items():
+        if name not in PAGE_PROBES or probe.get('version') != PAGE_PROBES[name][0]:
+            continue
+        if 'error' in probe:
+            print(f"{Colors.YELLOW}Probe {name} failed: {probe['error']}{Colors.ENDC}")
+            continue
+        values[name] = probe.get('value')
+    return values
+
+def capture_page_state(driver, url, error_collector=None, snapshot_path=None, extra_probes=()):
+    """Capture detailed information about the current page state
+
+    Everything is collected in one execute_script call; extra_probes (e.g.
+    'performance', 'local_storage') are added to the same payload and stored
+    under their own keys.
+    """
+    probes = {
+        'location': [],
+        'excerpt': [1000, bool(snapshot_path)],
+        'network': [],
+        'js_errors': error_collector.drain_args() if error_collector is not None else [0, None],
+    }
+    for name in extra_probes:
+        probes[name] = []
+    values = collect_page_probes(driver, probes)
+
+    location = values.get('location') or {'url': driver.current_url, 'title': driver.title}
+    if 'excerpt' in values:
+        excerpt, source_length = excerpt_from_result(driver, values['excerpt'], snapshot_path=snapshot_path)
+    else:
+        excerpt, source_length = capture_page_excerpt(driver, snapshot_path=snapshot_path)
+    state = {
+        "url": location['url'],
+        "title": location['title'],
+        "page_source_excerpt": excerpt,
+        "page_source_length": source_length
+    }
+    if snapshot_path:
+        state["dom_snapshot"] = snapshot_path
+    
+    # Capture network state using JavaScript
+    if 'network' in values:
+        network_state = values['network']
+    else:
+        network_state = driver.execute_script(RESOURCE_TIMING_SCRIPT)
+    
+    state["network_requests"] = network_state
+    
+    # Capture JavaScript errors
+    if error_collector is not None:
+        if 'js_errors' in values:
+            error_collector.consume(values['js_errors'])
+        else:
+            error_collector.drain()
+        js_errors = list(error_collector.errors)
+        state["js_errors_dropped"] = error_collector.dropped
+    else:
+        drained = values.get('js_errors')
+        js_errors = drained['entries'] if isinstance(drained, dict) else driver.execute_script("""
+            return window.__aidoc ? window.__aidoc.drain(0).entries : (window.jsErrors || []);
+        """)
+    
+    state["js_errors"] = js_errors
+
+    if 'performance' in extra_probes:
+        if isinstance(values.get('performance'), dict):
+            metrics = values['performance']
+            metrics['resources'] = summarize_resources(network_state)
+        else:
+            metrics = collect_performance_metrics(driver, network_state)
+        metrics['waterfall'] = analyze_waterfall(network_state, state['url'],
+                                                 (metrics.get('paint') or {}).get('first_paint'))
+        state["performance"] = metrics
+    if 'local_storage' in extra_probes:
+        state["local_storage"] = values.get('local_storage')
+    
+    return state
+
+PERFORMANCE_MEMORY_SCRIPT = """
+const memory = performance.memory;
+return memory ? {used: memory.usedJSHeapSize, total: memory.totalJSHeapSize} : null;
+"""
+
+# measureUserAgentSpecificMemory only exists on cross-origin isolated pages and may wait for a GC
+UA_MEMORY_AVAILABLE_SCRIPT = """
+return window.crossOriginIsolated === true && typeof performance.measureUserAgentSpecificMemory === 'function';
+"""
+
+UA_MEMORY_SCRIPT = """
+const done = arguments[arguments.length - 1];
+if (!window.crossOriginIsolated || !performance.measureUserAgentSpecificMemory) {
+    done(null);
+    return;
+}
+const timeout = new Promise(resolve => setTimeout(() => resolve({error: 'timeout'}), arguments[0]));
+Promise.race([performance.measureUserAgentSpecificMemory(), timeout]).then(result => {
+    if (result.error) { done(result); return; }
+    done({
+        bytes: result.bytes,
+        breakdown: result.breakdown.filter(item => item.bytes).slice(0, 20).map(item => ({
+            bytes: item.bytes,
+            types: item.types,
+            urls: item.attribution.map(a => a.url)
+        }))
+    });
+}, error => done({error: String(error)}));
+"""
+
+def leak_slope(points):
+    """Least-squares slope of (seconds, bytes) points, in MB per minute"""
+    if len(points) < 2:
+        return None
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    variance = sum((t - mean_t) ** 2 for t, _ in points)
+    if not variance:
+        return None
+    slope = sum((t - mean_t) * (v - mean_v) for t, v in points) / variance
+    return slope * 60 / 1024 / 1024
+
+class BrowserMemoryProfiler:
+    """Samples the memory of the browser under test on a background thread
+
+    Each sample records the RSS of Chrome's process tree (and of its renderer
+    processes) and the page's JavaScript heap, read from the DevTools protocol
+    or performance.memory. Samples taken after the page has loaded are used to
+    estimate a leak slope.
+
+    WebDriver runs one command at a time, so a heap read issued during
+    driver.get would wait for the load to finish. Load-phase samples therefore
+    hold process RSS only, read with psutil, and the heap is sampled once the
+    page has loaded.
+    """
+
+    def __init__(self, driver, interval=0.5, max_samples=1200, leak_threshold=1.0, min_leak_samples=5):
+        self.driver = driver
+        self.interval = interval
+        self.leak_threshold = leak_threshold
+        self.min_leak_samples = min_leak_samples
+        self.samples = deque(maxlen=max_samples)
+        self.phase = 'load'
+        self.ua_memory = None
+        self._started = None
+        self._root = None
+        self._renderers = {}
+        self._heap_source = 'cdp'
+        self._stop = threading.Event()
+        self._thread = None
+
+    def browser_processes(self):
+        """Return chromedriver's Chrome process tree, or an empty list for remote drivers"""
+        import psutil
+        if self._root is None:
+            try:
+                self._root = psutil.Process(self.driver.service.process.pid)
+            except Exception:
+                self._root = False
+        if not self._root:
+            return []
+        try:
+            return self._root.children(recursive=True)
+        except psutil.Error:
+            return []
+
+    def _is_renderer(self, process):
+        import psutil
+        if process.pid not in self._renderers:
+            try:
+                self._renderers[process.pid] = '--type=renderer' in process.cmdline()
+            except psutil.Error:
+                return False
+        return self._renderers[process.pid]
+
+    def js_heap(self):
+        """Return (used, total) JS heap bytes of the current page, or (None, None)"""
+        if self._heap_source == 'cdp':
+            try:
+                usage = self.driver.execute_cdp_cmd('Runtime.getHeapUsage', {})
+                return usage['usedSize'], usage['totalSize']
+            except Exception:
+                self._heap_source = 'script'
+        if self._heap_source == 'script':
+            try:
+                memory = self.driver.execute_script(PERFORMANCE_MEMORY_SCRIPT)
+                if isinstance(memory, dict):
+                    return memory['used'], memory['total']
+            except Exception:
+                pass
+            self._heap_source = None
+        return None, None
+
+    def sample(self):
+        """Record one sample and return it"""
+        import psutil
+        browser_rss = renderer_rss = 0
+        processes = self.browser_processes()
+        for process in processes:
+            try:
+                rss = process.memory_info().rss
+            except psutil.Error:
+                continue
+            browser_rss += rss
+            if self._is_renderer(process):
+                renderer_rss += rss
+        heap_used, heap_total = self.js_heap() if self.phase != 'load' else (None, None)
+        sample = {
+            't': round(time.time() - (self._started or time.time()), 3),
+            'phase': self.phase,
+            'browser_rss': browser_rss if processes else None,
+            'renderer_rss': renderer_rss if processes else None,
+            'js_heap_used': heap_used,
+            'js_heap_total': heap_total
+        }
+        self.samples.append(sample)
+        return sample
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception:
+                # A failed sample (e.g. the window closed) must not end the profile
+                pass
+
+    def start(self):
+        self._started = time.time()
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name='aidoc-memory', daemon=True)
+        self._thread.start()
+        return self
+
+    def mark_loaded(self):
+        """Samples from now on describe the settled page and feed leak detection"""
+        self.phase = 'idle'
+
+    def cancel(self):
+        """Stop sampling without the final measurements, e.g. when the page failed"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def stop(self, measure_timeout_ms=5000):
+        """Stop sampling, take a final sample and the UA-specific memory breakdown"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.sample()
+        self.ua_memory = None
+        try:
+            # Without cross-origin isolation the measurement is unavailable; don't wait for it
+            if not self.driver.execute_script(UA_MEMORY_AVAILABLE_SCRIPT):
+                return
+            previous_timeout = self.driver.timeouts.script
+        except Exception:
+            return
+        try:
+            self.driver.set_script_timeout(measure_timeout_ms / 1000 + 5)
+            self.ua_memory = self.driver.execute_async_script(UA_MEMORY_SCRIPT, measure_timeout_ms)
+        except Exception:
+            self.ua_memory = None
+        finally:
+            # Later async scripts on this driver (axe, pooled pages) keep their own limit
+            try:
+                self.driver.set_script_timeout(previous_timeout)
+            except Exception:
+                pass
+
+    def summary(self):
+        """Time series, peaks and leak estimate of the recorded samples"""
+        samples = list(self.samples)
+        keys = ('browser_rss', 'renderer_rss', 'js_heap_used', 'js_heap_total')
+        peak = {key: max((s[key] for s in samples if s[key] is not None), default=None) for key in keys}
+        metric = 'js_heap_used' if any(s['js_heap_used'] is not None for s in samples) else 'renderer_rss'
+        points = [(s['t'], s[metric]) for s in samples if s['phase'] == 'idle' and s[metric] is not None]
+        slope = leak_slope(points) if len(points) >= self.min_leak_samples else None
+        return {
+            'samples': samples,
+            'peak': peak,
+            'leak': {
+                'metric': metric,
+                'slope_mb_per_min': round(slope, 3) if slope is not None else None,
+                'suspected': slope is not None and slope >= self.leak_threshold,
+                'samples': len(points)
+            },
+            'ua_memory': self.ua_memory
+        }
+
+def inject_error_listeners(driver, capacity=1000):
+    """Inject JavaScript to capture errors and unhandled rejections"""
+    driver.execute_script(ERROR_LISTENER_SCRIPT.replace('__CAPACITY__', str(int(capacity))))
+
+def _format_ms(value):
+    return f"{value:.0f}ms" if isinstance(value, (int, float)) else "n/a"
+
+def print_performance_metrics(metrics):
+    """Print navigation phases, Web Vitals and resource totals"""
+    if not metrics:
+        return
+    navigation = metrics.get('navigation')
+    if navigation:
+        print(f"{Colors.BOLD}Navigation:{Colors.ENDC} DNS {_format_ms(navigation['dns'])}, "
+              f"TCP {_format_ms(navigation['tcp'])}, TTFB {_format_ms(navigation['ttfb'])}, "
+              f"DOMContentLoaded {_format_ms(navigation['dom_content_loaded'])}, "
+              f"Load {_format_ms(navigation['load'])}")
+    vitals = metrics.get('vitals')
+    if vitals:
+        cls = f"{vitals['cls']:.3f}" if isinstance(vitals.get('cls'), (int, float)) else "n/a"
+        print(f"{Colors.BOLD}Web Vitals:{Colors.ENDC} LCP {_format_ms(vitals.get('lcp'))}, "
+              f"CLS {cls}, INP {_format_ms(vitals.get('inp'))}")
+    long_tasks = metrics.get('long_tasks')
+    if long_tasks:
+        print(f"{Colors.BOLD}Long Tasks:{Colors.ENDC} {long_tasks['count']} "
+              f"(total {_format_ms(long_tasks['total'])}, max {_format_ms(long_tasks['max'])})")
+    totals = metrics.get('resources', {}).get('totals')
+    if totals and totals['count']:
+        print(f"{Colors.BOLD}Resources:{Colors.ENDC} {totals['count']} requests, "
+              f"{totals['transfer_size'] / 1024:.1f} KB transferred")
+    waterfall = metrics.get('waterfall')
+    if waterfall:
+        flags = waterfall['flags']
+        third_party = waterfall['third_party']
+        print(f"{Colors.BOLD}Waterfall:{Colors.ENDC} {len(waterfall['critical_path'])} resources on the critical path "
+              f"({_format_ms(waterfall['critical_path_duration'])}), peak {waterfall['peak_concurrency']} in flight, "
+              f"{flags['slow']} slow, {flags['large']} large, {flags['blocking']} blocking, "
+              f"{flags['duplicate']} duplicate")
+        if third_party['count']:
+            print(f"{Colors.BOLD}Third Parties:{Colors.ENDC} {third_party['count']} requests from "
+                  f"{len(third_party['domains'])} domain(s), {third_party['transfer_size'] / 1024:.1f} KB "
+                  f"({third_party['byte_share']:.0%} of bytes)")
+        for resource in waterfall['flagged'][:5]:
+            print(f"  {Colors.YELLOW}{', '.join(resource['reasons'])}{Colors.ENDC} "
+                  f"{_format_ms(resource['duration'])} {resource['name']}")
+
+def print_blocked_requests(blocked, request_cache=None):
+    """Print how many requests were blocked, by type and domain, and cache hits"""
+    if blocked:
+        by_type = ', '.join(f"{name} {count}" for name, count in sorted(blocked['by_type'].items(), key=lambda i: -i[1]))
+        print(f"{Colors.BOLD}Blocked Requests:{Colors.ENDC} {blocked['count']}" + (f" ({by_type})" if by_type else ""))
+        for domain, count in list(blocked['by_domain'].items())[:5]:
+            print(f"  {count:5} {domain}")
+    if request_cache:
+        print(f"{Colors.BOLD}Cached Responses:{Colors.ENDC} {request_cache['hits']} "
+              f"({request_cache['saved_bytes'] / 1024:.1f} KB not downloaded)")
+
+def print_report(page_info, console_handler, total_time):
+    print(f"\n{Colors.CYAN}{'='*80}{Colors.ENDC}")
+    print(f"{Colors.BOLD}{Colors.CYAN}DETAILED ANALYSIS REPORT{Colors.ENDC}")
+    print(f"{Colors.CYAN}{'='*80}{Colors.ENDC}")
+    
+    print(f"\n{Colors.BOLD}1. Timing Information:{Colors.ENDC}")
+    print(f"{Colors.BOLD}Page Load Time:{Colors.ENDC} {page_info['load_time']:.2f}s")
+    print(f"{Colors.BOLD}Total Analysis Time:{Colors.ENDC} {total_time:.2f}s")
+    print_performance_metrics(page_info.get('performance'))
+    print_blocked_requests(page_info.get('blocked_requests'), page_info.get('request_cache'))
+    
+    print(f"\n{Colors.BOLD}2. Page Information:{Colors.ENDC}")
+    print(f"{Colors.BOLD}URL:{Colors.ENDC} {page_info['url']}")
+    print(f"{Colors.BOLD}Page Title:{Colors.ENDC} {page_info['title']}")
+    
+    print(f"\n{Colors.BOLD}3. Console Errors and Warnings:{Colors.ENDC}")
+    for line in console_handler.iter_formatted_logs():
+        print(line)
+
+def build_chrome_options(interactive=False, network_log=False):
+    """Build the Chrome options shared by single and batch runs"""
+    from selenium.webdriver.chrome.options import Options
+    chrome_options = Options()
+    if not interactive:
+        chrome_options.add_argument('--headless')  # Run in headless mode only if not interactive
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    if network_log:
+        # Network events only, so the main document's response headers can be read back
+        chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        chrome_options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+    return chrome_options
+
+def create_driver(**kwargs):
+    """Start a Chrome WebDriver configured for analysis"""
+    from selenium import webdriver
+    return webdriver.Chrome(options=build_chrome_options(kwargs.get('interactive', False),
+                                                         network_log=kwargs.get('enable_security', False)))
+
+def reset_driver_state(driver, keep_cache=False):
+    """Clear cookies, storage and pending logs so a pooled driver starts clean
+
+    With keep_cache the HTTP cache survives, so static assets fetched for one
+    page are reused by the next.
+    """
+    try:
+        driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        if not keep_cache:
+            driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+    except Exception:
+        # Not a Chromium driver, fall back to the current-domain cookies
+        driver.delete_all_cookies()
+    driver.execute_script("""
+        try { localStorage.clear(); } catch (e) {}
+        try { sessionStorage.clear(); } catch (e) {}
+    """)
+    driver.get('about:blank')
+    # Drain whatever the previous page left in the browser log buffer
+    driver.get_log('browser')
+
+# Resource types that can be blocked: (CDP resource type, file extensions used
+# where only URL patterns are available, as with Network.setBlockedURLs)
+BLOCKABLE_RESOURCE_TYPES = {
+    'image': ('Image', ('png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico', 'bmp')),
+    'font': ('Font', ('woff', 'woff2', 'ttf', 'otf', 'eot')),
+    'media': ('Media', ('mp4', 'webm', 'ogv', 'ogg', 'mp3', 'wav', 'm4a', 'mov', 'm3u8')),
+    'stylesheet': ('Stylesheet', ('css',)),
+}
+RESOURCE_TYPE_EXTENSIONS = dict({'js': 'script', 'mjs': 'script'}, **{
+    extension: name for name, (_, extensions) in BLOCKABLE_RESOURCE_TYPES.items() for extension in extensions})
+
+# Analytics, tag manager and ad hosts blocked by --block-trackers
+TRACKER_DOMAINS = (
+    'google-analytics.com', 'googletagmanager.com', 'googlesyndication.com', 'googleadservices.com',
+    'doubleclick.net', 'adservice.google.com', 'connect.facebook.net', 'amazon-adsystem.com', 'adnxs.com',
+    'criteo.com', 'criteo.net', 'taboola.com', 'outbrain.com', 'scorecardresearch.com', 'quantserve.com',
+    'hotjar.com', 'clarity.ms', 'bat.bing.com', 'mixpanel.com', 'segment.io', 'cdn.segment.com',
+    'amplitude.com', 'fullstory.com', 'heap.io', 'heapanalytics.com', 'optimizely.com', 'nr-data.net',
+)
+
+# Chrome's error for a load the client blocked, as logged to the console
+BLOCKED_REQUEST_ERROR = 'net::ERR_BLOCKED_BY_CLIENT'
+
+# Static resources shared across pages that the CDP engine serves from its cache
+CACHEABLE_RESOURCE_TYPES = ('Script', 'Stylesheet', 'Image', 'Font')
+
+def guess_resource_type(url):
+    """Resource type of a URL judged by its file extension, or 'other'"""
+    path = url.split('#', 1)[0].split('?', 1)[0].rsplit('/', 1)[-1]
+    if '.' not in path:
+        return 'other'
+    return RESOURCE_TYPE_EXTENSIONS.get(path.rsplit('.', 1)[-1].lower(), 'other')
+
+class RequestFilter:
+    """Domain and resource type blocklists for the requests pages make
+
+    A blocked domain also blocks its subdomains. Types match the resource
+    type the browser reports, or the file extension where it reports none.
+    """
+
+    def __init__(self, domains=(), types=()):
+        unknown = set(types) - set(BLOCKABLE_RESOURCE_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown resource types: {', '.join(sorted(unknown))}")
+        self.domains = tuple(sorted({domain.strip().strip('.').lower() for domain in domains if domain.strip()}))
+        self.types = tuple(sorted(set(types)))
+
+    def __bool__(self):
+        return bool(self.domains or self.types)
+
+    def match(self, url, resource_type=None):
+        """Return why url is blocked ('domain' or 'type'), or None"""
+        host = url_host(url)
+        for domain in self.domains:
+            if host == domain or host.endswith('.' + domain):
+                return 'domain'
+        resource_type = resource_type.lower() if resource_type else guess_resource_type(url)
+        return 'type' if resource_type in self.types else None
+
+    def domain_patterns(self):
+        return [pattern for domain in self.domains for pattern in (f"*://{domain}/*", f"*://*.{domain}/*")]
+
+    def url_patterns(self):
+        """Wildcard URL patterns for Network.setBlockedURLs"""
+        patterns = self.domain_patterns()
+        for name in self.types:
+            for extension in BLOCKABLE_RESOURCE_TYPES[name][1]:
+                patterns += [f"*.{extension}", f"*.{extension}?*"]
+        return patterns
+
+def fetch_patterns(request_filter=None, cache=False):
+    """Fetch.enable patterns pausing the requests to block and the static assets to cache"""
+    patterns = []
+    if request_filter:
+        patterns += [{'urlPattern': pattern, 'requestStage': 'Request'}
+                     for pattern in request_filter.domain_patterns()]
+        patterns += [{'urlPattern': '*', 'resourceType': BLOCKABLE_RESOURCE_TYPES[name][0], 'requestStage': 'Request'}
+                     for name in request_filter.types]
+    if cache:
+        patterns += [{'urlPattern': 'http*', 'resourceType': resource_type, 'requestStage': stage}
+                     for resource_type in CACHEABLE_RESOURCE_TYPES for stage in ('Request', 'Response')]
+    return patterns
+
+def apply_request_filter(driver, request_filter):
+    """Block the filter's URL patterns in a driver, once per driver; False without CDP"""
+    if getattr(driver, '_aidoc_request_filter', None) is request_filter:
+        return True
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': request_filter.url_patterns()})
+    except Exception:
+        return False
+    driver._aidoc_request_filter = request_filter
+    return True
+
+def blocked_request_from_log(log, request_filter):
+    """Return the blocked request a browser log entry reports, or None for other entries"""
+    message = log.get('message') or ''
+    if BLOCKED_REQUEST_ERROR not in message:
+        return None
+    url = message.split(' ', 1)[0]
+    resource_type = guess_resource_type(url)
+    return {'url': url, 'type': resource_type, 'domain': url_host(url),
+            'reason': request_filter.match(url, resource_type) or 'client'}
+
+def summarize_blocked_requests(blocked, limit=50):
+    """Count blocked requests per type, reason and domain, keeping the first limit of them"""
+    by_type, by_reason, by_domain = {}, {}, {}
+    for request in blocked:
+        by_type[request['type']] = by_type.get(request['type'], 0) + 1
+        by_reason[request['reason']] = by_reason.get(request['reason'], 0) + 1
+        by_domain[request['domain']] = by_domain.get(request['domain'], 0) + 1
+    return {
+        'count': len(blocked),
+        'by_type': by_type,
+        'by_reason': by_reason,
+        'by_domain': dict(sorted(by_domain.items(), key=lambda item: -item[1])[:limit]),
+        'requests': blocked[:limit]
+    }
+
+class ResponseCache:
+    """LRU of static responses shared by the pages of a batch, bounded by size
+
+    Bodies are kept base64-encoded, as Fetch.fulfillRequest takes them, while
+    max_bytes bounds their decoded size, so the cache holds about 4/3 of it in
+    memory. Only complete 200 responses are stored and no-store responses are
+    skipped.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, url):
+        entry = self._entries.get(url)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(url)
+        self.hits += 1
+        return entry
+
+    def put(self, url, headers, body, base64_encoded=True):
+        """Store a response body, dropping the least recently used entries to stay in bounds
+
+        Sizes are the decoded body lengths, whichever form the body came in.
+        """
+        if any(h['name'].lower() == 'cache-control' and 'no-store' in h['value'].lower() for h in headers):
+            return False
+        if base64_encoded:
+            size = len(body) * 3 // 4 - body[-2:].count('=')
+        else:
+            raw = body.encode('utf-8')
+            size = len(raw)
+            body = base64.b64encode(raw).decode('ascii')
+        if size > self.max_bytes:
+            return False
+        # The body is already decoded, so the transfer encoding headers no longer apply
+        headers = [h for h in headers if h['name'].lower() not in ('content-encoding', 'content-length')]
+        previous = self._entries.pop(url, None)
+        if previous:
+            self.size -= previous['size']
+        self._entries[url] = {'headers': headers, 'body': body, 'size': size}
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted['size']
+        return True
+
+# Reads the current origin's storage, skipping the marker left by a restore
+SESSION_CAPTURE_SCRIPT = """
+    const dump = storage => {
+        const items = {};
+        for (let i = 0; i < storage.length; i++) {
+            const key = storage.key(i);
+            if (key !== '__aidocSessionRestored') { items[key] = storage.getItem(key); }
+        }
+        return items;
+    };
+    return {origin: location.origin, local: dump(localStorage), session: dump(sessionStorage)};
+"""
+
+# Seeds saved storage into the matching origin before page scripts run, once
+# per tab; a reset clears the marker along with the storage
+SESSION_RESTORE_SCRIPT = """
+(function(saved) {
+    saved = saved[location.origin];
+    if (!saved) { return; }
+    try {
+        if (sessionStorage.getItem('__aidocSessionRestored')) { return; }
+        Object.keys(saved.local || {}).forEach(key => localStorage.setItem(key, saved.local[key]));
+        Object.keys(saved.session || {}).forEach(key => sessionStorage.setItem(key, saved.session[key]));
+        sessionStorage.setItem('__aidocSessionRestored', '1');
+    } catch (e) {}
+})(__STORAGE__);
+"""
+
+SESSION_FILE_MAGIC = b'AIDOC-SESSION-1\n'
+SESSION_COOKIE_FIELDS = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires')
+DEFAULT_SESSION_KEY_FILE = os.path.join('~', '.aidoc', 'session.key')
+
+def _cookie_param(cookie):
+    """Convert a Selenium or CDP cookie into a CDP Network.setCookies entry"""
+    cookie = dict(cookie)
+    if 'expiry' in cookie:
+        cookie['expires'] = cookie.pop('expiry')
+    if cookie.get('session') or (cookie.get('expires') or 0) <= 0:
+        cookie.pop('expires', None)
+    return {field: cookie[field] for field in SESSION_COOKIE_FIELDS if cookie.get(field) is not None}
+
+def capture_session(driver):
+    """Snapshot cookies for every domain plus the current origin's local and session storage"""
+    try:
+        cookies = driver.execute_cdp_cmd('Network.getAllCookies', {})['cookies']
+    except Exception:
+        # Without CDP only the current domain's cookies are visible
+        cookies = driver.get_cookies()
+    storage = driver.execute_script(SESSION_CAPTURE_SCRIPT) or {}
+    snapshot = {'version': 1, 'url': driver.current_url, 'saved_at': time.time(),
+                'cookies': [_cookie_param(c) for c in cookies], 'storage': {}}
+    if storage.get('origin'):
+        snapshot['storage'][storage['origin']] = {'local': storage.get('local') or {},
+                                                  'session': storage.get('session') or {}}
+    return snapshot
+
+def live_session_cookies(snapshot, now=None):
+    """Return the snapshot's cookies that have not expired"""
+    now = now or time.time()
+    return [c for c in snapshot.get('cookies', []) if 'expires' not in c or c['expires'] > now]
+
+def session_restore_script(snapshot):
+    return SESSION_RESTORE_SCRIPT.replace('__STORAGE__', json.dumps(snapshot.get('storage') or {}))
+
+def restore_session(driver, snapshot):
+    """Load a captured session into a driver before it visits a page
+
+    Cookies are set for all domains in one CDP call and storage is seeded by
+    an early script, so nothing extra is navigated. Cookies are set on every
+    call, because pooled drivers clear them between pages; the script is
+    registered once per driver. Without CDP the saved URL is visited to set
+    cookies and storage directly.
+    """
+    cookies = live_session_cookies(snapshot)
+    try:
+        driver.execute_cdp_cmd('Network.setCookies', {'cookies': cookies})
+    except Exception:
+        driver.get(snapshot['url'])
+        for cookie in cookies:
+            cookie = dict(cookie)
+            if 'expires' in cookie:
+                cookie['expiry'] = int(cookie.pop('expires'))
+            try:
+                driver.add_cookie(cookie)
+            except Exception:
+                # Cookies for other domains cannot be set from this page
+                pass
+        driver.execute_script(session_restore_script(snapshot))
+        return False
+    register_early_script(driver, 'session', session_restore_script(snapshot))
+    return True
+
+def _session_cipher(salt, key_file=None):
+    """Return a Fernet cipher keyed from $AIDOC_SESSION_KEY or a local key file"""
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError:
+        raise RuntimeError("Session files need the cryptography package (pip install aidoc[session])")
+    secret = os.environ.get('AIDOC_SESSION_KEY')
+    if not secret:
+        key_file = os.path.expanduser(key_file or DEFAULT_SESSION_KEY_FILE)
+        if not os.path.exists(key_file):
+            os.makedirs(os.path.dirname(key_file) or '.', exist_ok=True)
+            # Readable by the owner only, like an SSH key
+            fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                f.write(base64.urlsafe_b64encode(os.urandom(32)).decode('ascii'))
+        with open(key_file, 'r', encoding='utf-8') as f:
+            secret = f.read().strip()
+    key = hashlib.pbkdf2_hmac('sha256', secret.encode('utf-8'), salt, 200000)
+    return Fernet(base64.urlsafe_b64encode(key))
+
+def save_session(path, snapshot, key_file=None):
+    """Encrypt a session snapshot to path, readable by the owner only"""
+    salt = os.urandom(16)
+    token = _session_cipher(salt, key_file).encrypt(json.dumps(snapshot).encode('utf-8'))
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(SESSION_FILE_MAGIC + salt + token)
+    os.replace(temp_path, path)
+    return path
+
+def load_session(path, key_file=None):
+    """Decrypt a session file written by save_session"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(SESSION_FILE_MAGIC):
+        raise RuntimeError(f"{path} is not an aidoc session file")
+    salt = data[len(SESSION_FILE_MAGIC):len(SESSION_FILE_MAGIC) + 16]
+    token = data[len(SESSION_FILE_MAGIC) + 16:]
+    from cryptography.fernet import InvalidToken
+    try:
+        return json.loads(_session_cipher(salt, key_file).decrypt(token))
+    except InvalidToken:
+        raise RuntimeError(f"Cannot decrypt {path}: wrong session key or corrupted file")
+
+def ready_condition(selector=None, url_contains=None):
+    """Build an expected condition from a CSS selector and/or URL fragment, or None"""
+    if not selector and not url_contains:
+        return None
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    conditions = []
+    if selector:
+        conditions.append(EC.visibility_of_element_located((By.CSS_SELECTOR, selector)))
+    if url_contains:
+        conditions.append(EC.url_contains(url_contains))
+    return conditions[0] if len(conditions) == 1 else EC.all_of(*conditions)
+
+def wait_until_ready(driver, condition, timeout, poll_interval=2, on_poll=None):
+    """Wait up to timeout seconds for condition, calling on_poll every poll_interval
+
+    Returns True as soon as the condition holds, False on timeout.
+    """
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import TimeoutException
+    deadline = time.time() + timeout
+    while True:
+        try:
+            WebDriverWait(driver, max(0, min(poll_interval, deadline - time.time())),
+                          poll_frequency=0.25).until(condition)
+            return True
+        except TimeoutException:
+            if on_poll:
+                on_poll()
+            if time.time() >= deadline:
+                return False
+
+class DriverPool:
+    """Thread-safe pool of warm Chrome drivers reused across pages"""
+
+    def __init__(self, size=4, driver_factory=None, keep_cache=False, **kwargs):
+        self.size = max(1, size)
+        self.driver_factory = driver_factory or create_driver
+        self.keep_cache = keep_cache
+        self.driver_kwargs = kwargs
+        self._idle = queue.Queue()
+        self._drivers = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self):
+        """Return an idle driver, starting a new one while below the pool size"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("DriverPool is closed")
+            if len(self._drivers) < self.size:
+                driver = self.driver_factory(**self.driver_kwargs)
+                self._drivers.append(driver)
+                return driver
+        return self._idle.get()
+
+    def release(self, driver):
+        """Reset a driver and hand it back to the pool, replacing it if it broke"""
+        try:
+            reset_driver_state(driver, keep_cache=self.keep_cache)
+        except Exception as e:
+            print(f"{Colors.YELLOW}Discarding driver after failed reset: {str(e)}{Colors.ENDC}")
+            self.discard(driver)
+            return
+        self._idle.put(driver)
+
+    def discard(self, driver):
+        """Quit a driver and free its slot so a fresh one can be started"""
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        """Quit every driver owned by the pool"""
+        with self._lock:
+            self._closed = True
+            drivers, self._drivers = self._drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+class Tracer:
+    """Times the stages of the analysis pipeline
+
+    span() adds each stage's duration to a caller-supplied timings dict, which
+    travels with the page result. While recording, spans are also kept as
+    Chrome trace events that write_trace() saves for chrome://tracing or
+    Perfetto.
+    """
+
+    def __init__(self, max_events=200000):
+        self.recording = False
+        self.events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, timings=None, **args):
+        wall_start = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if timings is not None:
+                timings[name] = timings.get(name, 0) + elapsed
+            if self.recording:
+                event = {'name': name, 'cat': name.split('.')[0], 'ph': 'X',
+                         'ts': round(wall_start * 1e6), 'dur': round(elapsed * 1e6),
+                         'pid': os.getpid(), 'tid': threading.get_ident()}
+                if args:
+                    event['args'] = args
+                with self._lock:
+                    self.events.append(event)
+
+    def drain(self):
+        """Remove and return the recorded events"""
+        with self._lock:
+            events, self.events = list(self.events), deque(maxlen=self.events.maxlen)
+        return events
+
+    def write_trace(self, path):
+        """Save the recorded events in Chrome trace format and return the path"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        events = self.drain()
+        for pid in sorted({event['pid'] for event in events}):
+            name = 'aidoc' if pid == os.getpid() else f'aidoc worker {pid}'
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': name}})
+        with open(path, 'wb') as f:
+            f.write(dumps_json({'traceEvents': events, 'displayTimeUnit': 'ms'}))
+        return path
+
+tracer = Tracer()
+
+def print_stage_timings(timings, total_time=None):
+    """Print where the time went, slowest stage first"""
+    if not timings:
+        return
+    print(f"\n{Colors.BOLD}Stage Timings:{Colors.ENDC}")
+    for name, seconds in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+        share = f" ({seconds / total_time:.0%})" if total_time else ""
+        print(f"  {name:<28} {seconds:>8.3f}s{share}")
+
+def run_profiled(profiler, func, *args, **kwargs):
+    """Run func under cProfile or pyinstrument and save the profile under reports/"""
+    if not profiler:
+        return func(*args, **kwargs)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs('reports', exist_ok=True)
+    if profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise RuntimeError("--profile pyinstrument needs the pyinstrument package")
+        profile = Profiler()
+        profile.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.stop()
+            path = f"reports/profile_{timestamp}.html"
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profile.output_html())
+            print(profile.output_text(unicode=True, color=True))
+            print(f"{Colors.GREEN}Profile saved to: {path}{Colors.ENDC}")
+
+    import cProfile
+    import pstats
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profile.disable()
+        path = f"reports/profile_{timestamp}.prof"
+        profile.dump_stats(path)
+        pstats.Stats(profile).sort_stats('cumulative').print_stats(20)
+        print(f"{Colors.GREEN}Profile saved to: {path} (open with snakeviz or pstats){Colors.ENDC}")
+
+def analyze_page(driver, url, **kwargs):
+    """Load a URL in an existing driver and run the full analysis pass"""
+    page_start = time.time()
+
+    # Initialize console log handler
+    console_handler = ConsoleLogHandler(max_entries=kwargs.get('log_buffer'),
+                                        sink=kwargs.get('log_sink'),
+                                        page_url=url,
+                                        dedupe=kwargs.get('dedupe', False))
+
+    # Initialize advanced features
+    advanced = AdvancedFeatures(
+        driver,
+        enable_screenshots=kwargs.get('enable_screenshots', False),
+        enable_memory=kwargs.get('enable_memory', False),
+        enable_accessibility=kwargs.get('enable_accessibility', False),
+        enable_security=kwargs.get('enable_security', False),
+        enable_storage=kwargs.get('enable_storage', False),
+        export_format=kwargs.get('export_format'),
+        export_compression=kwargs.get('export_compression'),
+        a11y_include=kwargs.get('a11y_include'),
+        a11y_exclude=kwargs.get('a11y_exclude'),
+        a11y_rules=kwargs.get('a11y_rules'),
+        a11y_tags=kwargs.get('a11y_tags'),
+        screenshot_format=kwargs.get('screenshot_format'),
+        screenshot_quality=kwargs.get('screenshot_quality'),
+        screenshot_max_width=kwargs.get('screenshot_max_width'),
+        enable_visual_regression=kwargs.get('enable_visual_regression', False),
+        baseline_dir=kwargs.get('baseline_dir'),
+        diff_threshold=kwargs.get('diff_threshold'),
+        hash_threshold=kwargs.get('hash_threshold'),
+        update_baselines=kwargs.get('update_baselines', False)
+    )
+
+    advanced.timings = timings = {}
+    span = partial(tracer.span, timings=timings, url=url)
+
+    try:
+        # Register error listeners before any page script runs
+        with span('page.setup'):
+            error_collector = JSErrorCollector(driver, capacity=kwargs.get('js_error_buffer', 1000))
+            error_collector.install()
+            observers_early = register_early_script(driver, 'performance', PERFORMANCE_OBSERVER_SCRIPT)
+
+            # Sample browser memory in the background through load and the interactive wait
+            if kwargs.get('enable_memory', False):
+                advanced.memory_profiler = BrowserMemoryProfiler(
+                    driver, interval=kwargs.get('memory_interval') or 0.5).start()
+            if kwargs.get('session'):
+                restore_session(driver, kwargs['session'])
+            request_filter = kwargs.get('request_filter')
+            if request_filter:
+                apply_request_filter(driver, request_filter)
+
+        # Visit the URL
+        load_start = time.time()
+        with span('page.load'):
+            driver.get(url)
+        load_time = time.time() - load_start
+        if advanced.memory_profiler:
+            advanced.memory_profiler.mark_loaded()
+
+        # Without CDP the listeners can only be added once the page has loaded
+        with span('page.inject'):
+            if not error_collector.early:
+                error_collector.inject()
+            if not observers_early:
+                driver.execute_script(PERFORMANCE_OBSERVER_SCRIPT)
+
+        blocked = []
+
+        def add_logs(logs):
+            # Loads we blocked on purpose go to the blocked requests report, not the console errors
+            for log in logs:
+                request = blocked_request_from_log(log, request_filter) if request_filter else None
+                if request:
+                    blocked.append(request)
+                else:
+                    console_handler.add_log(log)
+
+        def drain():
+            # Drain errors and logs while waiting so pages visited during login are not lost
+            error_collector.drain()
+            add_logs(driver.get_log('browser'))
+
+        condition = ready_condition(kwargs.get('ready_selector'), kwargs.get('ready_url'))
         if kwargs.get('interactive', False):
             print(f"\n{Colors.YELLOW}Interactive mode enabled. Please log in manually if needed.{Colors.ENDC}")
-            print(f"{Colors.YELLOW}Waiting {kwargs.get('wait_after_login', 10)} seconds after login...{Colors.ENDC}")
-            time.sleep(kwargs.get('wait_after_login', 10))
+            if condition:
+                ready_timeout = kwargs.get('ready_timeout') or 300
+                print(f"{Colors.YELLOW}Waiting up to {ready_timeout} seconds for the page to be ready...{Colors.ENDC}")
+                with span('page.login_wait'):
+                    ready = wait_until_ready(driver, condition, ready_timeout, kwargs.get('poll_interval', 2), drain)
+                if not ready:
+                    print(f"{Colors.YELLOW}Ready condition not met after {ready_timeout}s, analyzing anyway{Colors.ENDC}")
+            else:
+                wait_after_login = kwargs.get('wait_after_login', 10)
+                print(f"{Colors.YELLOW}Waiting {wait_after_login} seconds after login...{Colors.ENDC}")
+                with span('page.login_wait'):
+                    deadline = time.time() + wait_after_login
+                    while time.time() < deadline:
+                        time.sleep(min(kwargs.get('poll_interval', 2), max(0, deadline - time.time())))
+                        drain()
             print(f"{Colors.GREEN}Proceeding with analysis...{Colors.ENDC}")
-        
-        print("\nRunning analysis...")
-        
-        # Inject error listeners
-        inject_error_listeners(driver)
-        
+        elif condition:
+            ready_timeout = kwargs.get('ready_timeout') or 30
+            with span('page.ready_wait'):
+                if not wait_until_ready(driver, condition, ready_timeout, kwargs.get('poll_interval', 2), drain):
+                    print(f"{Colors.YELLOW}Ready condition not met after {ready_timeout}s for {url}{Colors.ENDC}")
+        if kwargs.get('save_session'):
+            with span('page.save_session'):
+                path = save_session(kwargs['save_session'], capture_session(driver), kwargs.get('session_key_file'))
+            print(f"{Colors.GREEN}Session saved to: {path}{Colors.ENDC}")
+        if not kwargs.get('interactive', False) and advanced.memory_profiler and kwargs.get('memory_idle'):
+            # Keep the page open so the post-load samples can reveal a leak
+            with span('page.memory_idle'):
+                time.sleep(kwargs['memory_idle'])
+        if advanced.memory_profiler:
+            advanced.memory_profiler.stop()
+
         # Capture the current state of the page
-        page_info = capture_page_state(driver, url)
+        snapshot_path = dom_snapshot_path(url) if kwargs.get('dom_snapshot') else None
+        extra_probes = ['performance']
+        if kwargs.get('enable_storage', False):
+            extra_probes.append('local_storage')
+        with span('page.capture_state'):
+            page_info = capture_page_state(driver, url, error_collector, snapshot_path=snapshot_path,
+                                           extra_probes=extra_probes)
         page_info['load_time'] = load_time
-        
+        if 'local_storage' in page_info:
+            advanced.prefetched['localStorage'] = page_info.pop('local_storage')
+        if kwargs.get('enable_security', False):
+            with span('page.document_headers'):
+                try:
+                    advanced.prefetched['document_headers'] = extract_document_headers(
+                        driver.get_log('performance'), page_info['url'])
+                except Exception:
+                    # Performance logging disabled for this driver; the fetcher fallback is used
+                    pass
+
         # Get console logs
-        logs = driver.get_log('browser')
-        for log in logs:
-            console_handler.add_log(log)
+        with span('page.console_logs'):
+            add_logs(driver.get_log('browser'))
+    finally:
+        # A failed page must not leak the sink or leave the sampler polling a pooled driver
+        console_handler.close()
+        if advanced.memory_profiler:
+            advanced.memory_profiler.cancel()
+    if request_filter:
+        page_info['blocked_requests'] = summarize_blocked_requests(blocked)
+
+    # Run advanced analysis
+    advanced.analyze(console_handler.error_categories)
+    page_info['timings'] = {name: round(seconds, 4) for name, seconds in timings.items()}
+
+    return {
+        'url': url,
+        'page_info': page_info,
+        'console_handler': console_handler,
+        'advanced': advanced,
+        'elapsed': time.time() - page_start,
+        'timings': timings,
+        'error': None
+    }
+
+def load_urls_file(path):
+    """Read one URL per line, skipping blank lines and # comments"""
+    urls = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                urls.append(line)
+    return urls
+
+def load_sitemap(source):
+    """Collect page URLs from a sitemap file or URL, following sitemap indexes"""
+    import xml.etree.ElementTree as ET
+    if source.startswith(('http://', 'https://')):
+        import requests
+        response = requests.get(source, timeout=30)
+        response.raise_for_status()
+        root = ET.fromstring(response.content)
+    else:
+        root = ET.parse(source).getroot()
+
+    # Sitemaps are namespaced, so match on the local tag name only
+    locs = [el.text.strip() for el in root.iter() if el.tag.rsplit('}', 1)[-1] == 'loc' and el.text]
+    if root.tag.rsplit('}', 1)[-1] == 'sitemapindex':
+        urls = []
+        for child in locs:
+            urls.extend(load_sitemap(child))
+        return urls
+    return locs
+
+def iter_batch_results(urls, pool_size=4, driver_factory=None, **kwargs):
+    """Analyze many URLs on a pool of warm drivers, yielding results as pages finish"""
+    with DriverPool(pool_size, driver_factory=driver_factory, keep_cache=kwargs.get('cache_static', False),
+                    interactive=False, enable_security=kwargs.get('enable_security', False)) as pool:
+        def run(url):
+            driver = None
+            try:
+                # Starting a driver can fail too; that fails this URL, not the batch
+                driver = pool.acquire()
+                result = analyze_page(driver, url, **kwargs)
+            except Exception as e:
+                if driver is not None:
+                    pool.discard(driver)
+                return {'url': url, 'error': str(e)}
+            pool.release(driver)
+            return result
+
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            futures = [executor.submit(run, url) for url in urls]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                # Stop queued pages if the caller abandons the stream early
+                for future in futures:
+                    future.cancel()
+
+def summarize_result(result):
+    """Reduce a page result to plain, picklable data for merging and transport"""
+    if result.get('error'):
+        return {'url': result['url'], 'error': result['error'], 'worker': os.getpid()}
+    console_handler = result['console_handler']
+    return {
+        'url': result['url'],
+        'page_info': result['page_info'],
+        # Distinct errors replace the raw entries when deduplicating
+        'console_logs': [] if console_handler.dedupe else list(console_handler.logs),
+        'console_log_sink': console_handler.sink_path,
+        'error_groups': list(console_handler.error_groups.values()),
+        'error_categories': dict(console_handler.error_categories),
+        'advanced_features': result['advanced'].results,
+        'elapsed': result['elapsed'],
+        'timings': result.get('timings') or {},
+        'worker': os.getpid(),
+        'error': None
+    }
+
+def default_worker_count(memory_per_worker_mb=512):
+    """Size a process pool by CPU cores and the memory a Chrome worker needs"""
+    cpu_count = os.cpu_count() or 1
+    try:
+        import psutil
+        available_mb = psutil.virtual_memory().available / 1024 / 1024
+        memory_limit = int(available_mb // memory_per_worker_mb)
+    except Exception:
+        memory_limit = cpu_count
+    return max(1, min(cpu_count, memory_limit))
+
+# Per-process state for the process pool; each worker owns exactly one driver
+_worker_state = {}
+
+def _init_worker(driver_factory, options):
+    """Prepare this worker process; its driver starts with the first URL"""
+    if options.get('category_rules'):
+        ErrorCategory.load_rules(options['category_rules'])
+    if options.get('a11y_cache'):
+        # Workers read the shared cache file and send new entries back; only the parent writes it
+        default_accessibility_cache.load(options['a11y_cache'])
+        default_accessibility_cache.path = None
+        default_accessibility_cache.record_new()
+    _worker_state['driver_factory'] = driver_factory
+    _worker_state['options'] = options
+    tracer.recording = bool(options.get('trace'))
+    # Finalizers run when the pool shuts the worker down, unlike atexit hooks
+    import multiprocessing.util
+    multiprocessing.util.Finalize(None, _shutdown_worker, exitpriority=10)
+
+def _shutdown_worker():
+    """Quit the driver owned by this worker process"""
+    default_screenshot_writer.wait()
+    driver = _worker_state.pop('driver', None)
+    if driver:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+def _process_url(url):
+    """Analyze one URL on this worker's driver and return a picklable summary"""
+    options = _worker_state['options']
+    driver = _worker_state.get('driver')
+    if driver is None:
+        try:
+            # Starting in the initializer would break the whole pool when Chrome fails
+            driver = _worker_state['driver'] = (_worker_state['driver_factory'] or create_driver)(
+                interactive=False, enable_security=options.get('enable_security', False))
+        except Exception as e:
+            return summarize_result({'url': url, 'error': str(e)})
+    try:
+        result = analyze_page(driver, url, **options)
+    except Exception as e:
+        # Replace a driver that may be wedged so later URLs still run
+        _shutdown_worker()
+        return summarize_result({'url': url, 'error': str(e)})
+
+    # A shared export file is written by the parent process from the summaries
+    report_file = None
+    if options.get('export_format') and not options.get('export_file'):
+        console_handler = result['console_handler']
+        report_file = result['advanced'].export_results(console_handler.logs, result['page_info'],
+                                                        error_groups=list(console_handler.error_groups.values()))
+    summary = summarize_result(result)
+    summary['report_file'] = report_file
+    if tracer.recording:
+        # Spans recorded in this worker are merged into the parent's trace
+        summary['trace_events'] = tracer.drain()
+    if options.get('a11y_cache'):
+        summary['a11y_cache_entries'] = default_accessibility_cache.drain_new()
+    try:
+        reset_driver_state(driver, keep_cache=options.get('cache_static', False))
+    except Exception:
+        _shutdown_worker()
+    return summary
+
+def iter_parallel_results(urls, workers=None, driver_factory=None, **kwargs):
+    """Analyze URLs across a process pool, one Chrome per worker, yielding summaries"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    urls = list(urls)
+    workers = workers or default_worker_count()
+    workers = max(1, min(workers, len(urls) or 1))
+    executor = ProcessPoolExecutor(max_workers=workers,
+                                   mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker,
+                                   initargs=(driver_factory, kwargs))
+    with executor:
+        futures = [executor.submit(_process_url, url) for url in urls]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+# Metrics watch mode compares against a moving baseline, larger being worse for
+# all of them: (name, path into the page metrics, smallest change reported)
+WATCH_METRICS = [
+    ('load_time', ('load_time',), 0.1),
+    ('ttfb', ('navigation', 'ttfb'), 50),
+    ('dom_content_loaded', ('navigation', 'dom_content_loaded'), 100),
+    ('first_contentful_paint', ('paint', 'first_contentful_paint'), 100),
+    ('lcp', ('vitals', 'lcp'), 100),
+    ('cls', ('vitals', 'cls'), 0.05),
+    ('long_tasks', ('long_tasks', 'total'), 50),
+]
+
+def watch_metric_values(metrics):
+    """Pick the WATCH_METRICS values out of a page's performance metrics"""
+    values = {}
+    for name, path, _ in WATCH_METRICS:
+        value = metrics
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if isinstance(value, (int, float)):
+            values[name] = value
+    return values
+
+class DeltaTracker:
+    """Turns repeated observations of the same pages into change events
+
+    Error fingerprints already reported are remembered in a fixed-size LRU and
+    each metric keeps an exponentially weighted baseline, so the state stays
+    bounded however long a watch runs. A fingerprint evicted from the LRU is
+    reported again if it comes back.
+    """
+
+    def __init__(self, threshold=0.2, min_samples=3, alpha=0.2, max_fingerprints=10000):
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.alpha = alpha
+        self.max_fingerprints = max_fingerprints
+        self.min_delta = {name: delta for name, _, delta in WATCH_METRICS}
+        self.seen = OrderedDict()
+        self.baselines = {}
+
+    def observe_error(self, url, entry, source='console'):
+        """Return a new_error event the first time an error shows up on url, else None"""
+        message = str(entry.get('message') or '')
+        fingerprint, normalized = fingerprint_message(message)
+        key = (url, fingerprint)
+        if key in self.seen:
+            self.seen.move_to_end(key)
+            return None
+        self.seen[key] = True
+        if len(self.seen) > self.max_fingerprints:
+            self.seen.popitem(last=False)
+        return {
+            'event': 'new_error',
+            'url': url,
+            'source': source,
+            'fingerprint': fingerprint,
+            'category': ErrorCategory.categorize(message),
+            'level': entry.get('level') or entry.get('type'),
+            'message': message[:2000],
+            'normalized': normalized[:2000]
+        }
+
+    def observe_metrics(self, url, values):
+        """Fold one visit's metric values into the baselines and return regression events
+
+        A metric is regressed once it exceeds its baseline by the threshold
+        fraction and by its smallest reported change. Only the transitions are
+        reported: a regression when it starts and regression_cleared when the
+        value is back within the threshold. The baseline keeps adapting, so a
+        lasting shift is reported once and then becomes the new normal.
+        """
+        events = []
+        for name, value in values.items():
+            key = (url, name)
+            baseline, samples, regressed = self.baselines.get(key, (None, 0, False))
+            if samples >= self.min_samples:
+                now_regressed = value - baseline > max(baseline * self.threshold, self.min_delta.get(name, 0))
+                if now_regressed != regressed:
+                    events.append({
+                        'event': 'regression' if now_regressed else 'regression_cleared',
+                        'url': url,
+                        'metric': name,
+                        'value': round(value, 4),
+                        'baseline': round(baseline, 4),
+                        'change': round(value / baseline - 1, 4) if baseline else None
+                    })
+                regressed = now_regressed
+            baseline = value if baseline is None else baseline + self.alpha * (value - baseline)
+            self.baselines[key] = (baseline, samples + 1, regressed)
+        return events
+
+def _drain_watch_errors(driver, collector, tracker, url, request_filter=None):
+    """Yield new_error events for console entries and in-page errors since the last drain"""
+    for log in driver.get_log('browser'):
+        if request_filter and blocked_request_from_log(log, request_filter):
+            continue
+        if log.get('level') in ['SEVERE', 'ERROR', 'WARNING']:
+            event = tracker.observe_error(url, log, 'console')
+            if event:
+                yield event
+    for entry in collector.drain():
+        event = tracker.observe_error(url, entry, 'javascript')
+        if event:
+            yield event
+
+def iter_watch_events(urls, interval=60, driver_factory=None, cycles=None, poll_interval=5,
+                      restart_every=500, tracker=None, js_error_buffer=1000, session=None, request_filter=None):
+    """Revisit URLs on one driver every interval seconds, yielding change events
+
+    Console logs and in-page errors are drained every poll_interval seconds
+    between visits, so errors raised by long-lived pages are reported as they
+    happen. Nothing is accumulated per visit; the driver is replaced every
+    restart_every visits and after a failure, which also bounds the browser's
+    own memory growth.
+    """
+    tracker = tracker or DeltaTracker()
+    driver = collector = current = None
+    visits = cycle = 0
+    drain_errors = partial(_drain_watch_errors, tracker=tracker, request_filter=request_filter)
+
+    def quit_driver():
+        nonlocal driver, current
+        if driver:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        driver = current = None
+
+    try:
+        while cycles is None or cycle < cycles:
+            cycle += 1
+            next_cycle = time.time() + interval
+            for url in urls:
+                try:
+                    if driver and restart_every and visits >= restart_every:
+                        yield from drain_errors(driver, collector, url=current)
+                        quit_driver()
+                    if driver is None:
+                        driver = (driver_factory or create_driver)(interactive=False, enable_security=False)
+                        collector = JSErrorCollector(driver, capacity=js_error_buffer)
+                        collector.install()
+                        register_early_script(driver, 'performance', PERFORMANCE_OBSERVER_SCRIPT)
+                        if session:
+                            restore_session(driver, session)
+                        if request_filter:
+                            apply_request_filter(driver, request_filter)
+                        visits = 0
+                    elif current:
+                        # Errors the previous page raised since the last poll
+                        yield from drain_errors(driver, collector, url=current)
+
+                    visits += 1
+                    current = url
+                    load_start = time.time()
+                    driver.get(url)
+                    load_time = time.time() - load_start
+                    if not collector.early:
+                        collector.inject()
+                        driver.execute_script(PERFORMANCE_OBSERVER_SCRIPT)
+                    yield from drain_errors(driver, collector, url=url)
+                    metrics = collect_performance_metrics(driver)
+                    metrics['load_time'] = load_time
+                    yield from tracker.observe_metrics(url, watch_metric_values(metrics))
+                except Exception as e:
+                    yield {'event': 'visit_failed', 'url': url, 'error': str(e)}
+                    quit_driver()
+
+            if cycles is not None and cycle >= cycles:
+                break
+            while time.time() < next_cycle:
+                time.sleep(min(poll_interval, max(0, next_cycle - time.time())))
+                if driver and current:
+                    try:
+                        yield from drain_errors(driver, collector, url=current)
+                    except Exception as e:
+                        yield {'event': 'visit_failed', 'url': current, 'error': str(e)}
+                        quit_driver()
+    finally:
+        quit_driver()
+
+class BatchReport:
+    """Merged summary of a batch run, aggregated incrementally per page"""
+
+    def __init__(self):
+        self.pages = []
+        self.stage_timings = {}
+        self.error_categories = {}
+        self.error_groups = {}
+        self.workers = {}
+        self.failures = 0
+        self.blocked_requests = {'count': 0, 'by_type': {}, 'by_domain': {}}
+        self.request_cache = {'hits': 0, 'saved_bytes': 0}
+        self.started_at = datetime.now().isoformat()
+
+    def add(self, summary):
+        """Fold one page summary into the report"""
+        worker = summary.get('worker')
+        self.workers[worker] = self.workers.get(worker, 0) + 1
+        if summary.get('error'):
+            self.failures += 1
+            self.pages.append({'url': summary['url'], 'error': summary['error'], 'worker': worker})
+            return
+        for category, count in summary['error_categories'].items():
+            self.error_categories[category] = self.error_categories.get(category, 0) + count
+        for stage, seconds in (summary.get('timings') or {}).items():
+            timing = self.stage_timings.setdefault(stage, {'count': 0, 'total': 0.0, 'max': 0.0})
+            timing['count'] += 1
+            timing['total'] += seconds
+            timing['max'] = max(timing['max'], seconds)
+        for group in summary.get('error_groups', []):
+            merged = self.error_groups.get(group['fingerprint'])
+            if merged is None:
+                self.error_groups[group['fingerprint']] = dict(group, pages=[summary['url']])
+                continue
+            merged['count'] += group['count']
+            merged['last_seen'] = group['last_seen']
+            merged['pages'].append(summary['url'])
+        blocked = summary['page_info'].get('blocked_requests') or {}
+        self.blocked_requests['count'] += blocked.get('count', 0)
+        for key in ('by_type', 'by_domain'):
+            totals = self.blocked_requests[key]
+            for name, count in blocked.get(key, {}).items():
+                totals[name] = totals.get(name, 0) + count
+        for key, value in (summary['page_info'].get('request_cache') or {}).items():
+            self.request_cache[key] += value
+        self.pages.append({
+            'url': summary['url'],
+            'title': summary['page_info'].get('title'),
+            'load_time': summary['page_info'].get('load_time'),
+            'elapsed': summary['elapsed'],
+            'error_count': sum(summary['error_categories'].values()),
+            'distinct_errors': len(summary.get('error_groups', [])),
+            'vitals': (summary['page_info'].get('performance') or {}).get('vitals'),
+            'navigation': (summary['page_info'].get('performance') or {}).get('navigation'),
+            'visual': summary['advanced_features'].get('visual_regression'),
+            'error_categories': summary['error_categories'],
+            'blocked_requests': blocked.get('count'),
+            'report_file': summary.get('report_file'),
+            'worker': worker,
+            'error': None
+        })
+
+    def to_dict(self):
+        return {
+            'started_at': self.started_at,
+            'finished_at': datetime.now().isoformat(),
+            'page_count': len(self.pages),
+            'failures': self.failures,
+            'error_categories': self.error_categories,
+            'error_groups': sorted(self.error_groups.values(), key=lambda g: g['count'], reverse=True),
+            'pages_per_worker': {str(k): v for k, v in self.workers.items()},
+            'blocked_requests': dict(self.blocked_requests, by_domain=dict(
+                sorted(self.blocked_requests['by_domain'].items(), key=lambda item: -item[1]))),
+            'request_cache': self.request_cache,
+            'stage_timings': {stage: dict(t, total=round(t['total'], 3), mean=round(t['total'] / t['count'], 4),
+                                          max=round(t['max'], 4))
+                              for stage, t in self.stage_timings.items()},
+            'pages': self.pages
+        }
+
+    def export(self, reports_dir="reports"):
+        """Write the merged report as JSON and return its path"""
+        json_dir = f"{reports_dir}/json"
+        os.makedirs(json_dir, exist_ok=True)
+        filename = f"{json_dir}/batch_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return filename
+
+    def export_html(self, reports_dir="reports"):
+        """Write an HTML index linking every page report and return its path"""
+        html_dir = f"{reports_dir}/html"
+        os.makedirs(html_dir, exist_ok=True)
+        filename = f"{html_dir}/batch_index_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
+        pages = (dict(page, report_file=os.path.relpath(page['report_file'], html_dir))
+                 if page.get('report_file') else page for page in self.pages)
+        with open(filename, 'wb') as f:
+            write_html_index(f, pages, title=f"Batch Report: {len(self.pages)} pages, {self.failures} failed")
+        return filename
+
+RESULTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    command TEXT,
+    page_count INTEGER DEFAULT 0,
+    failures INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    url TEXT NOT NULL,
+    final_url TEXT,
+    title TEXT,
+    captured_at TEXT NOT NULL,
+    load_time REAL,
+    elapsed REAL,
+    error_count INTEGER,
+    lcp REAL,
+    cls REAL,
+    inp REAL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS error_categories (
+    page_id INTEGER NOT NULL REFERENCES pages(id),
+    category TEXT NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS console_entries (
+    page_id INTEGER NOT NULL REFERENCES pages(id),
+    level TEXT,
+    category TEXT,
+    fingerprint TEXT,
+    source TEXT,
+    message TEXT,
+    timestamp INTEGER,
+    count INTEGER DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS network_requests (
+    page_id INTEGER NOT NULL REFERENCES pages(id),
+    url TEXT,
+    initiator_type TEXT,
+    status INTEGER,
+    start_time REAL,
+    duration REAL,
+    transfer_size INTEGER,
+    decoded_body_size INTEGER
+);
+CREATE TABLE IF NOT EXISTS violations (
+    page_id INTEGER NOT NULL REFERENCES pages(id),
+    kind TEXT NOT NULL,
+    rule TEXT NOT NULL,
+    impact TEXT,
+    description TEXT,
+    node_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS pages_url ON pages(url, captured_at);
+CREATE INDEX IF NOT EXISTS pages_run ON pages(run_id);
+CREATE INDEX IF NOT EXISTS error_categories_page ON error_categories(page_id);
+CREATE INDEX IF NOT EXISTS console_entries_page ON console_entries(page_id);
+CREATE INDEX IF NOT EXISTS console_entries_fingerprint ON console_entries(fingerprint);
+CREATE INDEX IF NOT EXISTS network_requests_page ON network_requests(page_id);
+CREATE INDEX IF NOT EXISTS violations_page ON violations(page_id);
+"""
+
+class ResultsStore:
+    """SQLite database accumulating page results across runs
+
+    The database runs in WAL mode so it can be queried while a crawl writes
+    to it. Pages are inserted as they finish and committed in batches.
+    """
+
+    def __init__(self, path="reports/results.db", batch_pages=50):
+        import sqlite3
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.batch_pages = batch_pages
+        self.run_id = None
+        self._pending = 0
+        self._pages = 0
+        self._failures = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(RESULTS_SCHEMA)
+
+    def start_run(self, command=None):
+        cursor = self.connection.execute('INSERT INTO runs (started_at, command) VALUES (?, ?)',
+                                         (datetime.now().isoformat(), command))
+        self.connection.commit()
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def add_page(self, summary):
+        """Insert one page summary (see summarize_result)"""
+        if self.run_id is None:
+            self.start_run()
+        db = self.connection
+        self._pages += 1
+        if summary.get('error'):
+            self._failures += 1
+            db.execute('INSERT INTO pages (run_id, url, captured_at, error) VALUES (?, ?, ?, ?)',
+                       (self.run_id, summary['url'], datetime.now().isoformat(), summary['error']))
+            self._commit_if_due()
+            return
+
+        page_info = summary['page_info']
+        vitals = (page_info.get('performance') or {}).get('vitals') or {}
+        page_id = db.execute(
+            'INSERT INTO pages (run_id, url, final_url, title, captured_at, load_time, elapsed, '
+            'error_count, lcp, cls, inp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (self.run_id, summary['url'], page_info.get('url'), page_info.get('title'),
+             datetime.now().isoformat(), page_info.get('load_time'), summary.get('elapsed'),
+             sum(summary['error_categories'].values()),
+             vitals.get('lcp'), vitals.get('cls'), vitals.get('inp'))).lastrowid
+
+        db.executemany('INSERT INTO error_categories VALUES (?, ?, ?)',
+                       [(page_id, category, count) for category, count in summary['error_categories'].items()])
+        # Deduplicated runs keep no raw entries; store one row per error group instead
+        # Entries are only fingerprinted while deduplicating; errors get one here for top-errors
+        entries = [(page_id, e.get('level'), e.get('category'),
+                    e.get('fingerprint') or (fingerprint_message(str(e.get('message') or ''))[0]
+                                             if e.get('category') else None),
+                    e.get('source'), e.get('message'), e.get('timestamp'), 1)
+                   for e in summary.get('console_logs') or []]
+        if not entries:
+            entries = [(page_id, g['level'], g['category'], g['fingerprint'], g['sample'].get('source'),
+                        g['sample'].get('message'), g['first_seen'], g['count'])
+                       for g in summary.get('error_groups') or []]
+        db.executemany('INSERT INTO console_entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)', entries)
+        db.executemany('INSERT INTO network_requests VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [
+            (page_id, r.get('name'), r.get('initiatorType'), resource_status(r), r.get('startTime'),
+             r.get('duration'), r.get('transferSize', r.get('encodedDataLength')), r.get('decodedBodySize'))
+            for r in page_info.get('network_requests') or []])
+        db.executemany('INSERT INTO violations VALUES (?, ?, ?, ?, ?, ?)',
+                       list(self._iter_violations(page_id, summary.get('advanced_features') or {})))
+        self._commit_if_due()
+
+    @staticmethod
+    def _iter_violations(page_id, features):
+        for violation in (features.get('accessibility') or {}).get('violations') or []:
+            yield (page_id, 'accessibility', violation.get('id'), violation.get('impact'),
+                   violation.get('description'), len(violation.get('nodes') or []))
+        for header, value in ((features.get('security') or {}).get('headers') or {}).items():
+            if value == 'Not Set':
+                yield (page_id, 'security', header, None, f"{header} header is missing", None)
+
+    def _commit_if_due(self):
+        self._pending += 1
+        if self._pending >= self.batch_pages:
+            self.connection.commit()
+            self._pending = 0
+
+    def finish_run(self):
+        if self.run_id is not None:
+            self.connection.execute('UPDATE runs SET finished_at = ?, page_count = ?, failures = ? WHERE id = ?',
+                                    (datetime.now().isoformat(), self._pages, self._failures, self.run_id))
+        self.connection.commit()
+        self._pending = 0
+
+    def close(self):
+        self.finish_run()
+        self.connection.close()
+
+RESULTS_QUERIES = {
+    'runs': (
+        "SELECT id, started_at, finished_at, page_count, failures, command FROM runs "
+        "ORDER BY id DESC LIMIT :limit"
+    ),
+    'trends': (
+        "SELECT substr(p.captured_at, 1, 10) AS day, p.url, c.category, SUM(c.count) AS errors "
+        "FROM pages p JOIN error_categories c ON c.page_id = p.id "
+        "WHERE p.url LIKE :url AND p.captured_at >= :since "
+        "GROUP BY day, p.url, c.category ORDER BY day, p.url, errors DESC LIMIT :limit"
+    ),
+    'top-errors': (
+        "SELECT e.fingerprint, e.category, SUM(e.count) AS occurrences, COUNT(DISTINCT p.url) AS pages, "
+        "MAX(p.captured_at) AS last_seen, MIN(e.message) AS message "
+        "FROM console_entries e JOIN pages p ON p.id = e.page_id "
+        "WHERE p.url LIKE :url AND p.captured_at >= :since AND e.fingerprint IS NOT NULL "
+        "GROUP BY e.fingerprint ORDER BY occurrences DESC LIMIT :limit"
+    ),
+    'slow-pages': (
+        "SELECT url, COUNT(*) AS samples, ROUND(AVG(load_time), 3) AS avg_load, "
+        "ROUND(MAX(load_time), 3) AS max_load, ROUND(AVG(lcp)) AS avg_lcp "
+        "FROM pages WHERE url LIKE :url AND captured_at >= :since AND error IS NULL "
+        "GROUP BY url ORDER BY avg_load DESC LIMIT :limit"
+    ),
+    'violations': (
+        "SELECT v.kind, v.rule, v.impact, COUNT(DISTINCT p.url) AS pages, MAX(p.captured_at) AS last_seen "
+        "FROM violations v JOIN pages p ON p.id = v.page_id "
+        "WHERE p.url LIKE :url AND p.captured_at >= :since "
+        "GROUP BY v.kind, v.rule ORDER BY pages DESC LIMIT :limit"
+    )
+}
+
+def query_results(path, query, url=None, since=None, limit=100):
+    """Run a named query (or raw SQL) against a results store; return (columns, rows)"""
+    import sqlite3
+
+    sql = RESULTS_QUERIES.get(query, query)
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        cursor = connection.execute(sql, {'url': url or '%', 'since': since or '', 'limit': limit}
+                                    if query in RESULTS_QUERIES else {})
+        return [c[0] for c in cursor.description or []], cursor.fetchall()
+    finally:
+        connection.close()
+
+def iter_store_sections(connection, page_id):
+    """Yield report tables for a stored page, streaming rows from the database"""
+    yield ('Console Logs', ['Level', 'Category', 'Source', 'Time', 'Message', 'Count'],
+           ([level, category, source, _report_time(timestamp), message, count]
+            for level, category, source, timestamp, message, count in connection.execute(
+                'SELECT level, category, source, timestamp, message, count FROM console_entries '
+                'WHERE page_id = ?', (page_id,))))
+    yield ('Network Requests', ['URL', 'Type', 'Status', 'Start (ms)', 'Duration (ms)', 'Size (B)'],
+           (list(row) for row in connection.execute(
+               'SELECT url, initiator_type, status, ROUND(start_time, 1), ROUND(duration, 1), transfer_size '
+               'FROM network_requests WHERE page_id = ?', (page_id,))))
+    yield ('Violations', ['Kind', 'Rule', 'Impact', 'Nodes', 'Description'],
+           (list(row) for row in connection.execute(
+               'SELECT kind, rule, impact, node_count, description FROM violations WHERE page_id = ?',
+               (page_id,))))
+
+def write_store_reports(path, out_dir="reports/html", run_id=None):
+    """Render a page report per stored page of a run plus an index, one page at a time
+
+    Returns the path of the index report.
+    """
+    import sqlite3
+
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        if run_id is None:
+            run_id = connection.execute('SELECT MAX(id) FROM runs').fetchone()[0]
+        if run_id is None:
+            raise ValueError(f"no runs stored in {path}")
+        run_dir = f"{out_dir}/run_{run_id}"
+        os.makedirs(run_dir, exist_ok=True)
+        columns = 'id, url, final_url, title, load_time, error_count, lcp, cls, inp, error, captured_at'
+        query = f'SELECT {columns} FROM pages WHERE run_id = ? ORDER BY id'
+
+        for page_id, url, final_url, title, load_time, errors, lcp, cls, inp, error, captured in \
+                connection.execute(query, (run_id,)):
+            if error:
+                continue
+            page_info = {'url': final_url or url, 'title': title, 'load_time': load_time,
+                         'performance': {'vitals': {'lcp': lcp, 'cls': cls, 'inp': inp}}}
+            cards = page_report_cards(page_info, errors) + [['Captured', captured]]
+            with open(f"{run_dir}/page_{page_id}.html", 'wb') as f:
+                write_html_report(f, url, cards, iter_store_sections(connection, page_id))
+
+        pages = ({'url': url, 'title': title, 'load_time': load_time, 'error_count': errors,
+                  'vitals': {'lcp': lcp, 'cls': cls}, 'error': error,
+                  'report_file': None if error else f"page_{page_id}.html"}
+                 for page_id, url, final_url, title, load_time, errors, lcp, cls, inp, error, captured
+                 in connection.execute(query, (run_id,)))
+        filename = f"{run_dir}/index.html"
+        with open(filename, 'wb') as f:
+            write_html_index(f, pages, title=f"Run {run_id}")
+        return filename
+    finally:
+        connection.close()
+
+def results_main():
+    """Command line entry point for querying a results store"""
+    parser = argparse.ArgumentParser(description='Query the results stored by aidoc --store')
+    parser.add_argument('query', help=f"One of {', '.join(RESULTS_QUERIES)}, report, or an SQL SELECT statement")
+    parser.add_argument('--db', default='reports/results.db', help='Results database (default: reports/results.db)')
+    parser.add_argument('--url', help='SQL LIKE pattern limiting the pages, e.g. %%/checkout%%')
+    parser.add_argument('--since', help='Only pages captured on or after this ISO date')
+    parser.add_argument('--limit', type=int, default=100, help='Maximum rows (default: 100)')
+    parser.add_argument('--json', action='store_true', help='Print rows as JSON objects')
+    parser.add_argument('--run', type=int, help='Run to render with the report query (default: latest)')
+    parser.add_argument('--out', default='reports/html', help='Output directory for the report query (default: reports/html)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"no results database at {args.db}")
+    if args.query == 'report':
+        try:
+            print(f"{Colors.GREEN}Report written to: {write_store_reports(args.db, args.out, args.run)}{Colors.ENDC}")
+            return 0
+        except Exception as e:
+            print(f"{Colors.RED}Failed to write report: {str(e)}{Colors.ENDC}")
+            return 1
+    try:
+        columns, rows = query_results(args.db, args.query, url=args.url, since=args.since, limit=args.limit)
+    except Exception as e:
+        print(f"{Colors.RED}Query failed: {str(e)}{Colors.ENDC}")
+        return 1
+
+    if args.json:
+        for row in rows:
+            print(json.dumps(dict(zip(columns, row)), default=str))
+        return 0
+    cells = [[str(value) if value is not None else '' for value in row] for row in rows]
+    widths = [min(60, max([len(column)] + [len(row[i]) for row in cells])) for i, column in enumerate(columns)]
+    print(f"{Colors.BOLD}{'  '.join(c.ljust(w) for c, w in zip(columns, widths))}{Colors.ENDC}")
+    for row in cells:
+        print('  '.join(value[:w].ljust(w) for value, w in zip(row, widths)))
+    return 0
+
+# Map CDP Log/Runtime levels onto the level names Selenium's browser log uses
+CDP_LOG_LEVELS = {
+    'error': 'SEVERE',
+    'assert': 'SEVERE',
+    'warning': 'WARNING',
+    'info': 'INFO',
+    'log': 'INFO',
+    'verbose': 'DEBUG',
+    'debug': 'DEBUG'
+}
+
+def find_chrome_binary():
+    """Locate a Chrome/Chromium executable on PATH"""
+    for name in ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome'):
+        path = shutil.which(name)
+        if path:
+            return path
+    raise RuntimeError("Chrome executable not found; pass chrome_binary explicitly")
+
+class CDPConnection:
+    """One DevTools websocket multiplexing commands and events for many tabs"""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self._next_id = 0
+        self._pending = {}
+        self._listeners = {}
+        self._reader = None
+
+    @classmethod
+    async def connect(cls, ws_url):
+        """Open the browser websocket and start dispatching messages"""
+        try:
+            import websockets
+        except ImportError:
+            raise RuntimeError("The CDP engine requires the 'websockets' package (pip install aidoc[cdp])")
+        websocket = await websockets.connect(ws_url, max_size=None)
+        connection = cls(websocket)
+        connection.start()
+        return connection
+
+    def start(self):
+        import asyncio
+        self._reader = asyncio.ensure_future(self._read_loop())
+
+    async def _read_loop(self):
+        try:
+            async for raw in self.websocket:
+                message = json.loads(raw)
+                if 'id' in message:
+                    future = self._pending.pop(message['id'], None)
+                    if future is None or future.done():
+                        continue
+                    if 'error' in message:
+                        future.set_exception(RuntimeError(f"CDP error: {message['error'].get('message')}"))
+                    else:
+                        future.set_result(message.get('result', {}))
+                else:
+                    listener = self._listeners.get(message.get('sessionId'))
+                    if not listener:
+                        continue
+                    try:
+                        listener(message.get('method'), message.get('params', {}))
+                    except Exception as e:
+                        # One bad event must not stop the reader every tab shares
+                        print(f"{Colors.RED}Failed to handle {message.get('method')} event: {str(e)}{Colors.ENDC}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(RuntimeError("DevTools connection closed"))
+            self._pending.clear()
+
+    async def send(self, method, params=None, session_id=None, timeout=30):
+        """Send a command and wait for its response"""
+        import asyncio
+        if self._reader is not None and self._reader.done():
+            # Nothing would ever resolve the response; fail now instead of at the timeout
+            raise RuntimeError("DevTools connection closed")
+        self._next_id += 1
+        message = {'id': self._next_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = future
+        await self.websocket.send(json.dumps(message))
+        return await asyncio.wait_for(future, timeout)
+
+    def subscribe(self, session_id, callback):
+        """Route events for a target session to callback(method, params)"""
+        self._listeners[session_id] = callback
+
+    def unsubscribe(self, session_id):
+        self._listeners.pop(session_id, None)
+
+    async def close(self):
+        if self._reader:
+            self._reader.cancel()
+        await self.websocket.close()
+
+class CDPPage:
+    """A browser tab attached over a shared CDP connection, collecting events as they arrive"""
+
+    def __init__(self, connection, target_id, session_id, console_handler=None, request_filter=None,
+                 response_cache=None):
+        import asyncio
+        self.connection = connection
+        self.target_id = target_id
+        self.session_id = session_id
+        self.console_handler = console_handler or ConsoleLogHandler()
+        self.request_filter = request_filter
+        self.response_cache = response_cache
+        self.js_errors = []
+        self.network_requests = {}
+        self.blocked_requests = []
+        self.cache_hits = 0
+        self.cache_saved_bytes = 0
+        self._navigation_start = None
+        self.document_headers = None
+        self._load_event = asyncio.Event()
+        self._paused = set()
+
+    @classmethod
+    async def open(cls, connection, console_handler=None, request_filter=None, response_cache=None):
+        """Create a new tab and enable the domains we listen to"""
+        import asyncio
+        target = await connection.send('Target.createTarget', {'url': 'about:blank'})
+        attached = await connection.send('Target.attachToTarget', {'targetId': target['targetId'], 'flatten': True})
+        page = cls(connection, target['targetId'], attached['sessionId'], console_handler,
+                   request_filter=request_filter, response_cache=response_cache)
+        connection.subscribe(page.session_id, page.handle_event)
+        await asyncio.gather(*(page.send(domain) for domain in
+                               ('Page.enable', 'Runtime.enable', 'Log.enable', 'Network.enable')))
+        await page.send('Page.addScriptToEvaluateOnNewDocument', {'source': PERFORMANCE_OBSERVER_SCRIPT})
+        patterns = fetch_patterns(request_filter, cache=response_cache is not None)
+        if patterns:
+            await page.send('Fetch.enable', {'patterns': patterns})
+        return page
+
+    def send(self, method, params=None):
+        return self.connection.send(method, params, session_id=self.session_id)
+
+    def handle_event(self, method, params):
+        """Fold one CDP event into the page's logs, errors and network table"""
+        if method == 'Fetch.requestPaused':
+            import asyncio
+            # Answered in a task, as a paused request waits for our reply
+            task = asyncio.ensure_future(self.handle_paused_request(params))
+            self._paused.add(task)
+            task.add_done_callback(self._paused.discard)
+        elif method == 'Log.entryAdded':
+            entry = params.get('entry', {})
+            if self.request_filter and BLOCKED_REQUEST_ERROR in entry.get('text', ''):
+                # Reported with the blocked requests instead
+                return
+            self.console_handler.add_log({
+                'level': CDP_LOG_LEVELS.get(entry.get('level'), 'INFO'),
+                'message': entry.get('text', ''),
+                'source': entry.get('source', ''),
+                'timestamp': entry.get('timestamp', time.time() * 1000)
+            })
+        elif method == 'Runtime.consoleAPICalled':
+            if params.get('type') in ('error', 'assert', 'warning'):
+                message = ' '.join(str(arg.get('value', arg.get('description', ''))) for arg in params.get('args', []))
+                self.console_handler.add_log({
+                    'level': CDP_LOG_LEVELS[params['type']],
+                    'message': message,
+                    'source': 'console-api',
+                    'timestamp': params.get('timestamp', time.time() * 1000)
+                })
+        elif method == 'Runtime.exceptionThrown':
+            details = params.get('exceptionDetails', {})
+            message = details.get('exception', {}).get('description') or details.get('text', '')
+            timestamp = params.get('timestamp', time.time() * 1000)
+            self.js_errors.append({
+                'type': 'error',
+                'message': message,
+                'filename': details.get('url'),
+                'lineno': details.get('lineNumber'),
+                'colno': details.get('columnNumber'),
+                'timestamp': datetime.fromtimestamp(timestamp / 1000).isoformat()
+            })
+            self.console_handler.add_log({'level': 'SEVERE', 'message': message, 'source': 'javascript', 'timestamp': timestamp})
+        elif method == 'Network.requestWillBeSent':
+            if self._navigation_start is None:
+                self._navigation_start = params['timestamp']
+            self.network_requests[params['requestId']] = {
+                'name': params['request']['url'],
+                'startTime': (params['timestamp'] - self._navigation_start) * 1000,
+                'initiatorType': params.get('type', 'other').lower()
+            }
+        elif method == 'Network.responseReceived':
+            request = self.network_requests.get(params['requestId'])
+            if request is not None:
+                request['status'] = params['response'].get('status')
+                request['mimeType'] = params['response'].get('mimeType')
+            if params.get('type') == 'Document' and self.document_headers is None:
+                self.document_headers = params['response'].get('headers', {})
+        elif method in ('Network.loadingFinished', 'Network.loadingFailed'):
+            request = self.network_requests.get(params['requestId'])
+            if request is not None:
+                request['responseEnd'] = (params['timestamp'] - self._navigation_start) * 1000
+                request['duration'] = request['responseEnd'] - request['startTime']
+                if method == 'Network.loadingFinished':
+                    request['encodedDataLength'] = params.get('encodedDataLength')
+                else:
+                    request['failed'] = params.get('errorText')
+        elif method == 'Page.loadEventFired':
+            self._load_event.set()
+
+    async def handle_paused_request(self, params):
+        """Block, serve from the shared cache or continue a request paused by Fetch
+
+        Requests are paused before they are sent, and cacheable ones again once
+        their response arrives so it can be stored for later pages.
+        """
+        request_id = params['requestId']
+        url = params['request']['url']
+        resource_type = params.get('resourceType')
+        cacheable = self.response_cache is not None and params['request'].get('method') == 'GET'
+        try:
+            if 'responseStatusCode' in params or 'responseErrorReason' in params:
+                if cacheable and params.get('responseStatusCode') == 200:
+                    body = await self.send('Fetch.getResponseBody', {'requestId': request_id})
+                    self.response_cache.put(url, params.get('responseHeaders') or [], body['body'],
+                                            body.get('base64Encoded', False))
+                await self.send('Fetch.continueRequest', {'requestId': request_id})
+                return
+            reason = self.request_filter.match(url, resource_type) if self.request_filter else None
+            if reason:
+                self.blocked_requests.append({'url': url, 'type': (resource_type or 'other').lower(),
+                                              'domain': url_host(url), 'reason': reason})
+                await self.send('Fetch.failRequest', {'requestId': request_id, 'errorReason': 'BlockedByClient'})
+                return
+            cached = self.response_cache.get(url) if cacheable else None
+            if cached:
+                self.cache_hits += 1
+                self.cache_saved_bytes += cached['size']
+                await self.send('Fetch.fulfillRequest', {'requestId': request_id, 'responseCode': 200,
+                                                         'responseHeaders': cached['headers'],
+                                                         'body': cached['body']})
+                return
+            await self.send('Fetch.continueRequest', {'requestId': request_id})
+        except Exception:
+            # The tab closed while the request was paused
+            pass
+
+    async def navigate(self, url, timeout=30):
+        """Navigate and wait for the load event, returning the load time"""
+        import asyncio
+        self._load_event.clear()
+        self._navigation_start = None
+        self.document_headers = None
+        self.network_requests = {}
+        load_start = time.time()
+        result = await self.send('Page.navigate', {'url': url})
+        if result.get('errorText'):
+            raise RuntimeError(f"Navigation failed: {result['errorText']}")
+        try:
+            await asyncio.wait_for(self._load_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"{Colors.YELLOW}Load event timed out for {url}, analyzing partial page{Colors.ENDC}")
+        return time.time() - load_start
+
+    async def capture_state(self):
+        """Read URL, title and a DOM excerpt in a single evaluation"""
+        result = await self.send('Runtime.evaluate', {
+            'expression': """({
+                url: location.href,
+                title: document.title,
+                page_source_excerpt: (function() {
+                    const source = document.documentElement ? document.documentElement.outerHTML : '';
+                    return source.length > 1000 ? source.slice(0, 1000) + '...' : source;
+                })()
+            })""",
+            'returnByValue': True
+        })
+        return result.get('result', {}).get('value', {})
+
+    async def collect_performance_metrics(self):
+        """Evaluate the shared performance metrics script in the tab"""
+        result = await self.send('Runtime.evaluate', {
+            'expression': f"(function() {{{PERFORMANCE_METRICS_SCRIPT}}})()",
+            'returnByValue': True
+        })
+        metrics = result.get('result', {}).get('value')
+        if not isinstance(metrics, dict):
+            metrics = {'navigation': None, 'paint': None, 'vitals': None, 'long_tasks': None}
+        return metrics
+
+    async def close(self):
+        self.connection.unsubscribe(self.session_id)
+        try:
+            await self.connection.send('Target.closeTarget', {'targetId': self.target_id})
+        except Exception:
+            pass
+
+class CDPBrowser:
+    """Chrome launched with remote debugging and driven over one websocket"""
+
+    def __init__(self, process, connection, user_data_dir):
+        self.process = process
+        self.connection = connection
+        self.user_data_dir = user_data_dir
+        self._stderr_drain = None
+
+    @classmethod
+    async def launch(cls, chrome_binary=None, headless=True, timeout=30):
+        """Start Chrome and connect to its browser-level DevTools endpoint"""
+        import asyncio
+        import subprocess
+        binary = chrome_binary or find_chrome_binary()
+        user_data_dir = tempfile.mkdtemp(prefix='aidoc-cdp-')
+        args = [binary, '--remote-debugging-port=0', f'--user-data-dir={user_data_dir}',
+                '--no-sandbox', '--disable-dev-shm-usage', '--no-first-run', 'about:blank']
+        if headless:
+            args.insert(1, '--headless=new')
+        process = await asyncio.create_subprocess_exec(*args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+        async def read_ws_url():
+            while True:
+                line = await process.stderr.readline()
+                if not line:
+                    raise RuntimeError("Chrome exited before exposing a DevTools endpoint")
+                line = line.decode(errors='replace').strip()
+                if line.startswith('DevTools listening on '):
+                    return line.split(' ', 3)[-1]
+
+        try:
+            ws_url = await asyncio.wait_for(read_ws_url(), timeout)
+            connection = await CDPConnection.connect(ws_url)
+        except BaseException:
+            process.kill()
+            shutil.rmtree(user_data_dir, ignore_errors=True)
+            raise
+        browser = cls(process, connection, user_data_dir)
+        # Keep draining stderr so Chrome never blocks on a full pipe
+        browser._stderr_drain = asyncio.ensure_future(process.stderr.read())
+        return browser
+
+    async def new_page(self, console_handler=None, request_filter=None, response_cache=None):
+        return await CDPPage.open(self.connection, console_handler, request_filter=request_filter,
+                                  response_cache=response_cache)
+
+    async def close(self):
+        try:
+            await self.connection.close()
+        finally:
+            if self.process.returncode is None:
+                self.process.terminate()
+                await self.process.wait()
+            if self._stderr_drain:
+                self._stderr_drain.cancel()
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+async def analyze_page_cdp(browser, url, **kwargs):
+    """Analyze one URL in its own tab, collecting events instead of polling"""
+    page_start = time.time()
+    page = await browser.new_page(ConsoleLogHandler(max_entries=kwargs.get('log_buffer'),
+                                                    sink=kwargs.get('log_sink'),
+                                                    page_url=url,
+                                                    dedupe=kwargs.get('dedupe', False)),
+                                  request_filter=kwargs.get('request_filter'),
+                                  response_cache=kwargs.get('response_cache'))
+    timings = {}
+    span = partial(tracer.span, timings=timings, url=url)
+    try:
+        if kwargs.get('session'):
+            # Each tab is fresh, so the session goes in before its first navigation
+            await page.send('Network.setCookies', {'cookies': live_session_cookies(kwargs['session'])})
+            await page.send('Page.addScriptToEvaluateOnNewDocument',
+                            {'source': session_restore_script(kwargs['session'])})
+        with span('page.load'):
+            load_time = await page.navigate(url, timeout=kwargs.get('page_timeout', 30))
+        with span('page.capture_state'):
+            page_info = await page.capture_state()
+            page_info['load_time'] = load_time
+            page_info['network_requests'] = list(page.network_requests.values())
+            page_info['js_errors'] = page.js_errors
+            page_info['performance'] = await page.collect_performance_metrics()
+        with span('page.waterfall'):
+            page_info['performance']['resources'] = summarize_resources(
+                {'initiatorType': r['initiatorType'], 'duration': r.get('duration'),
+                 'transferSize': r.get('encodedDataLength')} for r in page_info['network_requests'])
+            page_info['performance']['waterfall'] = analyze_waterfall(
+                page_info['network_requests'], page_info['url'],
+                (page_info['performance'].get('paint') or {}).get('first_paint'))
+        if page.request_filter:
+            page_info['blocked_requests'] = summarize_blocked_requests(page.blocked_requests)
+        if page.response_cache is not None:
+            page_info['request_cache'] = {'hits': page.cache_hits, 'saved_bytes': page.cache_saved_bytes}
+        page_info['timings'] = {name: round(seconds, 4) for name, seconds in timings.items()}
+    finally:
+        await page.close()
+        page.console_handler.close()
+
+    advanced = AdvancedFeatures(None, export_format=kwargs.get('export_format'))
+    if kwargs.get('enable_security', False):
+        advanced.results['security'] = {'headers': select_security_headers(page.document_headers), 'source': 'browser'}
+
+    return {
+        'url': url,
+        'page_info': page_info,
+        'console_handler': page.console_handler,
+        'advanced': advanced,
+        'elapsed': time.time() - page_start,
+        'timings': timings,
+        'error': None
+    }
+
+async def iter_cdp_results(urls, tabs=8, chrome_binary=None, **kwargs):
+    """Analyze URLs concurrently as tabs of one browser, yielding results as pages finish"""
+    import asyncio
+    if kwargs.get('cache_static') and kwargs.get('response_cache') is None:
+        # One cache for every tab, so static assets are downloaded once per batch
+        kwargs['response_cache'] = ResponseCache(int((kwargs.get('cache_size') or 256) * 1024 * 1024))
+    browser = await CDPBrowser.launch(chrome_binary=chrome_binary)
+    semaphore = asyncio.Semaphore(max(1, tabs))
+
+    async def run(url):
+        async with semaphore:
+            try:
+                return await analyze_page_cdp(browser, url, **kwargs)
+            except Exception as e:
+                return {'url': url, 'error': str(e)}
+
+    tasks = [asyncio.ensure_future(run(url)) for url in urls]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await browser.close()
+
+def iter_cdp_results_sync(urls, **kwargs):
+    """Blocking wrapper around iter_cdp_results for the CLI"""
+    import asyncio
+    loop = asyncio.new_event_loop()
+    results = iter_cdp_results(urls, **kwargs)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.close()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='AgenTest aiDoc - Advanced Web Console Analysis Tool',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=AGENTEST_BANNER)
+    
+    parser.add_argument('url', nargs='?', help='URL to analyze')
+    parser.add_argument('--urls-file', help='File with one URL per line to analyze in batch mode')
+    parser.add_argument('--sitemap', help='Sitemap file or URL whose pages are analyzed in batch mode')
+    parser.add_argument('--pool-size', type=int, default=4, help='Number of browsers kept warm in batch mode (default: 4)')
+    parser.add_argument('--workers', type=int, help='Run batch mode on a process pool of N workers, one browser each (0: size by CPU and memory)')
+    parser.add_argument('--engine', choices=['selenium', 'cdp'], default='selenium', help='Browser engine: Selenium WebDriver or async DevTools protocol (default: selenium)')
+    parser.add_argument('--tabs', type=int, default=8, help='Concurrent tabs per browser with --engine cdp (default: 8)')
+    parser.add_argument('--interactive', action='store_true', help='Launch browser in interactive mode for manual login')
+    parser.add_argument('--wait-after-login', type=int, default=10, help='Seconds to wait after login before analysis when no ready condition is given (default: 10)')
+    parser.add_argument('--ready-selector', help='Wait until an element matching this CSS selector is visible before analysis')
+    parser.add_argument('--ready-url', help='Wait until the page URL contains this text before analysis')
+    parser.add_argument('--ready-timeout', type=float, help='Seconds to wait for the ready condition (default: 300 with --interactive, else 30)')
+    parser.add_argument('--save-session', metavar='FILE', help='Save cookies, localStorage and sessionStorage to an encrypted file once the page is ready')
+    parser.add_argument('--session', metavar='FILE', help='Restore a session saved with --save-session into every browser')
+    parser.add_argument('--session-key-file', help='Key file for session encryption unless AIDOC_SESSION_KEY is set (default: ~/.aidoc/session.key)')
+    parser.add_argument('--block-domain', action='append', metavar='DOMAIN', help='Block requests to DOMAIN and its subdomains (repeatable)')
+    parser.add_argument('--block-trackers', action='store_true', help='Block common analytics, tag manager and ad domains')
+    parser.add_argument('--block-types', help=f"Comma-separated resource types to block ({','.join(BLOCKABLE_RESOURCE_TYPES)})")
+    parser.add_argument('--cache-static', action='store_true', help='Reuse static assets across pages: in-memory with --engine cdp, else each browser keeps its HTTP cache')
+    parser.add_argument('--cache-size', type=float, default=256, help='Decoded body size of the --engine cdp static asset cache in MB, about 4/3 of it in memory (default: 256)')
+    parser.add_argument('--screenshots', action='store_true', help='Enable screenshot capture')
+    parser.add_argument('--screenshot-format', choices=['png', 'jpeg', 'webp'], default='png', help='Screenshot encoding; jpeg/webp need Pillow (default: png)')
+    parser.add_argument('--screenshot-quality', type=int, default=80, help='JPEG/WebP screenshot quality (default: 80)')
+    parser.add_argument('--screenshot-max-width', type=int, help='Downscale screenshots wider than this many pixels (needs Pillow)')
+    parser.add_argument('--memory', action='store_true', help='Enable memory monitoring')
+    parser.add_argument('--memory-interval', type=float, default=0.5, help='Seconds between browser memory samples (default: 0.5)')
+    parser.add_argument('--memory-idle', type=float, default=0, help='Seconds to keep sampling memory after load to detect leaks (default: 0)')
+    parser.add_argument('--accessibility', action='store_true', help='Enable accessibility checks')
+    parser.add_argument('--a11y-include', action='append', metavar='SELECTOR', help='Only check elements matching SELECTOR (repeatable)')
+    parser.add_argument('--a11y-exclude', action='append', metavar='SELECTOR', help='Skip elements matching SELECTOR (repeatable)')
+    parser.add_argument('--a11y-rules', help='Comma-separated axe rule ids to run')
+    parser.add_argument('--a11y-tags', help='Comma-separated axe tags to run, e.g. wcag2a,wcag2aa')
+    parser.add_argument('--a11y-cache', help='JSON file persisting accessibility results across runs')
+    parser.add_argument('--visual-regression', action='store_true', help='Compare full-page screenshots against stored baselines')
+    parser.add_argument('--baseline-dir', default='reports/baselines', help='Directory holding visual baselines (default: reports/baselines)')
+    parser.add_argument('--update-baselines', action='store_true', help='Replace visual baselines with the current screenshots')
+    parser.add_argument('--diff-threshold', type=int, default=16, help='Per-channel difference above which a pixel counts as changed (default: 16)')
+    parser.add_argument('--hash-threshold', type=int, default=0, help='Perceptual hash distance treated as unchanged without a pixel diff (default: 0)')
+    parser.add_argument('--security', action='store_true', help='Enable security analysis')
+    parser.add_argument('--storage', action='store_true', help='Enable storage inspection')
+    parser.add_argument('--export', choices=['html', 'json', 'ndjson'], help='Export format')
+    parser.add_argument('--store', nargs='?', const='reports/results.db', help='Record results in a SQLite database for aidoc-results queries (default path: reports/results.db)')
+    parser.add_argument('--export-file', help='Write every page to this one json/ndjson report; ndjson files are appended to across runs')
+    parser.add_argument('--export-compression', choices=['gzip', 'zstd'], help='Compress json/ndjson exports (zstd needs zstandard)')
+    parser.add_argument('--log-buffer', type=int, help='Keep only the last N console entries in memory')
+    parser.add_argument('--log-sink', help='Append every console entry to this NDJSON file as it arrives')
+    parser.add_argument('--js-error-buffer', type=int, default=1000, help='Capacity of the in-page JavaScript error ring buffer (default: 1000)')
+    parser.add_argument('--dom-snapshot', action='store_true', help='Save a gzip-compressed snapshot of the full DOM per page')
+    parser.add_argument('--dedupe', action='store_true', help='Group repeated console errors by fingerprint in reports')
+    parser.add_argument('--trace', nargs='?', const=f"reports/trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                        help='Save per-stage spans as a Chrome trace JSON file (default path under reports/)')
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], help='Profile the run and save the profile under reports/')
+    parser.add_argument('--category-rules', help='JSON file with extra error categorization rules')
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help='Keep one browser open and revisit the URL(s) every SECONDS, reporting only changes')
+    parser.add_argument('--watch-output', help='Append watch events to this NDJSON file instead of stdout')
+    parser.add_argument('--watch-cycles', type=int, help='Stop watching after N rounds of visits (default: run until interrupted)')
+    parser.add_argument('--watch-restart', type=int, default=500, help='Restart the watch browser every N visits (default: 500)')
+    parser.add_argument('--regression-threshold', type=float, default=20, help='Percent above baseline at which a metric counts as regressed (default: 20)')
+    
+    args = parser.parse_args()
+    if args.export_file and args.export not in ('json', 'ndjson'):
+        parser.error('--export-file needs --export json or ndjson')
+
+    if args.category_rules:
+        ErrorCategory.load_rules(args.category_rules)
+    if args.a11y_cache:
+        default_accessibility_cache.load(args.a11y_cache)
+    try:
+        request_filter = RequestFilter(domains=(args.block_domain or []) + list(TRACKER_DOMAINS if args.block_trackers else []),
+                                       types=args.block_types.split(',') if args.block_types else ())
+    except ValueError as e:
+        parser.error(str(e))
+    session = None
+    if args.session:
+        try:
+            session = load_session(args.session, args.session_key_file)
+        except (OSError, RuntimeError) as e:
+            parser.error(f"cannot load session: {str(e)}")
+
+    options = dict(enable_screenshots=args.screenshots,
+                   enable_memory=args.memory,
+                   memory_interval=args.memory_interval,
+                   memory_idle=args.memory_idle,
+                   enable_accessibility=args.accessibility,
+                   enable_security=args.security,
+                   enable_storage=args.storage,
+                   enable_visual_regression=args.visual_regression,
+                   baseline_dir=args.baseline_dir,
+                   update_baselines=args.update_baselines,
+                   diff_threshold=args.diff_threshold,
+                   hash_threshold=args.hash_threshold,
+                   export_format=args.export,
+                   export_file=args.export_file,
+                   store=args.store,
+                   export_compression=args.export_compression,
+                   log_buffer=args.log_buffer,
+                   log_sink=args.log_sink,
+                   dedupe=args.dedupe,
+                   js_error_buffer=args.js_error_buffer,
+                   dom_snapshot=args.dom_snapshot,
+                   screenshot_format=args.screenshot_format,
+                   screenshot_quality=args.screenshot_quality,
+                   screenshot_max_width=args.screenshot_max_width,
+                   a11y_include=args.a11y_include,
+                   a11y_exclude=args.a11y_exclude,
+                   a11y_rules=args.a11y_rules.split(',') if args.a11y_rules else None,
+                   a11y_tags=args.a11y_tags.split(',') if args.a11y_tags else None,
+                   a11y_cache=args.a11y_cache,
+                   category_rules=args.category_rules,
+                   trace=args.trace,
+                   session=session,
+                   session_key_file=args.session_key_file,
+                   ready_selector=args.ready_selector,
+                   ready_url=args.ready_url,
+                   ready_timeout=args.ready_timeout,
+                   request_filter=request_filter or None,
+                   cache_static=args.cache_static,
+                   cache_size=args.cache_size)
+    tracer.recording = bool(args.trace)
+
+    if args.watch is not None:
+        if args.interactive or args.engine == 'cdp' or args.workers is not None or args.save_session:
+            parser.error('--watch cannot be combined with --interactive, --save-session, --engine cdp or --workers')
+        urls = [args.url] if args.url else []
+        if args.urls_file:
+            urls.extend(load_urls_file(args.urls_file))
+        if args.sitemap:
+            urls.extend(load_sitemap(args.sitemap))
+        if not urls:
+            parser.error('a URL, --urls-file or --sitemap is required')
+        return run_profiled(args.profile, main_watch_impl, urls, interval=args.watch, output=args.watch_output,
+                            compression=args.export_compression or compression_for_path(args.watch_output or ''),
+                            cycles=args.watch_cycles, threshold=args.regression_threshold / 100,
+                            restart_every=args.watch_restart, js_error_buffer=args.js_error_buffer, session=session,
+                            request_filter=request_filter or None)
+
+    if args.urls_file or args.sitemap or args.engine == 'cdp':
+        if args.interactive or args.save_session:
+            parser.error('--interactive and --save-session cannot be combined with batch mode or --engine cdp')
+        urls = [args.url] if args.url else []
+        if args.urls_file:
+            urls.extend(load_urls_file(args.urls_file))
+        if args.sitemap:
+            urls.extend(load_sitemap(args.sitemap))
+        if not urls:
+            parser.error('a URL, --urls-file or --sitemap is required')
+        return run_profiled(args.profile, main_batch_impl, urls, pool_size=args.pool_size, workers=args.workers,
+                            engine=args.engine, tabs=args.tabs, **options)
+
+    if not args.url:
+        parser.error('a URL, --urls-file or --sitemap is required')
+    
+    return run_profiled(args.profile, main_impl, args.url,
+                        interactive=args.interactive,
+                        wait_after_login=args.wait_after_login,
+                        save_session=args.save_session,
+                        **options)
+
+def open_report_writer(**kwargs):
+    """Return a ReportWriter for --export-file, or None for per-page files"""
+    if not kwargs.get('export_file'):
+        return None
+    if kwargs.get('export_format') == 'html':
+        raise ValueError('--export-file needs --export json or ndjson')
+    return ReportWriter(kwargs['export_file'], kwargs['export_format'],
+                        compression=kwargs.get('export_compression'))
+
+def main_impl(url, **kwargs):
+    """Implementation of the main functionality"""
+    start_time = time.time()
+    print(AGENTEST_BANNER)
+    
+    # Create reports directory if it doesn't exist
+    os.makedirs('reports/screenshots', exist_ok=True)
+    os.makedirs('reports/html', exist_ok=True)
+    os.makedirs('reports/json', exist_ok=True)
+    
+    driver = None
+    store = None
+    timings = {}
+    span = partial(tracer.span, timings=timings)
+    try:
+        if kwargs.get('store'):
+            store = ResultsStore(kwargs['store'])
+            store.start_run(' '.join(sys.argv[1:]) or url)
+
+        # Initialize WebDriver
+        with span('driver.start'):
+            driver = create_driver(**kwargs)
         
-        # Run advanced analysis
-        advanced.analyze(console_handler.error_categories)
+        print(f"\nVisiting {url}...")
+        result = analyze_page(driver, url, **kwargs)
+        page_info = result['page_info']
+        console_handler = result['console_handler']
+        advanced = result['advanced']
+        timings.update(result['timings'])
         
         # Generate report
         total_time = time.time() - start_time
-        print_report(page_info, console_handler, total_time)
+        with span('report.print'):
+            print_report(page_info, console_handler, total_time)
         
         # Export results if requested
         if kwargs.get('export_format'):
-            advanced.export_results(console_handler.get_formatted_logs(), page_info)
+            with span('report.export'):
+                writer = open_report_writer(**kwargs)
+                advanced.export_results(console_handler.logs, page_info, writer=writer,
+                                        error_groups=list(console_handler.error_groups.values()))
+                if writer:
+                    writer.close()
+                    print(f"{Colors.GREEN}Report exported to: {writer.path}{Colors.ENDC}")
+
+        if store:
+            with span('report.store'):
+                store.add_page(summarize_result(result))
+            print(f"{Colors.GREEN}Results stored in: {store.path}{Colors.ENDC}")
+
+        default_accessibility_cache.save()
+        print_stage_timings(timings, time.time() - start_time)
         
         return 0
         
@@ -477,8 +4519,147 @@ def main_impl(url, **kwargs):
         return 1
         
     finally:
-        if driver and not kwargs.get('interactive', False):
-            driver.quit()
+        if store:
+            store.close()
+        with span('screenshots.wait'):
+            default_screenshot_writer.wait()
+        # An interactive browser stays open for inspection unless its session was saved
+        if driver and (not kwargs.get('interactive', False) or kwargs.get('save_session')):
+            with span('driver.quit'):
+                driver.quit()
+        if kwargs.get('trace'):
+            print(f"{Colors.GREEN}Trace saved to: {tracer.write_trace(kwargs['trace'])}{Colors.ENDC}")
+
+def main_batch_impl(urls, pool_size=4, workers=None, engine='selenium', tabs=8, **kwargs):
+    """Analyze a list of URLs on a pool of reusable drivers"""
+    start_time = time.time()
+    print(AGENTEST_BANNER)
+
+    os.makedirs('reports/screenshots', exist_ok=True)
+    os.makedirs('reports/html', exist_ok=True)
+    os.makedirs('reports/json', exist_ok=True)
+
+    # Preserve order while dropping duplicate URLs
+    urls = list(dict.fromkeys(urls))
+    if engine == 'cdp':
+        if any(kwargs.get(flag) for flag in ('enable_screenshots', 'enable_memory', 'enable_accessibility',
+                                              'enable_storage', 'enable_visual_regression')):
+            print(f"{Colors.YELLOW}Advanced features need the Selenium engine and are skipped with --engine cdp{Colors.ENDC}")
+        print(f"\nAnalyzing {len(urls)} URL(s) in up to {tabs} tab(s) of one browser...")
+        results = iter_cdp_results_sync(urls, tabs=tabs, **kwargs)
+    elif workers is not None:
+        workers = workers or default_worker_count()
+        print(f"\nAnalyzing {len(urls)} URL(s) across {workers} worker process(es)...")
+        results = iter_parallel_results(urls, workers=workers, **kwargs)
+    else:
+        print(f"\nAnalyzing {len(urls)} URL(s) with {pool_size} browser(s)...")
+        results = iter_batch_results(urls, pool_size=pool_size, **kwargs)
+
+    report = BatchReport()
+    run_timings = {}
+    span = partial(tracer.span, timings=run_timings)
+    writer = open_report_writer(**kwargs) if kwargs.get('export_format') else None
+    store = ResultsStore(kwargs['store']) if kwargs.get('store') else None
+    if store:
+        store.start_run(' '.join(sys.argv[1:]) or f"{len(urls)} urls")
+    try:
+        for index, result in enumerate(results, 1):
+            if engine == 'cdp' or workers is None:
+                report_file = None
+                if kwargs.get('export_format') and not result['error'] and writer is None:
+                    console_handler = result['console_handler']
+                    with span('report.export', url=result['url']):
+                        report_file = result['advanced'].export_results(
+                            console_handler.logs, result['page_info'],
+                            error_groups=list(console_handler.error_groups.values()))
+                result = summarize_result(result)
+                result['report_file'] = report_file
+            tracer.events.extend(result.pop('trace_events', None) or [])
+            # Process pool workers scan with their own cache copy; keep their results for the saved cache
+            for key, results in result.pop('a11y_cache_entries', None) or []:
+                default_accessibility_cache.put(key, results)
+            if writer and not result['error']:
+                with span('report.export', url=result['url']):
+                    export_report(result['page_info'], result['console_logs'], result['advanced_features'],
+                                  kwargs['export_format'], writer=writer, error_groups=result['error_groups'])
+            if store:
+                with span('report.store', url=result['url']):
+                    store.add_page(result)
+            report.add(result)
+
+            prefix = f"[{index}/{len(urls)}]"
+            if result['error']:
+                print(f"{prefix} {Colors.RED}FAILED{Colors.ENDC} {result['url']}: {result['error']}")
+                continue
+
+            error_count = sum(result['error_categories'].values())
+            status = f"{Colors.RED}{error_count} issue(s){Colors.ENDC}" if error_count else f"{Colors.GREEN}OK{Colors.ENDC}"
+            print(f"{prefix} {status} {result['url']} "
+                  f"(load {result['page_info']['load_time']:.2f}s, total {result['elapsed']:.2f}s)")
+    finally:
+        # Close even if the batch raises, so the file is complete and the WAL is checkpointed
+        if writer:
+            writer.close()
+        if store:
+            store.close()
+    if writer:
+        print(f"{Colors.GREEN}Page reports exported to: {writer.path}{Colors.ENDC}")
+    if store:
+        print(f"{Colors.GREEN}Results stored in: {store.path}{Colors.ENDC}")
+    if kwargs.get('export_format'):
+        print(f"{Colors.GREEN}Batch report exported to: {report.export()}{Colors.ENDC}")
+    if kwargs.get('export_format') == 'html':
+        print(f"{Colors.GREEN}Batch index exported to: {report.export_html()}{Colors.ENDC}")
+    default_accessibility_cache.save()
+    with span('screenshots.wait'):
+        default_screenshot_writer.wait()
+
+    total_time = time.time() - start_time
+    # Page stages are summed over pages, so with concurrency they can exceed the wall time
+    stage_totals = {stage: t['total'] for stage, t in report.stage_timings.items()}
+    stage_totals.update(run_timings)
+    print_stage_timings(stage_totals)
+    if report.blocked_requests['count'] or report.request_cache['hits']:
+        blocked = report.to_dict()['blocked_requests']
+        print()
+        print_blocked_requests(blocked if blocked['count'] else None,
+                               report.request_cache if report.request_cache['hits'] else None)
+    if kwargs.get('trace'):
+        print(f"{Colors.GREEN}Trace saved to: {tracer.write_trace(kwargs['trace'])}{Colors.ENDC}")
+    print(f"\n{Colors.BOLD}Batch complete:{Colors.ENDC} {len(urls) - report.failures} succeeded, "
+          f"{report.failures} failed in {total_time:.2f}s")
+    return 1 if report.failures else 0
+
+def main_watch_impl(urls, interval=60, output=None, compression=None, cycles=None, threshold=0.2,
+                    restart_every=500, js_error_buffer=1000, session=None, request_filter=None, **kwargs):
+    """Watch URLs until interrupted, writing each change event as one NDJSON line
+
+    Events go to output, appended to across runs, or to stdout; status
+    messages go to stderr so stdout stays machine-readable.
+    """
+    urls = list(dict.fromkeys(urls))
+    stream = open_report_file(output, 'ab', compression) if output else sys.stdout.buffer
+    print(f"{Colors.CYAN}Watching {len(urls)} URL(s) every {interval:g}s; "
+          f"changes go to {output or 'stdout'} (Ctrl+C to stop){Colors.ENDC}", file=sys.stderr)
+    count = 0
+    events = iter_watch_events(urls, interval=interval, cycles=cycles, restart_every=restart_every,
+                               tracker=DeltaTracker(threshold=threshold), js_error_buffer=js_error_buffer,
+                               poll_interval=kwargs.get('poll_interval', 5), session=session,
+                               request_filter=request_filter)
+    try:
+        for event in events:
+            event = dict(time=datetime.now().isoformat(timespec='seconds'), **event)
+            stream.write(dumps_json(event) + b'\n')
+            stream.flush()
+            count += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        events.close()
+        if output:
+            stream.close()
+    print(f"{Colors.GREEN}Watch stopped after {count} change event(s){Colors.ENDC}", file=sys.stderr)
+    return 0
 
 if __name__ == '__main__':
     main()
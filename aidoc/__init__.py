@@ -10,6 +10,12 @@ Basic usage:
     >>> from aidoc import analyze_url
     >>> results = analyze_url('https://example.com')
 
+Batch usage:
+
+    >>> from aidoc import analyze_urls
+    >>> for result in analyze_urls(['https://example.com', 'https://example.org'], pool_size=2):
+    ...     print(result['url'], result['error'])
+
 For more information, please see: https://github.com/agentest/aidoc
 """
 
@@ -17,6 +23,24 @@ __version__ = '1.0.0'
 __author__ = 'AgenTest.ai'
 __license__ = 'MIT'
 
-from .AiDoc import main as analyze_url
+# Public names resolve on first access, so importing the package stays cheap
+_exports = {
+    'analyze_url': 'main',
+    'analyze_urls': 'iter_batch_results',
+    'DriverPool': 'DriverPool',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from . import AiDoc
+    value = getattr(AiDoc, _exports[name])
+    globals()[name] = value
+    return value
+
 
-__all__ = ['analyze_url']
+def __dir__():
+    return sorted(list(globals()) + __all__)
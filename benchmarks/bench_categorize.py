@@ -0,0 +1,83 @@
+"""
+Micro-benchmark for console error categorization.
+
+Feeds synthetic console lines through the original per-category ``any()``
+scans and through ``ErrorCategory.categorize``, then through
+``ConsoleLogHandler.add_log``, and prints throughput for each.
+
+    python -m benchmarks.bench_categorize --lines 1000000
+"""
+
+import argparse
+import random
+import time
+
+from aidoc.AiDoc import ConsoleLogHandler, ErrorCategory
+
+TEMPLATES = [
+    "https://cdn.example.com/static/js/main.{n}.chunk.js {n}:{m} Uncaught TypeError: Cannot read properties of undefined (reading 'map')",
+    "https://api.example.com/v1/poll?id={n} - Failed to load resource: the server responded with a status of 500 ()",
+    "https://example.com/login?next=/account/{n} 0:0 Refused to frame because of auth policy",
+    "https://example.com/app.js {n}:{m} Uncaught DOMException: Failed to execute 'querySelector' on 'Document'",
+    "console.warn: deprecated option used in widget {n}, please migrate to v2 config",
+    "https://example.com/img/{n}.png - Failed to load resource: net::ERR_NAME_NOT_RESOLVED",
+]
+
+
+def legacy_categorize(error_message):
+    """The pre-compiled implementation, kept here as the baseline"""
+    message = error_message.lower()
+    if any(term in message for term in ['login', 'auth', 'credential', 'permission']):
+        return ErrorCategory.AUTHENTICATION
+    elif any(term in message for term in ['net::', 'failed to load', 'network', 'fetch']):
+        return ErrorCategory.NETWORK
+    elif any(term in message for term in ['undefined', 'null', 'cannot read property', 'is not a function']):
+        return ErrorCategory.JAVASCRIPT
+    elif any(term in message for term in ['404', 'resource', 'not found', 'failed to load resource']):
+        return ErrorCategory.RESOURCE
+    elif any(term in message for term in ['querySelector', 'element', 'node', 'document']):
+        return ErrorCategory.DOM
+    return ErrorCategory.OTHER
+
+
+def synthetic_lines(count, distinct):
+    """Build count lines drawn from a pool of distinct messages"""
+    rng = random.Random(42)
+    pool = [rng.choice(TEMPLATES).format(n=i, m=rng.randint(1, 400)) for i in range(distinct)]
+    return [pool[rng.randrange(distinct)] for _ in range(count)]
+
+
+def measure(label, func, lines):
+    start = time.perf_counter()
+    for line in lines:
+        func(line)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {len(lines) / elapsed:>14,.0f} lines/s  ({elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark console error categorization')
+    parser.add_argument('--lines', type=int, default=1_000_000, help='Number of synthetic console lines')
+    parser.add_argument('--distinct', type=int, default=50_000, help='Number of distinct messages in the stream')
+    args = parser.parse_args()
+
+    lines = synthetic_lines(args.lines, args.distinct)
+    print(f"{args.lines:,} lines, {args.distinct:,} distinct messages\n")
+
+    measure("legacy any() scans", legacy_categorize, lines)
+
+    # Defeat the message cache to time the raw scan
+    ErrorCategory.CACHE_SIZE = 0
+    measure("compiled term table (no cache)", ErrorCategory.categorize, lines)
+
+    ErrorCategory.CACHE_SIZE = 16384
+    ErrorCategory.compile()
+    measure("compiled term table (cached)", ErrorCategory.categorize, lines)
+
+    handler = ConsoleLogHandler()
+    entries = [{'level': 'SEVERE', 'message': line, 'source': 'javascript', 'timestamp': 0} for line in lines]
+    measure("ConsoleLogHandler.add_log", handler.add_log, entries)
+
+
+if __name__ == '__main__':
+    main()
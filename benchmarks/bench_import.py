@@ -0,0 +1,59 @@
+"""
+Startup benchmark for the aidoc package and CLI.
+
+Runs ``python -X importtime`` in fresh interpreters for a bare package import,
+the analyzer module, ``aidoc --help`` and ``aidoc-results --help``, and prints
+the median import time of each beyond interpreter startup, with the slowest
+modules it pulled in.
+
+    python -m benchmarks.bench_import --runs 10
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+TARGETS = [
+    ("import aidoc", "import aidoc"),
+    ("import aidoc.AiDoc", "import aidoc.AiDoc"),
+    ("aidoc --help", "import sys; sys.argv = ['aidoc', '--help']; from aidoc.AiDoc import main; main()"),
+    ("aidoc-results --help",
+     "import sys; sys.argv = ['aidoc-results', '--help']; from aidoc.AiDoc import results_main; results_main()"),
+]
+
+
+def import_times(code):
+    """Run code in a fresh interpreter and return {module: (self_us, cumulative_us, depth)}"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          capture_output=True, text=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per target')
+    parser.add_argument('--top', type=int, default=5, help='Slowest top-level imports to list')
+    args = parser.parse_args()
+
+    # Modules the bare interpreter imports at startup are not counted
+    startup = set(import_times('pass'))
+    for label, code in TARGETS:
+        runs = [{name: t for name, t in import_times(code).items() if name not in startup}
+                for _ in range(args.runs)]
+        totals = [sum(c for _, c, depth in run.values() if depth == 0) for run in runs]
+        print(f"{label:24} {statistics.median(totals) / 1000:8.1f} ms  ({len(runs[-1])} modules)")
+        top = sorted(((c, name) for name, (_, c, depth) in runs[-1].items() if depth <= 1), reverse=True)
+        for cumulative, name in top[:args.top]:
+            print(f"    {name:40} {cumulative / 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark DOM excerpt capture against repeated page_source transfers.
+
+Serves synthetic pages of increasing size from a local HTTP server, loads
+them in headless Chrome and compares the original three ``page_source``
+reads with ``capture_page_excerpt``. Requires Chrome and chromedriver.
+
+    python -m benchmarks.bench_page_source --sizes 1 4 16
+"""
+
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aidoc.AiDoc import capture_page_excerpt, create_driver
+
+
+def synthetic_page(size_mb):
+    """Build an HTML page of roughly size_mb megabytes"""
+    row = '<div class="row"><span class="cell">item</span><a href="/detail">details</a></div>\n'
+    rows = row * (size_mb * 1024 * 1024 // len(row))
+    return f"<!DOCTYPE html><html><head><title>bench</title></head><body>{rows}</body></html>".encode('utf-8')
+
+
+def serve(pages):
+    """Start a local server returning pages[path] and return it"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = pages.get(self.path)
+            self.send_response(200 if body else 404)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body or b'')))
+            self.end_headers()
+            self.wfile.write(body or b'')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def legacy_excerpt(driver):
+    """The original capture_page_state expression, reading page_source three times"""
+    transferred = 0
+    source = driver.page_source
+    transferred += len(source)
+    if len(source) > 1000:
+        source = driver.page_source
+        transferred += len(source)
+        excerpt = source[:1000] + "..."
+    else:
+        source = driver.page_source
+        transferred += len(source)
+        excerpt = source
+    return excerpt, transferred
+
+
+def timed(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark DOM excerpt capture')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 4, 16], help='Page sizes in MB')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (best is reported)')
+    args = parser.parse_args()
+
+    pages = {f"/page_{size}mb": synthetic_page(size) for size in args.sizes}
+    server = serve(pages)
+    driver = create_driver()
+    try:
+        print(f"{'page':>8} {'legacy bytes':>14} {'legacy ms':>10} {'excerpt bytes':>14} {'excerpt ms':>11}")
+        for size in args.sizes:
+            driver.get(f"http://127.0.0.1:{server.server_port}/page_{size}mb")
+            (_, legacy_bytes), legacy_time = timed(lambda: legacy_excerpt(driver), args.repeat)
+            (excerpt, _), excerpt_time = timed(lambda: capture_page_excerpt(driver), args.repeat)
+            print(f"{size:>6}MB {legacy_bytes:>14,} {legacy_time * 1000:>10.1f} "
+                  f"{len(excerpt):>14,} {excerpt_time * 1000:>11.1f}")
+    finally:
+        driver.quit()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
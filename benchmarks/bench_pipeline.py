@@ -0,0 +1,270 @@
+"""
+Throughput benchmark for the full analysis pipeline.
+
+Replays recorded driver outputs through ``analyze_page`` (console log
+handling, page state capture, advanced features) and ``export_results`` with
+a fake driver, then prints pages/sec, log lines/sec, peak RSS and per-stage
+latency taken from the pipeline's own stage timings. Recordings are
+generated synthetically, loaded from a file, or captured from headless Chrome
+against the local fixture site.
+
+    # 10k synthetic pages sharing 1M console lines, no browser needed
+    python -m benchmarks.bench_pipeline --pages 10000 --log-lines 1000000
+
+    # Save results and fail if throughput or memory regressed by more than 10%
+    python -m benchmarks.bench_pipeline --json bench.json --baseline previous.json --max-regression 10
+
+    # End-to-end in headless Chrome against the fixture site, recording the pages
+    python -m benchmarks.bench_pipeline --live --pages 50 --record fixture.ndjson.gz
+    python -m benchmarks.bench_pipeline --recordings fixture.ndjson.gz
+
+    # Compare against a run that blocks images and fonts and keeps the HTTP cache
+    python -m benchmarks.bench_pipeline --live --pages 50 --block-types image,font --cache-static
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from aidoc.AiDoc import (ReportWriter, RequestFilter, analyze_page, create_driver, default_screenshot_writer,
+                         reset_driver_state, tracer)
+from benchmarks.fixture_site import serve_fixture_site
+from benchmarks.replay import (ReplayDriver, RecordingDriver, load_recordings, save_recordings,
+                               synthetic_recordings)
+
+FEATURES = ['accessibility', 'security', 'storage', 'screenshots', 'memory']
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class PipelineStats:
+    """Accumulates page counts and per-stage durations"""
+
+    def __init__(self):
+        self.pages = 0
+        self.failures = 0
+        self.log_lines = 0
+        self.busy = 0.0
+        self.stages = {}
+
+    def add(self, result):
+        self.pages += 1
+        self.log_lines += result['console_handler'].total_count
+        for stage, seconds in result['timings'].items():
+            self.stages.setdefault(stage, []).append(seconds)
+
+    def summary(self, elapsed):
+        """Summarize the run; rates use the time spent in the pipeline, not in producing recordings"""
+        stages = {}
+        for stage, values in sorted(self.stages.items(), key=lambda item: -sum(item[1])):
+            values.sort()
+            stages[stage] = {
+                'count': len(values),
+                'total': round(sum(values), 4),
+                'mean_ms': round(sum(values) / len(values) * 1000, 3),
+                'p50_ms': round(percentile(values, 0.5) * 1000, 3),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+                'max_ms': round(values[-1] * 1000, 3),
+            }
+        return {
+            'pages': self.pages,
+            'failures': self.failures,
+            'log_lines': self.log_lines,
+            'elapsed': round(elapsed, 3),
+            'pipeline_time': round(self.busy, 3),
+            'pages_per_sec': round(self.pages / self.busy, 2) if self.busy else None,
+            'lines_per_sec': round(self.log_lines / self.busy, 1) if self.busy else None,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'stages': stages,
+        }
+
+
+def print_summary(summary):
+    print(f"\nPages: {summary['pages']} ({summary['failures']} failed) in {summary['pipeline_time']:.2f}s "
+          f"of pipeline time ({summary['elapsed']:.2f}s wall) -> {summary['pages_per_sec']} pages/s")
+    print(f"Log lines: {summary['log_lines']:,} -> {summary['lines_per_sec']:,} lines/s")
+    print(f"Peak RSS: {summary['peak_rss_mb']} MB\n")
+    print(f"{'stage':32} {'count':>7} {'total s':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for stage, s in summary['stages'].items():
+        print(f"{stage:32} {s['count']:7} {s['total']:9.2f} {s['mean_ms']:9.3f} {s['p50_ms']:9.3f} "
+              f"{s['p95_ms']:9.3f} {s['max_ms']:9.3f}")
+
+
+def compare(summary, baseline, max_regression):
+    """Return messages for every metric that regressed beyond max_regression percent"""
+    limit = max_regression / 100
+    problems = []
+    if baseline.get('pages_per_sec') and summary['pages_per_sec'] < baseline['pages_per_sec'] * (1 - limit):
+        problems.append(f"pages/sec {summary['pages_per_sec']} < baseline {baseline['pages_per_sec']}")
+    if baseline.get('peak_rss_mb') and summary['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + limit):
+        problems.append(f"peak RSS {summary['peak_rss_mb']} MB > baseline {baseline['peak_rss_mb']} MB")
+    for stage, s in summary['stages'].items():
+        previous = baseline.get('stages', {}).get(stage)
+        # Sub-millisecond stages are too noisy to gate on
+        if previous and previous['p95_ms'] >= 1 and s['p95_ms'] > previous['p95_ms'] * (1 + limit):
+            problems.append(f"{stage} p95 {s['p95_ms']} ms > baseline {previous['p95_ms']} ms")
+    return problems
+
+
+def run_pipeline(driver, urls, options, writer=None, on_page=None, before_page=None):
+    """Analyze and export every URL on driver and return the stats"""
+    stats = PipelineStats()
+    for url in urls:
+        if before_page:
+            url = before_page(url)
+        start = time.perf_counter()
+        try:
+            result = analyze_page(driver, url, **options)
+        except Exception as e:
+            print(f"FAILED {url}: {e}", file=sys.stderr)
+            stats.failures += 1
+            continue
+        if options.get('export_format'):
+            console_handler = result['console_handler']
+            with tracer.span('report.export', timings=result['timings'], url=url):
+                result['advanced'].export_results(console_handler.logs, result['page_info'], writer=writer,
+                                                  error_groups=list(console_handler.error_groups.values()))
+        stats.busy += time.perf_counter() - start
+        stats.add(result)
+        if on_page:
+            on_page(result)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis pipeline on recorded pages')
+    parser.add_argument('--pages', type=int, default=10000, help='Synthetic or fixture pages to analyze')
+    parser.add_argument('--log-lines', type=int, default=1000000, help='Console lines spread over synthetic pages')
+    parser.add_argument('--resources', type=int, default=40, help='Resource timing entries per synthetic page')
+    parser.add_argument('--recordings', help='Replay recordings from this NDJSON(.gz) file instead')
+    parser.add_argument('--live', action='store_true', help='Run headless Chrome against the local fixture site')
+    parser.add_argument('--record', help='With --live, save the recorded pages to this NDJSON(.gz) file')
+    parser.add_argument('--features', default='accessibility,security,storage,screenshots',
+                        help=f"Comma-separated features to enable ({','.join(FEATURES)})")
+    parser.add_argument('--export', choices=['json', 'ndjson', 'html', 'none'], default='ndjson',
+                        help='Export format; ndjson goes to one file, json/html to one file per page')
+    parser.add_argument('--block-types', help='Comma-separated resource types to block, e.g. image,font')
+    parser.add_argument('--block-domains', help='Comma-separated domains to block')
+    parser.add_argument('--cache-static', action='store_true', help='With --live, keep the HTTP cache between pages')
+    parser.add_argument('--dedupe', action='store_true', help='Group console errors by fingerprint')
+    parser.add_argument('--log-buffer', type=int, help='Ring buffer size for console entries')
+    parser.add_argument('--json', help='Write the summary to this JSON file')
+    parser.add_argument('--baseline', help='Summary JSON of an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=10,
+                        help='Percent slowdown or memory growth tolerated against --baseline (default: 10)')
+    parser.add_argument('--keep-reports', action='store_true', help='Keep the exported reports directory')
+    args = parser.parse_args()
+
+    features = {f for f in args.features.split(',') if f}
+    unknown = features - set(FEATURES)
+    if unknown:
+        parser.error(f"unknown features: {', '.join(sorted(unknown))}")
+    options = {f"enable_{feature}": True for feature in features}
+    options.update(export_format=None if args.export == 'none' else args.export,
+                   dedupe=args.dedupe, log_buffer=args.log_buffer)
+    try:
+        request_filter = RequestFilter(domains=args.block_domains.split(',') if args.block_domains else (),
+                                       types=args.block_types.split(',') if args.block_types else ())
+    except ValueError as e:
+        parser.error(str(e))
+    if request_filter:
+        options['request_filter'] = request_filter
+
+    # Reports are written relative to the working directory
+    workdir = tempfile.mkdtemp(prefix='aidoc-bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    writer = ReportWriter('reports/pipeline.ndjson', 'ndjson') if args.export == 'ndjson' else None
+    server = real_driver = None
+    recorded = []
+    on_page = before_page = None
+    try:
+        if args.live:
+            server = serve_fixture_site(args.pages)
+            driver = real_driver = create_driver(enable_security='security' in features)
+            if args.record:
+                driver = RecordingDriver(real_driver)
+                on_page = lambda result: recorded.append(driver.finish())
+            before_page = lambda url: reset_driver_state(real_driver, keep_cache=args.cache_static) or url
+            urls = server.page_urls
+            source = f"headless Chrome on {server.base_url}"
+        else:
+            driver = ReplayDriver()
+            if args.recordings:
+                recordings = load_recordings(os.path.join(cwd, args.recordings))
+                source = args.recordings
+            else:
+                recordings = synthetic_recordings(args.pages, args.log_lines, args.resources)
+                source = f"{args.pages} synthetic pages, {args.log_lines:,} log lines"
+            # Recordings are produced one at a time, so memory does not grow with the page count
+            urls = _queue_recordings(driver, recordings)
+
+        print(f"Benchmarking the pipeline on {source} with features: {', '.join(sorted(features)) or 'none'}")
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            stats = run_pipeline(driver, urls, options, writer=writer, on_page=on_page, before_page=before_page)
+            if writer:
+                writer.close()
+            default_screenshot_writer.wait()
+        summary = stats.summary(time.perf_counter() - start)
+        summary.update(source=source, features=sorted(features), export=args.export)
+        print_summary(summary)
+
+        if args.record:
+            count = save_recordings(os.path.join(cwd, args.record), recorded)
+            print(f"\nSaved {count} recordings to {args.record}")
+    finally:
+        os.chdir(cwd)
+        if real_driver:
+            real_driver.quit()
+        if server:
+            server.shutdown()
+        if args.keep_reports:
+            print(f"Reports kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if (baseline.get('source'), baseline.get('features')) != (summary['source'], summary['features']):
+            print(f"Warning: baseline ran on {baseline.get('source')} with {baseline.get('features')}; "
+                  f"latencies may not be comparable")
+        problems = compare(summary, baseline, args.max_regression)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        return 1 if problems else 0
+    return 0
+
+
+def _queue_recordings(driver, recordings):
+    """Yield each recording's URL after queueing it on the replay driver"""
+    for recording in recordings:
+        driver.play(recording)
+        yield recording['url']
+
+
+if __name__ == '__main__':
+    sys.exit(main())
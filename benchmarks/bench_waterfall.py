@@ -0,0 +1,60 @@
+"""
+Micro-benchmark for resource waterfall analysis.
+
+Builds synthetic resource timing entries for pages of increasing size and
+times ``analyze_waterfall`` on each.
+
+    python -m benchmarks.bench_waterfall --sizes 100 1000 10000
+"""
+
+import argparse
+import random
+import time
+
+from aidoc.AiDoc import analyze_waterfall
+
+HOSTS = ["example.com", "cdn.example.com", "static.example.com", "www.googletagmanager.com",
+         "connect.facebook.net", "fonts.gstatic.com", "api.example.com", "ads.doubleclick.net"]
+INITIATORS = ["script", "link", "img", "css", "fetch", "xmlhttprequest", "other"]
+
+
+def synthetic_entries(count):
+    """Build count resource timing entries with some repeated URLs"""
+    rng = random.Random(42)
+    entries = []
+    for i in range(count):
+        start = rng.uniform(0, 8000)
+        duration = rng.expovariate(1 / 150)
+        entries.append({
+            'name': f"https://{rng.choice(HOSTS)}/assets/{rng.randrange(count // 2 or 1)}.js",
+            'startTime': start,
+            'duration': duration,
+            'responseEnd': start + duration,
+            'initiatorType': rng.choice(INITIATORS),
+            'transferSize': int(rng.expovariate(1 / 40000)),
+            'decodedBodySize': int(rng.expovariate(1 / 90000)),
+            'renderBlockingStatus': 'blocking' if rng.random() < 0.02 else 'non-blocking'
+        })
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark resource waterfall analysis')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='Resource entries per synthetic page')
+    parser.add_argument('--repeat', type=int, default=20, help='Runs per size')
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        entries = synthetic_entries(size)
+        analyze_waterfall(entries, "https://example.com/")
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            result = analyze_waterfall(entries, "https://example.com/", first_paint=1200)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f"{size:>8,} entries  {elapsed * 1000:>8.2f} ms/page  "
+              f"critical path {len(result['critical_path'])}, flagged {sum(result['flags'].values())}")
+
+
+if __name__ == '__main__':
+    main()
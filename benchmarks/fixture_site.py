@@ -0,0 +1,134 @@
+"""
+A local HTTP fixture site for end-to-end headless runs.
+
+Every page exercises what aidoc analyzes: console errors and warnings, an
+uncaught exception, an unhandled rejection, a missing image, scripts and
+styles on several paths, localStorage, a cookie and (on even pages) security
+headers. ``/sitemap.xml`` lists all pages.
+
+    python -m benchmarks.fixture_site --pages 100 --port 8000
+"""
+
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<title>Fixture page {index}</title>
+<link rel="stylesheet" href="/static/site.css">
+<script src="/static/app.js"></script>
+</head>
+<body>
+<h1>Fixture page {index}</h1>
+<main class="template-{template}">
+{rows}
+<img src="/img/missing-{index}.png">
+<img src="/img/logo.png">
+<p style="color: #999; background: #aaa">low contrast text</p>
+</main>
+<script>
+localStorage.setItem('visits', '{index}');
+console.error('Failed to load widget ' + {index} + ': timeout after 3000ms');
+console.warn('Deprecated option used on page {index}');
+setTimeout(function() {{ undefinedFunction{template}(); }}, 0);
+Promise.reject(new Error('rejected request {index}'));
+fetch('/api/items?page={index}');
+</script>
+</body>
+</html>
+"""
+
+STATIC = {
+    '/static/site.css': ('text/css', b'body { font-family: sans-serif; } .row { padding: 4px; }'),
+    '/static/app.js': ('application/javascript', b'window.appStarted = Date.now();'),
+    '/img/logo.png': ('image/png', bytes.fromhex(
+        '89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489'
+        '0000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082')),
+}
+
+SECURITY_HEADERS = {
+    'Strict-Transport-Security': 'max-age=31536000',
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+}
+
+
+def fixture_page(index):
+    """Return the HTML of page index; pages share one of ten templates"""
+    template = index % 10
+    rows = '\n'.join(f'<div class="row"><a href="/page/{(index + i) % 1000}">item {i}</a></div>'
+                     for i in range(20 + template * 5))
+    return PAGE_TEMPLATE.format(index=index, template=template, rows=rows).encode('utf-8')
+
+
+def serve_fixture_site(pages=100, host='127.0.0.1', port=0):
+    """Start the fixture site on a daemon thread and return the server
+
+    The server's base_url attribute holds the site root and page_urls the
+    URL of every page.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            headers = {}
+            if path.startswith('/page/') and path[6:].isdigit() and int(path[6:]) < pages:
+                index = int(path[6:])
+                content_type, body = 'text/html; charset=utf-8', fixture_page(index)
+                headers['Set-Cookie'] = f'session=s{index}; Path=/'
+                if index % 2 == 0:
+                    headers.update(SECURITY_HEADERS)
+            elif path == '/sitemap.xml':
+                urls = ''.join(f'<url><loc>{server.base_url}/page/{i}</loc></url>' for i in range(pages))
+                content_type = 'application/xml'
+                body = (f'<?xml version="1.0" encoding="UTF-8"?>'
+                        f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>').encode('utf-8')
+            elif path.startswith('/api/'):
+                content_type, body = 'application/json', b'{"error": "unavailable"}'
+                self.send_response(500)
+                self._finish(content_type, body, headers)
+                return
+            elif path in STATIC:
+                content_type, body = STATIC[path]
+            else:
+                self.send_response(404)
+                self._finish('text/plain', b'not found', headers)
+                return
+            self.send_response(200)
+            self._finish(content_type, body, headers)
+
+        def _finish(self, content_type, body, headers):
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    server.page_urls = [f"{server.base_url}/page/{i}" for i in range(pages)]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the aidoc fixture site')
+    parser.add_argument('--pages', type=int, default=100, help='Number of pages to serve')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    args = parser.parse_args()
+
+    server = serve_fixture_site(args.pages, port=args.port)
+    print(f"Serving {args.pages} pages at {server.base_url} (sitemap: {server.base_url}/sitemap.xml)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+"""
+Recorded driver outputs and a fake WebDriver that plays them back.
+
+A recording holds everything the analysis pipeline reads from the browser for
+one page: console logs, in-page errors, resource timing entries, performance
+metrics, the DOM excerpt, axe results, cookies, localStorage and the document
+headers. ``ReplayDriver`` answers the pipeline's WebDriver calls from a
+recording, so ``analyze_page`` runs unchanged without Chrome.
+``RecordingDriver`` wraps a real driver and captures recordings in the same
+format, and ``synthetic_recordings`` generates them at any scale.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import random
+import re
+
+from aidoc.AiDoc import (AXE_RUN_SCRIPT, DOM_STRUCTURE_SCRIPT, JS_ERROR_DRAIN_SCRIPT, LOCAL_STORAGE_SCRIPT,
+                         PERFORMANCE_METRICS_SCRIPT, PROBE_SCHEMA_VERSION, PAGE_PROBES, RESOURCE_TIMING_SCRIPT,
+                         SECURITY_HEADERS, extract_document_headers)
+
+# 1x1 transparent PNG returned for screenshots
+BLANK_PNG = base64.b64encode(bytes.fromhex(
+    '89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489'
+    '0000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082')).decode('ascii')
+
+PROBE_CALL_PATTERN = re.compile(r'run\("(\w+)", \d+,')
+
+# Scripts whose results are part of a recording, by recording field
+RECORDED_SCRIPTS = {
+    JS_ERROR_DRAIN_SCRIPT: 'js_errors',
+    PERFORMANCE_METRICS_SCRIPT: 'performance',
+    LOCAL_STORAGE_SCRIPT: 'local_storage',
+    RESOURCE_TIMING_SCRIPT: 'resources',
+    DOM_STRUCTURE_SCRIPT: 'structure',
+}
+
+# Recording field holding each batched probe's value
+PROBE_FIELDS = {
+    'location': 'location',
+    'excerpt': 'excerpt',
+    'network': 'resources',
+    'js_errors': 'js_errors',
+    'performance': 'performance',
+    'local_storage': 'local_storage',
+}
+
+
+def probe_names(script):
+    """Return the probe names a build_probe_script() script runs, or None for other scripts"""
+    if not script.startswith('const args = arguments[0];'):
+        return None
+    return PROBE_CALL_PATTERN.findall(script)
+
+
+class ReplayDriver:
+    """A WebDriver stand-in answering from recorded page outputs
+
+    Pages are looked up by URL in recordings, or the next page can be queued
+    with play() when recordings are generated on the fly.
+    """
+
+    def __init__(self, recordings=None):
+        self.recordings = recordings or {}
+        self.page = None
+        self._queued = None
+        self._pending_logs = []
+        self._next_script_id = 0
+        self.calls = 0
+
+    def play(self, recording):
+        """Serve recording on the next get()"""
+        self._queued = recording
+
+    def get(self, url):
+        self.calls += 1
+        recording = self._queued or self.recordings.get(url)
+        if recording is None:
+            raise RuntimeError(f"No recording for {url}")
+        self._queued = None
+        self.page = recording
+        self._pending_logs = list(recording.get('console_logs') or [])
+
+    @property
+    def current_url(self):
+        return self.page['url'] if self.page else 'about:blank'
+
+    @property
+    def title(self):
+        return self.page.get('title', '') if self.page else ''
+
+    @property
+    def page_source(self):
+        return self.page.get('page_source', '') if self.page else ''
+
+    def get_log(self, kind):
+        self.calls += 1
+        if kind == 'browser':
+            logs, self._pending_logs = self._pending_logs, []
+            return logs
+        if kind == 'performance' and self.page and self.page.get('document_headers') is not None:
+            message = {'message': {'method': 'Network.responseReceived', 'params': {
+                'type': 'Document',
+                'response': {'url': self.page['url'], 'headers': self.page['document_headers']}}}}
+            return [{'message': json.dumps(message)}]
+        return []
+
+    def get_cookies(self):
+        self.calls += 1
+        return list(self.page.get('cookies') or []) if self.page else []
+
+    def get_screenshot_as_base64(self):
+        self.calls += 1
+        return BLANK_PNG
+
+    def _field(self, name):
+        page = self.page or {}
+        if name == 'location':
+            return {'url': page.get('url'), 'title': page.get('title', '')}
+        if name == 'excerpt':
+            source = page.get('page_source', '')
+            return {'length': len(source), 'excerpt': source[:1000]}
+        if name == 'js_errors':
+            entries = page.get('js_errors') or []
+            return {'id': page.get('url'), 'total': len(entries), 'dropped': 0, 'entries': entries}
+        if name == 'structure':
+            source = page.get('page_source', '')
+            return {'hash': hashlib.sha1(source[:4096].encode('utf-8')).hexdigest()[:16],
+                    'elements': source.count('<'), 'origin': page.get('url')}
+        return page.get(name)
+
+    def execute_script(self, script, *args):
+        self.calls += 1
+        names = probe_names(script)
+        if names is not None:
+            return {'schema': PROBE_SCHEMA_VERSION,
+                    'probes': {name: {'version': PAGE_PROBES[name][0], 'value': self._field(PROBE_FIELDS[name])}
+                               for name in names}}
+        field = RECORDED_SCRIPTS.get(script)
+        return self._field(field) if field else None
+
+    def execute_async_script(self, script, *args):
+        self.calls += 1
+        if script == AXE_RUN_SCRIPT:
+            return dict(self.page.get('axe') or {'violations': []}) if self.page else None
+        return None
+
+    def execute_cdp_cmd(self, command, params):
+        self.calls += 1
+        if command == 'Page.addScriptToEvaluateOnNewDocument':
+            self._next_script_id += 1
+            return {'identifier': str(self._next_script_id)}
+        if command == 'Page.captureScreenshot':
+            return {'data': BLANK_PNG}
+        if command == 'Runtime.getHeapUsage':
+            return {'usedSize': 8 * 1024 * 1024, 'totalSize': 16 * 1024 * 1024}
+        return {}
+
+    def quit(self):
+        self.page = None
+
+
+class RecordingDriver:
+    """Wraps a real driver and records what each page returns to the pipeline
+
+    Use it in place of the driver for analyze_page(); finish() returns the
+    recording of the page just analyzed.
+    """
+
+    def __init__(self, driver):
+        self._driver = driver
+        self.recording = {}
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+    def get(self, url):
+        self.recording = {'url': url, 'console_logs': []}
+        return self._driver.get(url)
+
+    def get_log(self, kind):
+        logs = self._driver.get_log(kind)
+        if kind == 'browser':
+            self.recording['console_logs'].extend(logs)
+        elif kind == 'performance':
+            headers = extract_document_headers(logs, self.recording.get('url'))
+            if headers is not None:
+                self.recording['document_headers'] = {name: value for name, value in headers.items()
+                                                      if name.lower() in {h.lower() for h in SECURITY_HEADERS}}
+        return logs
+
+    def get_cookies(self):
+        cookies = self._driver.get_cookies()
+        self.recording['cookies'] = cookies
+        return cookies
+
+    def execute_script(self, script, *args):
+        result = self._driver.execute_script(script, *args)
+        names = probe_names(script)
+        if names is not None and isinstance(result, dict):
+            for name, probe in (result.get('probes') or {}).items():
+                if 'value' in probe:
+                    self._record(PROBE_FIELDS[name], probe['value'])
+        elif script in RECORDED_SCRIPTS:
+            self._record(RECORDED_SCRIPTS[script], result)
+        return result
+
+    def _record(self, field, value):
+        if field == 'location' and isinstance(value, dict):
+            self.recording['title'] = value.get('title', '')
+        elif field == 'excerpt' and isinstance(value, dict):
+            # Only the excerpt crosses the wire; pad to the real length so sizes replay faithfully
+            excerpt = value.get('excerpt', '')
+            self.recording['page_source'] = excerpt + ' ' * max(0, value.get('length', 0) - len(excerpt))
+        elif field == 'js_errors' and isinstance(value, dict):
+            self.recording.setdefault('js_errors', []).extend(value.get('entries') or [])
+        elif field != 'structure':
+            self.recording[field] = value
+
+    def execute_async_script(self, script, *args):
+        result = self._driver.execute_async_script(script, *args)
+        if script == AXE_RUN_SCRIPT and isinstance(result, dict):
+            self.recording['axe'] = {'violations': result.get('violations', [])}
+        return result
+
+    def finish(self):
+        """Return the recording of the current page"""
+        recording, self.recording = self.recording, {}
+        return recording
+
+
+LOG_TEMPLATES = [
+    ('SEVERE', 'network', "https://api.example.com/v1/items?page={n} - Failed to load resource: the server responded with a status of 500 ()"),
+    ('SEVERE', 'javascript', "https://example.com/static/js/main.{n}.js {n}:{m} Uncaught TypeError: Cannot read properties of undefined (reading 'map')"),
+    ('WARNING', 'console-api', "https://example.com/static/js/vendor.js {m}:{n} \"[Deprecation] option {n} will be removed\""),
+    ('SEVERE', 'network', "https://cdn.example.com/img/{n}.png - Failed to load resource: net::ERR_NAME_NOT_RESOLVED"),
+    ('SEVERE', 'security', "https://example.com/login 0:0 Refused to frame 'https://auth.example.com/' because of auth policy"),
+    ('INFO', 'console-api', "https://example.com/static/js/main.js {m}:{n} \"render took {n}ms\""),
+    ('SEVERE', 'javascript', "https://example.com/app.js {n}:{m} Uncaught DOMException: Failed to execute 'querySelector' on 'Document'"),
+]
+
+HOSTS = ['example.com', 'cdn.example.com', 'static.example.com', 'fonts.gstatic.com',
+         'www.googletagmanager.com', 'api.example.com']
+INITIATORS = ['script', 'link', 'img', 'css', 'fetch', 'xmlhttprequest']
+
+
+def synthetic_recording(index, log_lines, resources, rng):
+    """Build one page recording with log_lines console entries and resources timing entries"""
+    url = f"https://example.com/page/{index}"
+    logs = []
+    for _ in range(log_lines):
+        level, source, template = rng.choice(LOG_TEMPLATES)
+        logs.append({'level': level, 'source': source, 'timestamp': 1700000000000 + rng.randrange(10 ** 6),
+                     'message': template.format(n=rng.randrange(100000), m=rng.randrange(1, 400))})
+    entries = []
+    for _ in range(resources):
+        start = rng.uniform(0, 3000)
+        duration = rng.expovariate(1 / 120)
+        entries.append({'name': f"https://{rng.choice(HOSTS)}/assets/{rng.randrange(200)}.js",
+                        'startTime': start, 'duration': duration, 'responseEnd': start + duration,
+                        'initiatorType': rng.choice(INITIATORS),
+                        'transferSize': int(rng.expovariate(1 / 30000)),
+                        'encodedBodySize': int(rng.expovariate(1 / 30000)),
+                        'decodedBodySize': int(rng.expovariate(1 / 80000)),
+                        'renderBlockingStatus': 'blocking' if rng.random() < 0.05 else 'non-blocking',
+                        'responseStatus': 404 if rng.random() < 0.02 else 200})
+    template = index % 20
+    return {
+        'url': url,
+        'title': f"Page {index}",
+        'page_source': f"<!DOCTYPE html><html><head><title>Page {index}</title></head><body>"
+                       + f"<div class='t{template}'><p>item</p></div>" * (200 + template * 10) + "</body></html>",
+        'console_logs': logs,
+        'js_errors': [{'type': 'error', 'message': "Uncaught TypeError: x is not a function",
+                       'filename': 'https://example.com/app.js', 'lineno': rng.randrange(1, 500), 'colno': 7,
+                       'url': url, 'timestamp': '2024-01-01T00:00:00.000Z'}] * rng.randrange(3),
+        'resources': entries,
+        'performance': {
+            'navigation': {'type': 'navigate', 'redirect': 0, 'dns': rng.uniform(0, 20), 'tcp': rng.uniform(0, 30),
+                           'tls': rng.uniform(0, 30), 'request': rng.uniform(20, 200), 'ttfb': rng.uniform(50, 400),
+                           'download': rng.uniform(1, 50), 'dom_interactive': rng.uniform(300, 1200),
+                           'dom_content_loaded': rng.uniform(400, 1500), 'load': rng.uniform(800, 3000),
+                           'transfer_size': 30000, 'encoded_body_size': 29000, 'decoded_body_size': 90000,
+                           'protocol': 'h2'},
+            'paint': {'first_paint': rng.uniform(200, 900), 'first_contentful_paint': rng.uniform(250, 1000)},
+            'vitals': {'lcp': rng.uniform(500, 3000), 'cls': rng.uniform(0, 0.3), 'inp': None, 'interactions': 0},
+            'long_tasks': {'count': 2, 'total': rng.uniform(50, 300), 'max': 120}
+        },
+        'axe': {'violations': [{'id': 'color-contrast', 'impact': 'serious', 'description': 'Contrast',
+                                'help': 'Elements must have sufficient color contrast',
+                                'nodes': [{'target': [f'.t{template} p']}]}] if template % 3 == 0 else []},
+        'cookies': [{'name': 'session', 'value': f"s{index}", 'domain': 'example.com'}],
+        'local_storage': {'theme': 'dark', 'visits': str(index)},
+        'document_headers': {'Strict-Transport-Security': 'max-age=31536000',
+                             'X-Content-Type-Options': 'nosniff'},
+    }
+
+
+def synthetic_recordings(pages, log_lines, resources=40, seed=42):
+    """Yield pages recordings sharing log_lines console entries between them"""
+    rng = random.Random(seed)
+    per_page, extra = divmod(log_lines, pages) if pages else (0, 0)
+    for index in range(pages):
+        yield synthetic_recording(index, per_page + (1 if index < extra else 0), resources, rng)
+
+
+def save_recordings(path, recordings):
+    """Write recordings as NDJSON, gzip-compressed for .gz paths; returns the count"""
+    opener = gzip.open if path.endswith('.gz') else open
+    count = 0
+    with opener(path, 'wt', encoding='utf-8') as f:
+        for recording in recordings:
+            f.write(json.dumps(recording) + '\n')
+            count += 1
+    return count
+
+
+def load_recordings(path):
+    """Yield recordings from an NDJSON file written by save_recordings()"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
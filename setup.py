@@ -31,9 +31,18 @@ setup(
     ],
     python_requires=">=3.8",
     install_requires=requirements,
+    extras_require={
+        "cdp": ["websockets>=10.0"],
+        "images": ["Pillow>=9.0"],
+        "visual": ["Pillow>=9.0"],
+        "orjson": ["orjson>=3.6"],
+        "zstd": ["zstandard>=0.17"],
+        "session": ["cryptography>=3.1"],
+    },
     entry_points={
         "console_scripts": [
             "aidoc=aidoc.AiDoc:main",
+            "aidoc-results=aidoc.AiDoc:results_main",
         ],
     },
 )
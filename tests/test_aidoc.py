@@ -1,7 +1,26 @@
 import os
+import gzip
+import base64
+import json
+import asyncio
+import time
+from collections import deque
 import pytest
 from unittest.mock import MagicMock, patch
-from aidoc.AiDoc import ConsoleLogHandler, AdvancedFeatures, Colors
+from aidoc.AiDoc import ConsoleLogHandler, AdvancedFeatures, Colors, ErrorCategory, fingerprint_message
+from aidoc.AiDoc import DriverPool, iter_batch_results, load_urls_file, load_sitemap
+from aidoc.AiDoc import BatchReport, default_worker_count, iter_parallel_results
+from aidoc.AiDoc import CDPConnection, CDPPage, JSErrorCollector
+from aidoc.AiDoc import collect_performance_metrics, capture_page_excerpt, capture_page_state
+from aidoc.AiDoc import SecurityHeaderFetcher, extract_document_headers
+from aidoc.AiDoc import AccessibilityCache, AccessibilityScanner, ScreenshotWriter, VisualBaselineStore
+from aidoc.AiDoc import BrowserMemoryProfiler, ReportWriter, export_report, ResultsStore, query_results
+from aidoc.AiDoc import write_store_reports, analyze_waterfall, Tracer, analyze_page, summarize_result
+from aidoc.AiDoc import registrable_domain
+from aidoc.AiDoc import DeltaTracker, iter_watch_events, JS_ERROR_DRAIN_SCRIPT, PERFORMANCE_METRICS_SCRIPT
+from aidoc.AiDoc import capture_session, save_session, load_session, restore_session, wait_until_ready
+from aidoc.AiDoc import RequestFilter, ResponseCache, apply_request_filter, blocked_request_from_log
+from aidoc.AiDoc import summarize_blocked_requests, capture_full_page_png
 
 @pytest.fixture
 def console_handler():
@@ -27,21 +46,154 @@ def test_console_handler_categorization(console_handler):
     assert "JavaScript" in console_handler.error_categories
     assert console_handler.error_categories["JavaScript"] == 1
 
-def test_advanced_features_screenshot(mock_driver, tmp_path):
+def test_categorize_rules_and_cache(console_handler, tmp_path):
+    # Test rule priority, the previously unreachable querySelector term and custom rules
+    assert ErrorCategory.categorize("Failed to load resource: 404") == "Network"
+    assert ErrorCategory.categorize("Failed to execute 'querySelector'") == "DOM"
+    assert ErrorCategory.categorize("Everything is fine") == "Other"
+
+    rules = tmp_path / "rules.json"
+    rules.write_text(json.dumps({"rules": {"Payments": ["stripe"]}}))
+    try:
+        ErrorCategory.load_rules(str(rules))
+        assert ErrorCategory.categorize("Stripe network error") == "Payments"
+        assert ErrorCategory.categorize("network error") == "Network"
+    finally:
+        ErrorCategory.reset()
+    assert ErrorCategory.categorize("Stripe network error") == "Network"
+
+    entry = {"level": "ERROR", "message": "x is not a function", "timestamp": 1234567890}
+    console_handler.add_log(entry)
+    assert entry["category"] == "JavaScript"
+
+def test_screenshot_writer_downscales_to_jpeg(tmp_path):
+    # Test optional Pillow re-encoding
+    Image = pytest.importorskip('PIL.Image')
+    import io
+    buffer = io.BytesIO()
+    Image.new('RGBA', (400, 200), (255, 0, 0, 255)).save(buffer, format='PNG')
+    writer = ScreenshotWriter()
+    filename = writer.submit(base64.b64encode(buffer.getvalue()).decode('ascii'), str(tmp_path),
+                             image_format='jpeg', quality=70, max_width=100)
+    writer.wait()
+    assert filename.endswith('_w100_q70.jpg')
+    assert Image.open(filename).size == (100, 50)
+
+def test_visual_baseline_store_diffs_changed_tiles(tmp_path):
+    # Test baseline creation, the hash shortcut and the tiled pixel diff
+    pytest.importorskip('numpy')
+    Image = pytest.importorskip('PIL.Image')
+    import io
+
+    def png(box=None):
+        image = Image.new('RGB', (256, 1100), (255, 255, 255))
+        if box:
+            image.paste((255, 0, 0), box)
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    store = VisualBaselineStore(str(tmp_path / "baselines"), str(tmp_path / "diffs"))
+    assert store.check("http://example.com", png())['status'] == 'baseline_created'
+    assert store.check("http://example.com", png())['status'] == 'unchanged'
+
+    result = store.check("http://example.com", png((0, 512, 64, 544)))
+    assert result['status'] == 'changed'
+    assert result['changed_pixels'] == 64 * 32
+    assert result['changed_tiles'] == 2
+    # The mask has one pixel per 32px tile
+    assert Image.open(result['diff_mask']).getbbox() == (0, 16, 2, 17)
+
+def test_full_page_capture_clips_to_content(mock_driver):
+    # Test that the capture covers the content size and scales down very tall pages
+    mock_driver.execute_cdp_cmd.side_effect = lambda cmd, params: (
+        {'cssContentSize': {'x': 0, 'y': 0, 'width': 1000.5, 'height': 32000}} if cmd == 'Page.getLayoutMetrics'
+        else {'data': base64.b64encode(b'png').decode('ascii')})
+    assert capture_full_page_png(mock_driver, max_pixels=1001 * 8000) == b'png'
+    clip = mock_driver.execute_cdp_cmd.call_args[0][1]['clip']
+    assert (clip['width'], clip['height']) == (1001, 32000)
+    assert clip['scale'] == pytest.approx(0.5)
+
+def test_console_handler_streaming_bounded(tmp_path):
+    # Test that streaming mode keeps a capped buffer, full counters and a complete NDJSON sink
+    sink = tmp_path / "console.ndjson"
+    handler = ConsoleLogHandler(max_entries=3, sink=str(sink), page_url="http://example.com")
+    for i in range(10):
+        handler.add_log({"level": "SEVERE", "message": f"net::ERR_FAILED {i}", "timestamp": 1234567890})
+    handler.close()
+
+    assert len(handler.logs) == 3
+    assert handler.total_count == 10
+    assert handler.dropped_count == 7
+    assert handler.error_categories == {"Network": 10}
+    lines = sink.read_text().splitlines()
+    assert len(lines) == 10
+    assert json.loads(lines[0])["page_url"] == "http://example.com"
+
+    formatted = list(handler.iter_formatted_logs())
+    assert "7 older entries not shown" in formatted[0]
+    assert handler.get_formatted_logs() == "\n".join(formatted)
+
+def test_console_handler_dedupes_by_fingerprint():
+    # Test that repeated errors differing only in ids, URLs' queries and positions collapse into one group
+    handler = ConsoleLogHandler(dedupe=True)
+    for i in range(50):
+        handler.add_log({
+            "level": "SEVERE",
+            "message": f"https://api.example.com/poll?id={1000 + i} {i}:{i + 7} Failed to load resource: status of 500",
+            "timestamp": 1234567890 + i
+        })
+    handler.add_log({"level": "WARNING", "message": "x is not a function", "timestamp": 1234567999})
+
+    assert len(handler.error_groups) == 2
+    poll = handler.error_groups[fingerprint_message("https://api.example.com/poll?id=1 1:2 Failed to load resource: status of 500")[0]]
+    assert poll["count"] == 50
+    assert poll["first_seen"] == 1234567890
+    assert poll["last_seen"] == 1234567939
+    assert fingerprint_message("status of 500")[0] != fingerprint_message("status of 404")[0]
+
+    formatted = handler.get_formatted_logs()
+    assert formatted.count("OCCURRENCES:") == 2
+
+    # Without dedupe, entries are categorized but never fingerprinted
+    plain = ConsoleLogHandler()
+    plain.add_log({"level": "SEVERE", "message": "https://api.example.com/poll?id=1 boom", "timestamp": 1})
+    assert not plain.error_groups and 'fingerprint' not in plain.logs[0]
+    assert plain.error_categories
+
+def test_advanced_features_screenshot(mock_driver, tmp_path, monkeypatch):
     # Test screenshot capture
-    with patch('os.makedirs'):
-        features = AdvancedFeatures(
-            mock_driver,
-            enable_screenshots=True
-        )
-        mock_driver.save_screenshot.return_value = True
-        result = features.capture_screenshot(1)
-        assert result is not None
-        assert mock_driver.save_screenshot.called
+    monkeypatch.chdir(tmp_path)
+    writer = ScreenshotWriter()
+    mock_driver.get_screenshot_as_base64.return_value = base64.b64encode(b"\x89PNG\r\n\x1a\nfake-image").decode('ascii')
+    features = AdvancedFeatures(
+        mock_driver,
+        enable_screenshots=True,
+        screenshot_writer=writer
+    )
+    result = features.capture_screenshot(1)
+    assert result is not None
+    assert mock_driver.get_screenshot_as_base64.called
+    writer.wait()
+    assert os.path.exists(result)
+
+def test_screenshot_writer_dedupes_by_content(tmp_path):
+    # Test background writes with content-hashed names
+    writer = ScreenshotWriter()
+    png = base64.b64encode(b"\x89PNG\r\n\x1a\nfake-image").decode('ascii')
+    first = writer.submit(png, str(tmp_path))
+    second = writer.submit(png, str(tmp_path))
+    other = writer.submit(base64.b64encode(b"other").decode('ascii'), str(tmp_path))
+    writer.wait()
+    assert first == second != other
+    assert open(first, 'rb').read() == b"\x89PNG\r\n\x1a\nfake-image"
+    assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(first), os.path.basename(other)])
 
 def test_advanced_features_memory():
-    # Test memory monitoring
+    # Test memory monitoring of the browser process tree and page heap
     driver = MagicMock()
+    driver.service.process.pid = os.getpid()
+    driver.execute_cdp_cmd.return_value = {'usedSize': 8 * 1024 * 1024, 'totalSize': 16 * 1024 * 1024}
     features = AdvancedFeatures(
         driver,
         enable_memory=True
@@ -49,8 +201,34 @@ def test_advanced_features_memory():
     memory_info = features.get_memory_usage()
     assert memory_info is not None
     assert 'rss' in memory_info
-    assert 'vms' in memory_info
     assert 'percent' in memory_info
+    assert memory_info['js_heap_used'] == 8
+    assert memory_info['peak']['js_heap_total'] == 16 * 1024 * 1024
+    driver.execute_cdp_cmd.assert_called_with('Runtime.getHeapUsage', {})
+
+def test_memory_profiler_flags_growing_heap():
+    # Test leak detection from post-load heap samples
+    driver = MagicMock()
+    driver.service.process.pid = os.getpid()
+    heap = iter(range(0, 100 * 1024 * 1024, 2 * 1024 * 1024))
+    driver.execute_cdp_cmd.side_effect = lambda *args: {'usedSize': next(heap), 'totalSize': 0}
+    driver.execute_async_script.return_value = None
+    driver.execute_script.return_value = True
+    driver.timeouts.script = 30
+    profiler = BrowserMemoryProfiler(driver, interval=0.01)
+    profiler.start()
+    profiler.mark_loaded()
+    time.sleep(0.2)
+    profiler.stop()
+    # The UA memory measurement must not leave its longer script timeout behind
+    assert driver.set_script_timeout.call_args_list[-1][0] == (30,)
+
+    summary = profiler.summary()
+    assert summary['samples'][0]['phase'] == 'load'
+    assert summary['samples'][0]['js_heap_used'] is None
+    assert summary['leak']['metric'] == 'js_heap_used'
+    assert summary['leak']['suspected']
+    assert summary['peak']['js_heap_used'] == summary['samples'][-1]['js_heap_used']
 
 def test_advanced_features_storage(mock_driver):
     # Test storage inspection
@@ -65,6 +243,246 @@ def test_advanced_features_storage(mock_driver):
     assert len(storage_info['cookies']) == 1
     assert len(storage_info['localStorage']) == 1
 
+def test_js_error_collector_drains_incrementally():
+    # Test early CDP registration and cursor-based draining across a navigation
+    driver = MagicMock(spec=['execute_cdp_cmd', 'execute_script'])
+    driver.execute_cdp_cmd.return_value = {"identifier": "1"}
+    collector = JSErrorCollector(driver, capacity=2)
+    assert collector.install()
+    assert JSErrorCollector(driver).install()
+    assert driver.execute_cdp_cmd.call_count == 1
+
+    error = lambda seq: {"type": "error", "message": f"boom {seq}", "seq": seq}
+    driver.execute_script.side_effect = [
+        {"id": "doc1", "total": 2, "dropped": 0, "entries": [error(1), error(2)]},
+        {"id": "doc1", "total": 5, "dropped": 1, "entries": [error(4), error(5)]},
+        {"id": "doc2", "total": 1, "dropped": 0, "entries": [error(1)]},
+    ]
+    assert len(collector.drain()) == 2
+    assert [e["seq"] for e in collector.drain()] == [4, 5]
+    assert driver.execute_script.call_args[0][1:] == (2, "doc1")
+    assert len(collector.drain()) == 1
+    assert driver.execute_script.call_args[0][1:] == (5, "doc1")
+    assert collector.dropped == 1
+    assert len(collector.errors) == 2
+
+def test_collect_performance_metrics(mock_driver):
+    # Test that navigation metrics are passed through and resources are aggregated per initiator
+    mock_driver.execute_script.return_value = {
+        "navigation": {"dns": 5, "tcp": 10, "ttfb": 120, "dom_content_loaded": 300, "load": 450},
+        "paint": {"first_paint": 200, "first_contentful_paint": 210},
+        "vitals": {"lcp": 800, "cls": 0.05, "inp": 40, "interactions": 1},
+        "long_tasks": {"count": 2, "total": 180, "max": 120}
+    }
+    resources = [
+        {"initiatorType": "script", "duration": 50, "transferSize": 1000, "encodedBodySize": 900, "decodedBodySize": 3000},
+        {"initiatorType": "script", "duration": 150, "transferSize": 2000, "encodedBodySize": 1900, "decodedBodySize": 6000},
+        {"initiatorType": "img", "duration": 20, "transferSize": 0, "encodedBodySize": 500, "decodedBodySize": 500},
+    ]
+    metrics = collect_performance_metrics(mock_driver, resources)
+    assert metrics["navigation"]["ttfb"] == 120
+    assert metrics["vitals"]["lcp"] == 800
+    scripts = metrics["resources"]["by_initiator"]["script"]
+    assert scripts["count"] == 2
+    assert scripts["transfer_size"] == 3000
+    assert scripts["max_duration"] == 150
+    assert metrics["resources"]["totals"]["decoded_body_size"] == 9500
+
+def test_capture_page_excerpt_avoids_page_source(tmp_path):
+    # Test that the excerpt comes from one script call and snapshots are streamed in chunks
+    # Emoji straddle the excerpt and chunk boundaries, which count UTF-16 code units
+    html_source = "<html>" + "x" * 993 + "\U0001F600" + "x" * 22 + "\U0001F600" + "x" * 4000 + "</html>"
+    units = html_source.encode('utf-16-le')
+
+    def js_slice(start, end):
+        # Mirror the scripts: step back when the boundary falls inside a surrogate pair
+        if end < len(units) // 2 and end - 1 > start and 0xD800 <= int.from_bytes(units[2 * end - 2:2 * end], 'little') <= 0xDBFF:
+            end -= 1
+        return units[2 * start:2 * end].decode('utf-16-le'), end
+
+    def execute_script(script, *args):
+        if "outerHTML" in script:
+            return {"length": len(units) // 2, "excerpt": js_slice(0, args[0])[0]}
+        if "__aidocSnapshot ||" in script:
+            text, end = js_slice(args[0], min(args[1], len(units) // 2))
+            return {"text": text, "end": end}
+        return None
+
+    driver = MagicMock()
+    driver.execute_script.side_effect = execute_script
+    type(driver).page_source = property(lambda self: pytest.fail("page_source should not be read"))
+
+    excerpt, length = capture_page_excerpt(driver)
+    assert excerpt == html_source[:999] + "..."
+    assert length == len(units) // 2
+
+    snapshot = tmp_path / "dom" / "page.html.gz"
+    capture_page_excerpt(driver, snapshot_path=str(snapshot), chunk_size=1024)
+    with gzip.open(snapshot, "rt", encoding="utf-8") as f:
+        assert f.read() == html_source
+
+def test_capture_page_state_single_round_trip():
+    # Test that all probes are answered by one execute_script call without extra WebDriver reads
+    driver = MagicMock(spec=['execute_script'])
+    driver.execute_script.return_value = {
+        "schema": 1,
+        "probes": {
+            "location": {"version": 1, "value": {"url": "http://example.com/", "title": "Example"}},
+            "excerpt": {"version": 1, "value": {"length": 12, "excerpt": "<html></html>"}},
+            "network": {"version": 2, "value": [{"name": "a.js", "initiatorType": "script", "transferSize": 10}]},
+            "js_errors": {"version": 2, "value": {"id": "d", "total": 1, "dropped": 0, "entries": [{"message": "boom"}]}},
+            "performance": {"version": 1, "value": {"navigation": {"ttfb": 10}, "vitals": None}},
+            "local_storage": {"version": 1, "error": "SecurityError"},
+        }
+    }
+    state = capture_page_state(driver, "http://example.com/", JSErrorCollector(driver),
+                               extra_probes=["performance", "local_storage"])
+    assert driver.execute_script.call_count == 1
+    assert state["title"] == "Example"
+    assert state["js_errors"] == [{"message": "boom"}]
+    assert state["performance"]["resources"]["totals"]["transfer_size"] == 10
+    assert state["local_storage"] is None
+
+def test_waterfall_critical_path_and_flags():
+    # Test critical path, resource flags and third-party aggregation
+    def entry(name, start, end, initiator='script', size=1000, blocking='non-blocking'):
+        return {'name': name, 'startTime': start, 'responseEnd': end, 'duration': end - start,
+                'initiatorType': initiator, 'transferSize': size, 'renderBlockingStatus': blocking}
+
+    entries = [
+        entry("https://www.example.co.uk/app.css", 10, 200, 'link', blocking='blocking'),
+        entry("https://cdn.example.co.uk/app.js", 20, 150),
+        entry("https://tracker.io/t.js", 210, 1500, size=900 * 1024),
+        entry("https://cdn.example.co.uk/app.js", 250, 300),
+        entry("https://www.example.co.uk/hero.jpg", 1510, 1600, 'img'),
+    ]
+    waterfall = analyze_waterfall(entries, "https://www.example.co.uk/")
+
+    assert [r['name'] for r in waterfall['critical_path']] == [
+        "https://www.example.co.uk/app.css", "https://tracker.io/t.js", "https://www.example.co.uk/hero.jpg"]
+    assert waterfall['critical_path_duration'] == 1590
+    assert waterfall['peak_concurrency'] == 2
+    assert waterfall['flags'] == {'slow': 1, 'large': 1, 'blocking': 1, 'duplicate': 2}
+    assert waterfall['flagged'][0]['reasons'] == ['slow', 'large']
+    assert waterfall['duplicates'] == [{'name': "https://cdn.example.co.uk/app.js", 'count': 2, 'wasted_bytes': 1000}]
+    assert waterfall['third_party']['domains'] == ["tracker.io"]
+    assert waterfall['by_initiator']['script']['count'] == 3
+    assert waterfall['by_domain']['tracker.io']['transfer_size'] == 900 * 1024
+
+    # Short first-party names under a country code are not mistaken for a suffix
+    assert registrable_domain("www.bmw.de") == registrable_domain("static.bmw.de") == "bmw.de"
+    waterfall = analyze_waterfall([entry("https://www.bmw.de/app.js", 0, 10),
+                                   entry("https://cdn.bmw.de/app.css", 0, 10, 'link')], "https://www.bmw.de/")
+    assert waterfall['third_party']['domains'] == []
+
+def test_waterfall_critical_path_skips_zero_duration_and_unfinished():
+    # Test that entries ending where they start do not repeat on the critical path
+    entries = [
+        {'name': 'https://example.com/a.js', 'startTime': 0, 'responseEnd': 100, 'duration': 100},
+        {'name': 'https://example.com/b.js', 'startTime': 100, 'responseEnd': 100, 'duration': 0},
+        {'name': 'https://example.com/c.js', 'startTime': 150, 'responseEnd': 200, 'duration': 50},
+    ]
+    path = [r['name'] for r in analyze_waterfall(entries)['critical_path']]
+    assert path == ['https://example.com/b.js', 'https://example.com/c.js']
+
+    # A CDP request that never finished has a start time only
+    unfinished = [{'name': 'https://example.com/', 'startTime': 0, 'responseEnd': 50, 'duration': 50},
+                  {'name': 'https://example.com/poll', 'startTime': 400}]
+    path = [r['name'] for r in analyze_waterfall(unfinished)['critical_path']]
+    assert path == ['https://example.com/', 'https://example.com/poll']
+
+def test_security_headers_from_browser_response(mock_driver):
+    # Test that the rendered document's headers are used without a second request
+    def perf_entry(method, params):
+        return {"message": json.dumps({"message": {"method": method, "params": params}})}
+
+    log = [
+        perf_entry("Network.requestWillBeSent", {"type": "Document"}),
+        perf_entry("Network.responseReceived", {"type": "Script", "response": {"url": "http://example.com/a.js", "headers": {}}}),
+        perf_entry("Network.responseReceived", {"type": "Document", "response": {
+            "url": "http://example.com/", "headers": {"x-frame-options": "DENY"}}}),
+    ]
+    headers = extract_document_headers(log, "http://example.com/")
+    assert headers == {"x-frame-options": "DENY"}
+
+    fetcher = MagicMock()
+    features = AdvancedFeatures(mock_driver, enable_security=True, header_fetcher=fetcher)
+    features.prefetched['document_headers'] = headers
+    security = features.analyze_security_headers()
+    assert security['source'] == 'browser'
+    assert security['headers']['X-Frame-Options'] == "DENY"
+    assert security['headers']['Content-Security-Policy'] == "Not Set"
+    assert not fetcher.fetch.called
+
+def test_security_header_fetcher_caches_per_origin():
+    # Test HEAD-first lookups with GET fallback and one request per origin
+    fetcher = SecurityHeaderFetcher(timeout=5)
+    session = MagicMock()
+    session.head.return_value = MagicMock(status_code=405, headers={})
+    session.get.return_value = MagicMock(status_code=200, headers={"X-Frame-Options": "SAMEORIGIN"})
+    with patch('requests.Session', return_value=session):
+        first = fetcher.fetch("https://example.com/a")
+        second = fetcher.fetch("https://example.com/b?x=1")
+    assert first is second
+    assert session.head.call_count == 1
+    assert session.get.call_args[1]["timeout"] == 5
+
+def test_accessibility_scanner_reuses_template_results(tmp_path):
+    # Test that pages sharing a DOM structure hash run axe only once, and the cache persists
+    driver = MagicMock()
+    driver.current_url = "http://example.com/product/2"
+    driver.execute_script.return_value = {"hash": "abc", "origin": "http://example.com"}
+    driver.execute_async_script.return_value = {"violations": [{"id": "image-alt"}], "url": "http://example.com/product/1"}
+    cache = AccessibilityCache(path=str(tmp_path / "a11y.json"))
+
+    scanner = AccessibilityScanner(driver, cache=cache, exclude=["#ads"], rules=["image-alt"])
+    first = scanner.run()
+    second = scanner.run()
+    assert driver.execute_async_script.call_count == 1
+    context, options = driver.execute_async_script.call_args[0][1:]
+    assert context == {"include": [["html"]], "exclude": [["#ads"]]}
+    assert options == {"runOnly": {"type": "rule", "values": ["image-alt"]}}
+    assert second["cached"] and second["url"] == "http://example.com/product/2"
+    assert second["violations"] == first["violations"]
+    # axe is injected into the top frame only for the scan that ran, never registered early
+    injected = [c for c in driver.execute_script.call_args_list if '__aidocAxe' in c[0][0]]
+    assert len(injected) == 1
+    driver.execute_cdp_cmd.assert_not_called()
+
+    # A different scope must not reuse results from another scope
+    AccessibilityScanner(driver, cache=cache).run()
+    assert driver.execute_async_script.call_count == 2
+
+    cache.save()
+    reloaded = AccessibilityCache()
+    reloaded.load(str(tmp_path / "a11y.json"))
+    assert AccessibilityScanner(driver, cache=reloaded, exclude=["#ads"], rules=["image-alt"]).run()["cached"]
+
+def test_process_pool_accessibility_cache_reaches_parent(tmp_path, monkeypatch):
+    # Test that workers send their new axe results back and the parent saves them
+    import aidoc.AiDoc as AiDoc
+    monkeypatch.setattr(AiDoc, 'default_accessibility_cache', AccessibilityCache())
+    monkeypatch.setattr(AiDoc, '_worker_state', {})
+    driver = MagicMock()
+    driver.execute_script.side_effect = lambda script, *args: (
+        {"hash": "abc", "origin": "http://example.com"} if script == AiDoc.DOM_STRUCTURE_SCRIPT else None)
+    driver.execute_async_script.return_value = {"violations": [{"id": "image-alt"}]}
+    cache_path = str(tmp_path / "a11y.json")
+    AiDoc._init_worker(lambda **kwargs: driver, {'a11y_cache': cache_path, 'enable_accessibility': True})
+    first = AiDoc._process_url("http://example.com/1")
+    second = AiDoc._process_url("http://example.com/2")
+    assert len(first['a11y_cache_entries']) == 1 and second['a11y_cache_entries'] == []
+
+    # The parent merges the entries into a fresh cache and persists them
+    monkeypatch.setattr(AiDoc, 'default_accessibility_cache', AccessibilityCache(path=cache_path))
+    monkeypatch.setattr(AiDoc, 'iter_parallel_results', lambda urls, **kwargs: iter([
+        {'url': "http://example.com/1", 'error': "timeout", 'a11y_cache_entries': first['a11y_cache_entries']}]))
+    monkeypatch.chdir(tmp_path)
+    AiDoc.main_batch_impl(["http://example.com/1"], workers=1)
+    reloaded = AccessibilityCache()
+    reloaded.load(cache_path)
+    assert reloaded.get(first['a11y_cache_entries'][0][0])["violations"] == [{"id": "image-alt"}]
+
 def test_colors():
     # Test ANSI color codes
     assert Colors.RED.startswith('\033[')
@@ -86,5 +504,554 @@ def test_export_results(mock_driver, tmp_path):
         )
         assert mock_driver.save_screenshot.called
 
+def test_report_writer_appends_ndjson_records(tmp_path):
+    # Test that successive runs append typed records to one compressed NDJSON file
+    path = str(tmp_path / "crawl.ndjson.gz")
+    page_info = {"url": "http://example.com", "title": "Test",
+                 "network_requests": [{"url": "http://example.com/app.js", "status": 404}]}
+    for run in range(2):
+        writer = ReportWriter(path, 'ndjson')
+        writer.write_page(page_info, [{"level": "SEVERE", "message": f"run {run}"}], {"storage": {"cookies": []}})
+        writer.close()
+
+    with gzip.open(path, 'rt') as f:
+        records = [json.loads(line) for line in f]
+    assert [r['type'] for r in records[:4]] == ['page', 'network_request', 'console', 'advanced']
+    assert 'network_requests' not in records[0]['page_info']
+    assert [r['message'] for r in records if r['type'] == 'console'] == ['run 0', 'run 1']
+    assert records[2]['page_url'] == "http://example.com"
+
+def test_export_report_streams_structured_json(tmp_path):
+    # Test that JSON exports hold structured entries, not the colored console text
+    logs = deque([{"level": "SEVERE", "message": "Uncaught TypeError", "timestamp": 1}])
+    filename = export_report({"url": "http://example.com"}, logs, {"security": {}}, 'json',
+                             reports_dir=str(tmp_path))
+    data = json.load(open(filename))
+    assert data['console_logs'] == list(logs)
+    assert data['advanced_features'] == {"security": {}}
+
+    writer = ReportWriter(str(tmp_path / "pages.json"), 'json')
+    for i in range(3):
+        export_report({"url": f"http://example.com/{i}"}, logs, {}, 'json', writer=writer)
+    writer.close()
+    assert [page['page_info']['url'] for page in json.load(open(writer.path))][-1] == "http://example.com/2"
+
+def test_results_store_trends_across_runs(tmp_path):
+    # Test that stored runs can be queried for error trends per URL and category
+    path = str(tmp_path / "results.db")
+    handler = ConsoleLogHandler(dedupe=True)
+    handler.add_log({"level": "SEVERE", "message": "net::ERR_FAILED /api/12345", "timestamp": 1})
+    handler.add_log({"level": "SEVERE", "message": "net::ERR_FAILED /api/67890", "timestamp": 2})
+    summary = {
+        'url': "http://example.com", 'error': None, 'elapsed': 1.0, 'console_logs': [],
+        'page_info': {'url': "http://example.com", 'title': "Test", 'load_time': 0.5,
+                      # Selenium resource timing entries carry responseStatus, CDP ones status
+                      'network_requests': [{'name': "http://example.com/app.js", 'initiatorType': 'script',
+                                            'duration': 12.5, 'transferSize': 2048, 'responseStatus': 200},
+                                           {'name': "http://example.com/api", 'initiatorType': 'fetch',
+                                            'status': 500}]},
+        'error_groups': list(handler.error_groups.values()),
+        'error_categories': dict(handler.error_categories),
+        'advanced_features': {'accessibility': {'violations': [{'id': 'image-alt', 'impact': 'critical',
+                                                                 'description': 'Images need alt text',
+                                                                 'nodes': [{}, {}]}]}}
+    }
+    for run in range(2):
+        store = ResultsStore(path, batch_pages=10)
+        store.start_run(f"run {run}")
+        store.add_page(summary)
+        store.add_page({'url': "http://example.com/broken", 'error': "timeout"})
+        store.close()
+
+    columns, rows = query_results(path, 'trends')
+    assert columns == ['day', 'url', 'category', 'errors']
+    assert rows[0][1:] == ("http://example.com", "Network", 4)
+    _, rows = query_results(path, 'top-errors')
+    assert rows[0][2:4] == (4, 1)
+    _, rows = query_results(path, 'runs')
+    assert [(r[3], r[4]) for r in rows] == [(2, 1), (2, 1)]
+    _, rows = query_results(path, "SELECT rule, node_count FROM violations")
+    assert rows == [('image-alt', 2), ('image-alt', 2)]
+    _, rows = query_results(path, "SELECT DISTINCT url, status FROM network_requests ORDER BY url")
+    assert rows == [("http://example.com/api", 500), ("http://example.com/app.js", 200)]
+
+def test_batch_closes_store_when_batch_raises(tmp_path, monkeypatch):
+    # Test that a failing batch still finishes the stored run and releases the database
+    import aidoc.AiDoc as AiDoc
+
+    def failing_results(urls, **kwargs):
+        raise RuntimeError("browser crashed")
+        yield
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(AiDoc, 'iter_batch_results', failing_results)
+    path = str(tmp_path / "results.db")
+    with pytest.raises(RuntimeError):
+        AiDoc.main_batch_impl(["http://example.com"], store=path)
+    _, rows = query_results(path, "SELECT finished_at FROM runs")
+    assert len(rows) == 1 and rows[0][0] is not None
+
+def test_html_report_embeds_data_once(tmp_path):
+    # Test that the HTML report carries one compact, script-safe JSON payload
+    logs = [{"level": "SEVERE", "category": "JavaScript", "message": f"</script><b>{i}</b>", "timestamp": 1}
+            for i in range(1000)]
+    logs.append({"level": "SEVERE", "category": "JavaScript", "message": "<!--<script>a && b", "timestamp": 1})
+    filename = export_report({"url": "http://example.com", "title": "Test", "load_time": 1.0}, logs,
+                             {"security": {"headers": {"X-Frame-Options": "Not Set"}, "source": "browser"}}, 'html',
+                             reports_dir=str(tmp_path))
+    document = open(filename, encoding='utf-8').read()
+    assert document.count('<script') == 2 and document.count('</script>') == 2
+    payload = document.split('id="aidoc-data">')[1].split('</script>')[0]
+    data = json.loads(payload)
+    console = data['sections'][0]
+    assert console['columns'][0] == 'Level'
+    assert len(console['rows']) == 1001
+    assert console['rows'][0][4] == "</script><b>0</b>"
+    assert console['rows'][-1][4] == "<!--<script>a && b"
+    assert '<!--' not in payload and '&' not in payload
+    assert data['sections'][-1]['title'] == "Security Headers (from browser)"
+    assert data['sections'][-1]['rows'] == [["X-Frame-Options", "Not Set"]]
+
+def test_store_reports_render_index_and_pages(tmp_path):
+    # Test HTML reports generated from the results store
+    path = str(tmp_path / "results.db")
+    store = ResultsStore(path)
+    store.add_page({'url': "http://example.com", 'error': None, 'elapsed': 1.0,
+                    'console_logs': [{"level": "SEVERE", "category": "Network", "message": "boom", "timestamp": 1}],
+                    'page_info': {'url': "http://example.com", 'title': "Home", 'load_time': 0.5},
+                    'error_groups': [], 'error_categories': {"Network": 1}, 'advanced_features': {}})
+    store.add_page({'url': "http://example.com/down", 'error': "timeout"})
+    store.close()
+
+    index = write_store_reports(path, str(tmp_path / "html"))
+    rows = json.loads(open(index).read().split('id="aidoc-data">')[1].split('</script>')[0])['sections'][0]['rows']
+    assert rows[0][0] == {'text': "http://example.com", 'href': "page_1.html"}
+    assert rows[1][-1] == "timeout"
+    page = open(os.path.join(os.path.dirname(index), "page_1.html")).read()
+    assert '"boom"' in page
+
+def test_tracer_writes_chrome_trace(tmp_path):
+    # Test span timings and the Chrome trace event format
+    tracer = Tracer()
+    tracer.recording = True
+    timings = {}
+    for _ in range(2):
+        with tracer.span('page.load', timings=timings, url="http://example.com"):
+            time.sleep(0.01)
+    assert timings['page.load'] >= 0.02
+
+    trace = json.load(open(tracer.write_trace(str(tmp_path / "trace.json"))))
+    spans = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+    assert [e['name'] for e in spans] == ['page.load', 'page.load']
+    assert spans[0]['cat'] == 'page' and spans[0]['dur'] >= 10000
+    assert spans[0]['args'] == {'url': "http://example.com"}
+    assert any(e['ph'] == 'M' and e['name'] == 'process_name' for e in trace['traceEvents'])
+    assert not tracer.events
+
+def test_analyze_page_releases_sink_and_sampler_on_failure(tmp_path):
+    # Test that a page failing after load closes its log sink and stops the memory sampler
+    import threading
+    sink = tmp_path / "console.ndjson"
+    driver = MagicMock()
+    driver.get_log.side_effect = lambda kind: [{"level": "SEVERE", "message": "boom", "timestamp": 1}, None]
+    with patch.object(ConsoleLogHandler, 'close', autospec=True, side_effect=ConsoleLogHandler.close) as close:
+        with pytest.raises(AttributeError):
+            analyze_page(driver, "http://example.com", log_sink=str(sink), enable_memory=True, memory_interval=0.01)
+    assert close.call_args[0][0]._sink is None
+    assert sink.read_text().count("boom") == 1
+
+    driver = MagicMock()
+    driver.get.side_effect = RuntimeError("navigation failed")
+    with pytest.raises(RuntimeError):
+        analyze_page(driver, "http://example.com", enable_memory=True, memory_interval=0.01)
+    assert not any(t.name == 'aidoc-memory' and t.is_alive() for t in threading.enumerate())
+
+def test_stage_timings_merge_into_batch_report():
+    # Test that per-page stage timings reach the page info and the batch report
+    result = analyze_page(MagicMock(), "http://example.com", enable_storage=True)
+    assert {'page.setup', 'page.load', 'page.capture_state', 'page.console_logs',
+            'advanced.storage'} <= set(result['page_info']['timings'])
+
+    report = BatchReport()
+    report.add(summarize_result(result))
+    report.add(summarize_result(result))
+    stage = report.to_dict()['stage_timings']['page.load']
+    assert stage['count'] == 2
+    assert stage['mean'] == pytest.approx(result['timings']['page.load'], abs=1e-3)
+
+def test_driver_pool_reuses_drivers():
+    # Test that released drivers are handed out again instead of starting new ones
+    factory = MagicMock(side_effect=lambda **kwargs: MagicMock())
+    with DriverPool(2, driver_factory=factory) as pool:
+        first = pool.acquire()
+        pool.release(first)
+        assert pool.acquire() is first
+        pool.acquire()
+        assert factory.call_count == 2
+    assert first.quit.called
+
+def test_batch_results_stream_per_page():
+    # Test batch analysis over a pool smaller than the URL list
+    factory = MagicMock(side_effect=lambda **kwargs: MagicMock())
+    urls = [f"http://example.com/{i}" for i in range(5)]
+    results = list(iter_batch_results(urls, pool_size=2, driver_factory=factory))
+    assert sorted(r['url'] for r in results) == urls
+    assert all(r['error'] is None for r in results)
+    assert factory.call_count <= 2
+
+def test_batch_results_report_driver_start_failures_per_url():
+    # Test that a driver that fails to start fails its URL instead of the whole batch
+    factory = MagicMock(side_effect=RuntimeError("chrome failed to start"))
+    urls = [f"http://example.com/{i}" for i in range(3)]
+    results = list(iter_batch_results(urls, pool_size=1, driver_factory=factory))
+    assert sorted(r['url'] for r in results) == urls
+    assert all(r['error'] == "chrome failed to start" for r in results)
+
+def failing_driver_factory(**kwargs):
+    """Picklable driver factory that never starts a browser"""
+    raise RuntimeError("chrome failed to start")
+
+def test_parallel_results_report_driver_start_failures_per_url():
+    # Test that a worker whose driver fails to start fails its URLs instead of breaking the pool
+    urls = [f"http://example.com/{i}" for i in range(3)]
+    results = list(iter_parallel_results(urls, workers=2, driver_factory=failing_driver_factory))
+    assert sorted(r['url'] for r in results) == urls
+    assert all(r['error'] == "chrome failed to start" for r in results)
+
+def test_load_urls_file_and_sitemap(tmp_path):
+    # Test URL list and sitemap parsing
+    urls_file = tmp_path / "urls.txt"
+    urls_file.write_text("# nightly\nhttp://example.com/a\n\nhttp://example.com/b\n")
+    assert load_urls_file(str(urls_file)) == ["http://example.com/a", "http://example.com/b"]
+
+    sitemap = tmp_path / "sitemap.xml"
+    sitemap.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        '<url><loc>http://example.com/a</loc></url>'
+        '<url><loc> http://example.com/c </loc></url>'
+        '</urlset>'
+    )
+    assert load_sitemap(str(sitemap)) == ["http://example.com/a", "http://example.com/c"]
+
+class FakeDriver:
+    """Minimal picklable driver for process pool tests"""
+
+    def __init__(self, **kwargs):
+        self.current_url = "about:blank"
+        self.title = ""
+        self.page_source = "<html></html>"
+
+    def get(self, url):
+        self.current_url = url
+        self.title = url.rsplit('/', 1)[-1]
+
+    def execute_script(self, script, *args):
+        return []
+
+    def execute_cdp_cmd(self, cmd, params):
+        return {}
+
+    def get_log(self, log_type):
+        if self.current_url.endswith('/broken'):
+            return [{"level": "SEVERE", "message": "net::ERR_FAILED", "source": "network", "timestamp": 1234567890}]
+        return []
+
+    def quit(self):
+        pass
+
+def test_default_worker_count_caps_by_memory():
+    # Test that the worker count is bounded by both cores and free memory
+    with patch('os.cpu_count', return_value=32), \
+         patch('psutil.virtual_memory', return_value=MagicMock(available=2048 * 1024 * 1024)):
+        assert default_worker_count(memory_per_worker_mb=512) == 4
+    with patch('os.cpu_count', return_value=2):
+        assert default_worker_count(memory_per_worker_mb=1) == 2
+
+def test_parallel_results_merge_into_one_report():
+    # Test process pool analysis and merging of per-worker results
+    urls = ["http://example.com/ok", "http://example.com/broken", "http://example.com/other"]
+    report = BatchReport()
+    for summary in iter_parallel_results(urls, workers=2, driver_factory=FakeDriver):
+        report.add(summary)
+    merged = report.to_dict()
+    assert merged['page_count'] == 3
+    assert merged['failures'] == 0
+    assert merged['error_categories'] == {"Network": 1}
+    assert sum(merged['pages_per_worker'].values()) == 3
+
+class FakeWebSocket:
+    """Answers CDP commands and pushes scripted events for a single session"""
+
+    def __init__(self, events):
+        self.events = events
+        self.incoming = asyncio.Queue()
+
+    async def send(self, raw):
+        message = json.loads(raw)
+        result = {}
+        if message['method'] == 'Target.createTarget':
+            result = {'targetId': 'T1'}
+        elif message['method'] == 'Target.attachToTarget':
+            result = {'sessionId': 'S1'}
+        elif message['method'] == 'Page.navigate':
+            for method, params in self.events:
+                await self.incoming.put(json.dumps({'sessionId': 'S1', 'method': method, 'params': params}))
+        await self.incoming.put(json.dumps({'id': message['id'], 'result': result}))
+
+    async def close(self):
+        await self.incoming.put(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raw = await self.incoming.get()
+        if raw is None:
+            raise StopAsyncIteration
+        return raw
+
+def test_cdp_page_collects_events():
+    # Test that CDP events are turned into console logs, JS errors and network entries
+    events = [
+        ('Network.requestWillBeSent', {'requestId': 'R1', 'timestamp': 10.0, 'type': 'Document',
+                                       'request': {'url': 'http://example.com/'}}),
+        ('Network.responseReceived', {'requestId': 'R1', 'response': {'status': 200, 'mimeType': 'text/html'}}),
+        ('Network.loadingFinished', {'requestId': 'R1', 'timestamp': 10.25, 'encodedDataLength': 512}),
+        ('Log.entryAdded', {'entry': {'level': 'error', 'text': 'Failed to load resource: net::ERR_FAILED',
+                                      'source': 'network', 'timestamp': 1234567890}}),
+        ('Runtime.exceptionThrown', {'timestamp': 1234567890, 'exceptionDetails': {
+            'text': 'Uncaught', 'url': 'http://example.com/app.js', 'lineNumber': 3, 'columnNumber': 7,
+            'exception': {'description': 'TypeError: x is not a function'}}}),
+        ('Page.loadEventFired', {'timestamp': 10.3}),
+    ]
+
+    async def scenario():
+        connection = CDPConnection(FakeWebSocket(events))
+        connection.start()
+        page = await CDPPage.open(connection)
+        await page.navigate('http://example.com/', timeout=1)
+        await connection.close()
+        return page
+
+    page = asyncio.run(scenario())
+    assert page.console_handler.error_categories == {'Network': 1, 'JavaScript': 1}
+    assert page.js_errors[0]['lineno'] == 3
+    request = page.network_requests['R1']
+    assert request['status'] == 200
+    assert request['initiatorType'] == 'document'
+    assert request['duration'] == pytest.approx(250.0)
+
+def test_cdp_connection_survives_listener_errors():
+    # Test that a failing event listener neither stops the reader nor leaves later commands hanging
+    seen = []
+
+    def listener(method, params):
+        seen.append(method)
+        raise KeyError('response')
+
+    async def scenario():
+        connection = CDPConnection(FakeWebSocket([('Network.responseReceived', {}), ('Page.loadEventFired', {})]))
+        connection.start()
+        connection.subscribe('S1', listener)
+        await connection.send('Page.navigate', session_id='S1', timeout=1)
+        assert await connection.send('Target.createTarget', timeout=1) == {'targetId': 'T1'}
+        await connection.close()
+        await asyncio.sleep(0)
+        with pytest.raises(RuntimeError, match="connection closed"):
+            await connection.send('Page.enable', timeout=5)
+
+    asyncio.run(scenario())
+    assert seen == ['Network.responseReceived', 'Page.loadEventFired']
+
+def test_delta_tracker_reports_changes_once():
+    # Test that errors are new once per fingerprint and regressions fire on transitions only
+    tracker = DeltaTracker(threshold=0.2, min_samples=3, max_fingerprints=2)
+    first = tracker.observe_error('http://example.com', {'level': 'SEVERE', 'message': 'Request 10001 failed'})
+    assert first['event'] == 'new_error' and first['category'] == ErrorCategory.OTHER
+    assert tracker.observe_error('http://example.com', {'level': 'SEVERE', 'message': 'Request 10002 failed'}) is None
+    tracker.observe_error('http://example.com', {'message': 'b'})
+    tracker.observe_error('http://example.com', {'message': 'c'})
+    assert len(tracker.seen) == 2
+
+    events = [tracker.observe_metrics('http://example.com', {'ttfb': ttfb, 'cls': 0.01})
+              for ttfb in (100, 100, 100, 400, 400, 100)]
+    assert events[:3] == [[], [], []]
+    assert events[3][0]['event'] == 'regression' and events[3][0]['metric'] == 'ttfb'
+    assert events[3][0]['baseline'] == 100
+    assert events[4] == []
+    assert events[5][0]['event'] == 'regression_cleared'
+
+def test_iter_watch_events_reuses_one_driver(mock_driver):
+    # Test that repeated visits only yield new errors and that one driver serves every cycle
+    logs = iter([[{'level': 'SEVERE', 'message': 'Uncaught TypeError: x is not a function', 'timestamp': 1}]] * 6)
+    mock_driver.get_log.side_effect = lambda kind: next(logs, [])
+    mock_driver.execute_cdp_cmd.return_value = {'identifier': '1'}
+
+    def execute_script(script, *args):
+        if script == JS_ERROR_DRAIN_SCRIPT:
+            return {'id': 'doc', 'total': 1, 'dropped': 0,
+                    'entries': [{'type': 'error', 'message': 'ReferenceError: y is not defined'}]}
+        if script == PERFORMANCE_METRICS_SCRIPT:
+            return {'navigation': {'ttfb': 100}, 'paint': None, 'vitals': None, 'long_tasks': None}
+    mock_driver.execute_script.side_effect = execute_script
+
+    factory = MagicMock(return_value=mock_driver)
+    events = list(iter_watch_events(['http://example.com'], interval=0, driver_factory=factory, cycles=3))
+    assert [(e['event'], e['source']) for e in events] == [('new_error', 'console'), ('new_error', 'javascript')]
+    assert factory.call_count == 1
+    assert mock_driver.get.call_count == 3
+    mock_driver.quit.assert_called_once()
+
+def test_replay_driver_round_trips_recordings(tmp_path, monkeypatch):
+    # Test that a recorded page replays through the full pipeline with identical results
+    from benchmarks.replay import ReplayDriver, RecordingDriver, synthetic_recordings, save_recordings, load_recordings
+    monkeypatch.chdir(tmp_path)
+    options = dict(enable_accessibility=True, enable_security=True, enable_storage=True, export_format='json')
+    recording = next(synthetic_recordings(1, 50, resources=10))
+    expected = json.loads(json.dumps(recording))
+
+    recorder = RecordingDriver(ReplayDriver({recording['url']: recording}))
+    first = analyze_page(recorder, recording['url'], **options)
+    recorded = recorder.finish()
+    save_recordings(str(tmp_path / 'pages.ndjson.gz'), [recorded])
+    replayed = next(load_recordings(str(tmp_path / 'pages.ndjson.gz')))
+    second = analyze_page(ReplayDriver({replayed['url']: replayed}), replayed['url'], **options)
+
+    assert first['console_handler'].total_count == second['console_handler'].total_count == 50
+    assert first['console_handler'].error_categories == second['console_handler'].error_categories
+    assert second['page_info']['network_requests'] == expected['resources']
+    assert len(second['page_info']['js_errors']) == len(expected['js_errors'])
+    assert second['advanced'].results['security']['headers']['X-Content-Type-Options'] == 'nosniff'
+    assert second['advanced'].results['storage']['localStorage'] == expected['local_storage']
+    assert second['page_info']['page_source_length'] == len(expected['page_source'])
+    assert second['advanced'].export_results(second['console_handler'].logs, second['page_info']).endswith('.json')
+
+def test_session_snapshot_is_encrypted_at_rest(mock_driver, tmp_path, monkeypatch):
+    # Test that a captured session round-trips through an owner-only encrypted file
+    pytest.importorskip('cryptography')
+    monkeypatch.setenv('AIDOC_SESSION_KEY', 'correct horse battery staple')
+    mock_driver.execute_cdp_cmd.return_value = {'cookies': [
+        {'name': 'sid', 'value': 'secret-token', 'domain': '.example.com', 'path': '/', 'expires': -1,
+         'size': 20, 'httpOnly': True, 'secure': True, 'session': True}]}
+    mock_driver.execute_script.return_value = {'origin': 'http://example.com',
+                                               'local': {'jwt': 'abc'}, 'session': {'tab': '1'}}
+    snapshot = capture_session(mock_driver)
+    assert snapshot['cookies'] == [{'name': 'sid', 'value': 'secret-token', 'domain': '.example.com', 'path': '/',
+                                    'secure': True, 'httpOnly': True}]
+
+    path = save_session(str(tmp_path / 'session.bin'), snapshot)
+    data = open(path, 'rb').read()
+    assert b'secret-token' not in data and b'jwt' not in data
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert load_session(path) == snapshot
+
+    monkeypatch.setenv('AIDOC_SESSION_KEY', 'wrong key')
+    with pytest.raises(RuntimeError):
+        load_session(path)
+
+def test_restore_session_and_ready_wait(mock_driver):
+    # Test that restoring drops expired cookies and that the ready wait polls until the condition holds
+    mock_driver._aidoc_early_scripts = {}
+    snapshot = {'url': 'http://example.com/app', 'cookies': [{'name': 'a', 'value': '1'},
+                                                          {'name': 'old', 'value': '2', 'expires': 1}],
+                'storage': {'http://example.com': {'local': {'jwt': 'abc'}, 'session': {}}}}
+    assert restore_session(mock_driver, snapshot) is True
+    mock_driver.execute_cdp_cmd.assert_any_call('Network.setCookies', {'cookies': [{'name': 'a', 'value': '1'}]})
+    assert '"jwt": "abc"' in mock_driver.execute_cdp_cmd.call_args_list[-1][0][1]['source']
+
+    # The page only becomes ready after the first poll, as when a human finishes logging in
+    polls = []
+    assert wait_until_ready(mock_driver, lambda driver: bool(polls), timeout=5, poll_interval=0.3,
+                            on_poll=lambda: polls.append(1))
+    assert polls == [1]
+    assert not wait_until_ready(mock_driver, lambda driver: False, timeout=0.3, poll_interval=0.3)
+
+def test_request_filter_blocks_domains_and_types(mock_driver):
+    # Test that domains cover subdomains, types fall back to extensions and blocked loads leave the console
+    request_filter = RequestFilter(domains=['doubleclick.net'], types=['image', 'font'])
+    assert request_filter.match('https://ad.doubleclick.net/pixel') == 'domain'
+    assert request_filter.match('https://notdoubleclick.net/app.js') is None
+    assert request_filter.match('https://example.com/logo.PNG?v=2') == 'type'
+    assert request_filter.match('https://example.com/api/avatar', 'Image') == 'type'
+    assert request_filter.match('https://example.com/app.js', 'Script') is None
+    with pytest.raises(ValueError):
+        RequestFilter(types=['script'])
+
+    assert apply_request_filter(mock_driver, request_filter)
+    assert apply_request_filter(mock_driver, request_filter)
+    blocked_calls = [c for c in mock_driver.execute_cdp_cmd.call_args_list if c[0][0] == 'Network.setBlockedURLs']
+    assert len(blocked_calls) == 1
+    assert '*://*.doubleclick.net/*' in blocked_calls[0][0][1]['urls']
+    assert '*.woff2' in blocked_calls[0][0][1]['urls']
+
+    log = {'level': 'SEVERE', 'source': 'network',
+           'message': 'https://example.com/hero.jpg - Failed to load resource: net::ERR_BLOCKED_BY_CLIENT'}
+    request = blocked_request_from_log(log, request_filter)
+    assert request == {'url': 'https://example.com/hero.jpg', 'type': 'image', 'domain': 'example.com', 'reason': 'type'}
+    assert blocked_request_from_log({'message': 'Failed to load resource: net::ERR_FAILED'}, request_filter) is None
+    summary = summarize_blocked_requests([request, dict(request, domain='ad.doubleclick.net', reason='domain')])
+    assert summary['count'] == 2
+    assert summary['by_type'] == {'image': 2}
+    assert summary['by_reason'] == {'type': 1, 'domain': 1}
+
+def test_cdp_page_blocks_and_serves_cached_assets():
+    # Test that paused requests are failed, stored and fulfilled from the cache shared across tabs
+    cache = ResponseCache(max_bytes=1024)
+
+    async def scenario():
+        pages, sent = [], []
+        for target in ('T1', 'T2'):
+            page = CDPPage(None, target, target, request_filter=RequestFilter(types=['font']), response_cache=cache)
+
+            async def send(method, params=None):
+                sent.append((method, params))
+                if method == 'Fetch.getResponseBody':
+                    return {'body': 'body { color: red }', 'base64Encoded': False}
+                return {}
+            page.send = send
+            pages.append(page)
+
+        css = {'url': 'http://example.com/site.css', 'method': 'GET'}
+        await pages[0].handle_paused_request({'requestId': 'R1', 'request': css, 'resourceType': 'Stylesheet'})
+        await pages[0].handle_paused_request({
+            'requestId': 'R1', 'request': css, 'resourceType': 'Stylesheet', 'responseStatusCode': 200,
+            'responseHeaders': [{'name': 'Content-Type', 'value': 'text/css'},
+                                {'name': 'Content-Encoding', 'value': 'gzip'}]})
+        await pages[0].handle_paused_request({'requestId': 'R2', 'resourceType': 'Font',
+                                              'request': {'url': 'http://example.com/a.woff2', 'method': 'GET'}})
+        await pages[1].handle_paused_request({'requestId': 'R3', 'request': css, 'resourceType': 'Stylesheet'})
+        return pages, sent
+
+    pages, sent = asyncio.run(scenario())
+    assert [method for method, _ in sent] == ['Fetch.continueRequest', 'Fetch.getResponseBody', 'Fetch.continueRequest',
+                                              'Fetch.failRequest', 'Fetch.fulfillRequest']
+    assert pages[0].blocked_requests[0]['type'] == 'font'
+    fulfilled = sent[-1][1]
+    assert base64.b64decode(fulfilled['body']) == b'body { color: red }'
+    assert fulfilled['responseHeaders'] == [{'name': 'Content-Type', 'value': 'text/css'}]
+    assert pages[1].cache_hits == 1 and cache.hits == 1
+
+    # The limit counts decoded bytes, whether the body arrived base64-encoded or not
+    cache = ResponseCache(max_bytes=10)
+    assert cache.put('http://example.com/a', [], base64.b64encode(b'12345').decode('ascii'))
+    assert cache.put('http://example.com/b', [], '67890', base64_encoded=False)
+    assert cache.size == 10 and cache.get('http://example.com/a')['size'] == 5
+    assert cache.put('http://example.com/c', [], base64.b64encode(b'x').decode('ascii'))
+    assert cache.get('http://example.com/b') is None and cache.size == 6
+
+def test_cli_help_skips_heavy_imports():
+    # `aidoc --help` must not load the browser, HTTP or numeric stacks
+    import subprocess
+    import sys
+    code = "import sys; sys.argv = ['aidoc', '--help']; from aidoc.AiDoc import main; main()"
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert proc.returncode == 0
+    modules = {line.rsplit('|', 1)[-1].strip().split('.')[0]
+               for line in proc.stderr.splitlines() if line.startswith('import time:')}
+    assert 'aidoc' in modules
+    assert not modules & {'selenium', 'axe_selenium_python', 'requests', 'psutil', 'numpy', 'asyncio'}
+
 if __name__ == '__main__':
     pytest.main([__file__])